@@ -1,76 +1,172 @@
+import asyncio
+import contextvars
 import openai
 import json
-from typing import Dict, List, Optional
+from concurrent.futures import ThreadPoolExecutor
+from typing import AsyncIterator, Dict, Iterator, List, Optional
 
-from llms import BaseLLM
+from llm_metrics import agent_context
+from llm_policy import LLMUnavailableError
+from llms import AsyncTokenStream, BaseLLM, TokenStream, estimate_tokens
+from semantic_index import SemanticCluster
+
+# Instructions are placed before per-call data throughout, so every prompt for a
+# task starts with the same bytes and providers can serve that prefix from their
+# prompt cache.
+_ANALYSIS_FORMAT = """Please structure your analysis as follows:
+        1. Main Issues Identified (ordered by frequency)
+        2. User Sentiment Analysis
+        3. Context and Contributing Factors
+        4. Notable Quotes or Examples"""
 
 
 class BaseAgent:
-    def __init__(self, api_key: str, llm: BaseLLM):
+    def __init__(self, api_key: str, llm: BaseLLM, use_cache: bool = True):
         self.conversation_history: List[Dict] = []
         self.llm = llm
+        # Set to False to always hit the backend, even when the llm has a cache
+        self.use_cache = use_cache
+
+    def _format_message(self, role: str, content: str) -> Dict[str, str]:
+        return {"role": role, "content": content}
+
+    def _llm_for(self, task: Optional[str]) -> BaseLLM:
+        """The backend for one agent method; a ModelRouter may pick a different model."""
+        return self.llm.for_task(f"{type(self).__name__}.{task}") if task else self.llm
+
+    def _call_llm(self, messages: List[Dict], task: Optional[str] = None) -> str:
+        try:
+            with agent_context(type(self).__name__, task):
+                return self._llm_for(task).complete(messages, use_cache=self.use_cache)
+        except LLMUnavailableError:
+            # Retries and fallbacks are exhausted: fail loudly, not with an empty answer
+            raise
+        except Exception as e:
+            print(f"Error calling LLM: {e}")
+            return ""
 
-    def _call_llm(self, messages: List[Dict]) -> str:
+    async def _acall_llm(self, messages: List[Dict], task: Optional[str] = None) -> str:
         try:
-            return self.llm._call_llm(messages)
+            with agent_context(type(self).__name__, task):
+                return await self._llm_for(task).acomplete(messages, use_cache=self.use_cache)
+        except LLMUnavailableError:
+            raise
         except Exception as e:
             print(f"Error calling LLM: {e}")
             return ""
 
+    def _stream_llm(self, messages: List[Dict], task: Optional[str] = None) -> TokenStream:
+        # Created here so the call is attributed to this agent, not the consumer
+        with agent_context(type(self).__name__, task):
+            stream = self._llm_for(task).stream(messages, use_cache=self.use_cache)
+
+        def deltas() -> Iterator[str]:
+            try:
+                yield from stream
+            except LLMUnavailableError:
+                raise
+            except Exception as e:
+                print(f"Error calling LLM: {e}")
+
+        return TokenStream(deltas())
+
+    def _astream_llm(self, messages: List[Dict], task: Optional[str] = None) -> AsyncTokenStream:
+        with agent_context(type(self).__name__, task):
+            stream = self._llm_for(task).astream(messages, use_cache=self.use_cache)
+
+        async def deltas() -> AsyncIterator[str]:
+            try:
+                async for delta in stream:
+                    yield delta
+            except LLMUnavailableError:
+                raise
+            except Exception as e:
+                print(f"Error calling LLM: {e}")
+
+        return AsyncTokenStream(deltas())
+
 
 class ResearchAgent(BaseAgent):
-    def __init__(self, api_key: str, llm: BaseLLM):
-        super().__init__(api_key)
+    def __init__(self, api_key: str, llm: BaseLLM, use_cache: bool = True):
+        super().__init__(api_key, llm, use_cache)
         self.system_prompt = """You are a research agent. Your role is to gather and provide 
         relevant information about a given topic. Focus on finding key facts and data points. 
         Be concise and accurate."""
 
-    def research(self, query: str) -> str:
-        messages = [
+    def _research_messages(self, query: str) -> List[Dict]:
+        return [
             self._format_message("system", self.system_prompt),
             self._format_message("user", query)
         ]
-        return self._call_llm(messages)
+
+    def research(self, query: str) -> str:
+        return self._call_llm(self._research_messages(query), "research")
+
+    async def aresearch(self, query: str) -> str:
+        return await self._acall_llm(self._research_messages(query), "research")
 
 
 class AnalystAgent(BaseAgent):
-    def __init__(self, api_key: str, llm: BaseLLM):
-        super().__init__(api_key)
+    def __init__(self, api_key: str, llm: BaseLLM, use_cache: bool = True):
+        super().__init__(api_key, llm, use_cache)
         self.system_prompt = """You are an analysis agent. Your role is to analyze information 
         and identify patterns, insights, and conclusions. Be logical and thorough in your analysis."""
 
-    def analyze(self, data: str) -> str:
-        messages = [
+    def _analyze_messages(self, data: str) -> List[Dict]:
+        return [
             self._format_message("system", self.system_prompt),
             self._format_message(
                 "user", f"Analyze the following information: {data}")
         ]
-        return self._call_llm(messages)
+
+    def analyze(self, data: str) -> str:
+        return self._call_llm(self._analyze_messages(data), "analyze")
+
+    async def aanalyze(self, data: str) -> str:
+        return await self._acall_llm(self._analyze_messages(data), "analyze")
 
 
 class WriterAgent(BaseAgent):
-    def __init__(self, api_key: str, llm: BaseLLM):
-        super().__init__(api_key, llm)
+    def __init__(self, api_key: str, llm: BaseLLM, use_cache: bool = True):
+        super().__init__(api_key, llm, use_cache)
         self.system_prompt = """You are a writer agent. Your role is to create well-structured, 
         engaging content based on provided information and analysis. Focus on clarity and coherence."""
 
-    def write(self, research: str, analysis: str) -> str:
+    def _write_messages(self, research: str, analysis: str) -> List[Dict]:
         prompt = f"""Based on the following research and analysis, create a well-structured report:
         
         Research: {research}
         
         Analysis: {analysis}"""
 
-        messages = [
+        return [
             self._format_message("system", self.system_prompt),
             self._format_message("user", prompt)
         ]
-        return self._call_llm(messages)
+
+    def write(self, research: str, analysis: str) -> str:
+        return self._call_llm(self._write_messages(research, analysis), "write")
+
+    async def awrite(self, research: str, analysis: str) -> str:
+        return await self._acall_llm(self._write_messages(research, analysis), "write")
+
+    def write_stream(self, research: str, analysis: str) -> TokenStream:
+        """Stream the report as it is generated"""
+        return self._stream_llm(self._write_messages(research, analysis), "write")
+
+    def awrite_stream(self, research: str, analysis: str) -> AsyncTokenStream:
+        """Async variant of write_stream"""
+        return self._astream_llm(self._write_messages(research, analysis), "write")
 
 
 class RedditAnalyzerAgent(BaseAgent):
-    def __init__(self, api_key: str):
-        super().__init__(api_key)
+    def __init__(self,
+                 api_key: str,
+                 llm: BaseLLM,
+                 use_cache: bool = True,
+                 chunk_tokens: int = 8000,
+                 max_parallel_chunks: int = 8):
+        super().__init__(api_key, llm, use_cache)
         self.system_prompt = """You are a specialized agent for analyzing Reddit comments. 
         Your role is to:
         1. Identify common complaints, problems, and pain points
@@ -78,43 +174,206 @@ class RedditAnalyzerAgent(BaseAgent):
         3. Determine the frequency and severity of each problem
         4. Extract any relevant context or user sentiment
         Be thorough in your analysis and format the output as a structured summary."""
+        # Comment text budget per prompt; larger inputs are analyzed map-reduce style
+        self.chunk_tokens = chunk_tokens
+        self.max_parallel_chunks = max_parallel_chunks
 
-    def analyze_comments(self, comments: List[str]) -> str:
+    def _analyze_comments_messages(self,
+                                   comments: List[str],
+                                   start: int = 1,
+                                   counts: Optional[List[int]] = None) -> List[Dict]:
         # Format comments for analysis
-        formatted_comments = "\n".join(
-            [f"Comment {i+1}: {comment}" for i, comment in enumerate(comments)])
+        formatted_comments = "\n".join([
+            f"Comment {i}{self._format_count(counts[i - start]) if counts else ''}: {comment}"
+            for i, comment in enumerate(comments, start)
+        ])
+        frequency_hint = """A count after a comment number means that many near-identical comments were posted; 
+        weigh issues by these counts when judging frequency.
+
+        """ if counts else ""
 
         prompt = f"""Analyze the following Reddit comments and identify common complaints, 
-        problems, and user pain points. Group similar issues together and note their frequency:
+        problems, and user pain points. Group similar issues together and note their frequency.
 
-        {formatted_comments}
+        {_ANALYSIS_FORMAT}
 
-        Please structure your analysis as follows:
-        1. Main Issues Identified (ordered by frequency)
-        2. User Sentiment Analysis
-        3. Context and Contributing Factors
-        4. Notable Quotes or Examples"""
+        {frequency_hint}Comments:
+{formatted_comments}"""
 
-        messages = [
+        return [
             self._format_message("system", self.system_prompt),
             self._format_message("user", prompt)
         ]
-        return self._call_llm(messages)
 
-    def summarize_findings(self, analysis: str) -> str:
-        prompt = """Based on the analysis, provide a concise summary of the top 3-5 most 
+    def _format_count(self, count: int) -> str:
+        return f" (x{count})" if count > 1 else ""
+
+    def _chunk_messages(self,
+                        comments: List[str],
+                        counts: Optional[List[int]],
+                        chunk: List[int]) -> List[Dict]:
+        return self._analyze_comments_messages(
+            [comments[i] for i in chunk],
+            chunk[0] + 1,
+            [counts[i] for i in chunk] if counts else None
+        )
+
+    def _merge_analyses_messages(self, analyses: List[str], total_comments: int) -> List[Dict]:
+        formatted_analyses = "\n\n".join(
+            [f"Partial Analysis {i+1}:\n{analysis}" for i, analysis in enumerate(analyses)])
+
+        prompt = f"""The following are partial analyses of Reddit comments that were analyzed 
+        in separate batches. Merge them into a single analysis: combine issues that describe the 
+        same problem, add up their frequencies, and keep the most telling quotes.
+
+        {_ANALYSIS_FORMAT}
+
+        Total comments analyzed: {total_comments}
+
+{formatted_analyses}"""
+
+        return [
+            self._format_message("system", self.system_prompt),
+            self._format_message("user", prompt)
+        ]
+
+    def _split_by_budget(self, texts: List[str]) -> List[List[int]]:
+        """Group consecutive text indices so each group fits within chunk_tokens."""
+        model = getattr(self.llm.model, "value", None)
+        groups: List[List[int]] = []
+        current: List[int] = []
+        used = 0
+        for i, text in enumerate(texts):
+            tokens = estimate_tokens(text, model)
+            if current and used + tokens > self.chunk_tokens:
+                groups.append(current)
+                current, used = [], 0
+            current.append(i)
+            used += tokens
+        if current:
+            groups.append(current)
+        return groups
+
+    def analyze_comments(self, comments: List[str], counts: Optional[List[int]] = None) -> str:
+        """
+        Analyze comments in one prompt, or map-reduce style when they exceed
+        chunk_tokens: chunks are analyzed in parallel and the partial analyses
+        merged until a single analysis remains. counts, if given, holds how many
+        near-duplicate comments each entry stands for.
+        """
+        total_comments = sum(counts) if counts else len(comments)
+        chunks = self._split_by_budget(comments)
+        if len(chunks) <= 1:
+            return self._call_llm(
+                self._analyze_comments_messages(comments, 1, counts), "analyze_comments")
+
+        with ThreadPoolExecutor(max_workers=self.max_parallel_chunks) as executor:
+            analyses = self._map_calls(executor, [
+                self._chunk_messages(comments, counts, chunk) for chunk in chunks
+            ])
+            while len(analyses) > 1:
+                groups = self._split_by_budget(analyses)
+                if len(groups) == len(analyses):  # each partial fills the budget alone
+                    groups = [list(range(len(analyses)))]
+                analyses = self._map_calls(executor, [
+                    self._merge_analyses_messages([analyses[i] for i in group], total_comments)
+                    for group in groups
+                ])
+        return analyses[0]
+
+    def _map_calls(self, executor: ThreadPoolExecutor, prompts: List[List[Dict]]) -> List[str]:
+        """Run _call_llm for each prompt on executor, in the caller's context."""
+        futures = [executor.submit(contextvars.copy_context().run,
+                                   self._call_llm, messages, "analyze_comments")
+                   for messages in prompts]
+        return [future.result() for future in futures]
+
+    async def aanalyze_comments(self,
+                                comments: List[str],
+                                counts: Optional[List[int]] = None) -> str:
+        """Async variant of analyze_comments"""
+        total_comments = sum(counts) if counts else len(comments)
+        chunks = self._split_by_budget(comments)
+        if len(chunks) <= 1:
+            return await self._acall_llm(
+                self._analyze_comments_messages(comments, 1, counts), "analyze_comments")
+
+        semaphore = asyncio.Semaphore(self.max_parallel_chunks)
+
+        async def bounded(messages: List[Dict]) -> str:
+            async with semaphore:
+                return await self._acall_llm(messages, "analyze_comments")
+
+        analyses = list(await asyncio.gather(*[
+            bounded(self._chunk_messages(comments, counts, chunk))
+            for chunk in chunks
+        ]))
+        while len(analyses) > 1:
+            groups = self._split_by_budget(analyses)
+            if len(groups) == len(analyses):  # each partial fills the budget alone
+                groups = [list(range(len(analyses)))]
+            analyses = list(await asyncio.gather(*[
+                bounded(self._merge_analyses_messages(
+                    [analyses[i] for i in group], total_comments))
+                for group in groups
+            ]))
+        return analyses[0]
+
+    def _analyze_clusters_messages(self, clusters: List[SemanticCluster]) -> List[Dict]:
+        total_comments = sum(cluster.size for cluster in clusters)
+        formatted_clusters = "\n\n".join([
+            f"Cluster {i} ({cluster.size} comments, key terms: {', '.join(cluster.keywords)}):\n"
+            + "\n".join(f"- {exemplar}" for exemplar in cluster.exemplars)
+            for i, cluster in enumerate(clusters, 1)
+        ])
+
+        prompt = f"""The following Reddit comments were grouped into clusters of similar 
+        comments. Each cluster lists how many comments it contains, its most distinctive terms 
+        and the comments closest to its center. Identify the complaints, problems and pain points 
+        each cluster represents, merge clusters that describe the same problem, and use the 
+        cluster sizes as frequencies.
+
+        {_ANALYSIS_FORMAT}
+
+        Total comments: {total_comments}
+
+{formatted_clusters}"""
+
+        return [
+            self._format_message("system", self.system_prompt),
+            self._format_message("user", prompt)
+        ]
+
+    def analyze_clusters(self, clusters: List[SemanticCluster]) -> str:
+        """
+        Analyze comments from their semantic clusters (sizes, key terms and
+        exemplars) in a single prompt whose size does not grow with the comments.
+        """
+        return self._call_llm(self._analyze_clusters_messages(clusters), "analyze_comments")
+
+    async def aanalyze_clusters(self, clusters: List[SemanticCluster]) -> str:
+        return await self._acall_llm(self._analyze_clusters_messages(clusters), "analyze_comments")
+
+    def _summarize_findings_messages(self, analysis: str) -> List[Dict]:
+        prompt = """Based on the analysis below, provide a concise summary of the top 3-5 most 
         significant problems users are facing, including any patterns in user behavior or sentiment."""
 
-        messages = [
+        return [
             self._format_message("system", self.system_prompt),
-            self._format_message("user", f"{analysis}\n\n{prompt}")
+            self._format_message("user", f"{prompt}\n\nAnalysis:\n{analysis}")
         ]
-        return self._call_llm(messages)
+
+    def summarize_findings(self, analysis: str) -> str:
+        return self._call_llm(self._summarize_findings_messages(analysis), "summarize_findings")
+
+    async def asummarize_findings(self, analysis: str) -> str:
+        return await self._acall_llm(
+            self._summarize_findings_messages(analysis), "summarize_findings")
 
 
 class SubredditDiscoveryAgent(BaseAgent):
-    def __init__(self, api_key: str, llm: BaseLLM):
-        super().__init__(api_key, llm)
+    def __init__(self, api_key: str, llm: BaseLLM, use_cache: bool = True):
+        super().__init__(api_key, llm, use_cache)
         self.system_prompt = """You are a specialized agent for discovering and analyzing relevant subreddits.
         Your role is to:
         1. Analyze subreddit descriptions and determine relevance to the user's interests
@@ -123,7 +382,7 @@ class SubredditDiscoveryAgent(BaseAgent):
         4. Filter out inappropriate or off-topic communities
         Be thorough in your analysis and focus on finding the most relevant communities."""
 
-    def analyze_subreddits(self, query: str, subreddits: List[Dict]) -> str:
+    def _analyze_subreddits_messages(self, query: str, subreddits: List[Dict]) -> List[Dict]:
         formatted_subreddits = "\n".join([
             f"r/{sub['name']}: {sub['title']}\n"
             f"Description: {sub['description']}\n"
@@ -131,30 +390,53 @@ class SubredditDiscoveryAgent(BaseAgent):
             for sub in subreddits
         ])
         
-        prompt = f"""Based on the user's interest in '{query}', analyze these subreddits and rank them by relevance:
-
-        {formatted_subreddits}
+        prompt = f"""Based on the user's interest below, analyze these subreddits and rank them by relevance.
 
         Please structure your analysis as follows:
         1. Most Relevant Communities (ordered by relevance)
         2. Why These Communities Are Relevant
         3. Additional Recommendations
-        4. Communities to Avoid (if any)"""
+        4. Communities to Avoid (if any)
+
+        User interest: {query}
+
+{formatted_subreddits}"""
 
-        messages = [
+        return [
             self._format_message("system", self.system_prompt),
             self._format_message("user", prompt)
         ]
-        return self._call_llm(messages)
 
-    def suggest_search_terms(self, topic: str) -> List[str]:
-        """Generate relevant search terms for finding subreddits"""
-        prompt = f"""Given the topic '{topic}', suggest 5-7 relevant search terms that would help find related subreddits.
-        Consider different aspects and variations of the topic. Return only the search terms, one per line."""
+    def analyze_subreddits(self, query: str, subreddits: List[Dict]) -> str:
+        return self._call_llm(
+            self._analyze_subreddits_messages(query, subreddits), "analyze_subreddits")
+
+    async def aanalyze_subreddits(self, query: str, subreddits: List[Dict]) -> str:
+        return await self._acall_llm(
+            self._analyze_subreddits_messages(query, subreddits), "analyze_subreddits")
+
+    def _suggest_search_terms_messages(self, topic: str) -> List[Dict]:
+        prompt = f"""Suggest 5-7 relevant search terms that would help find subreddits related to the topic below.
+        Consider different aspects and variations of the topic. Return only the search terms, one per line.
+
+        Topic: {topic}"""
         
-        messages = [
+        return [
             self._format_message("system", self.system_prompt),
             self._format_message("user", prompt)
         ]
-        response = self._call_llm(messages)
-        return [term.strip() for term in response.split('\n') if term.strip()]
\ No newline at end of file
+
+    def _parse_search_terms(self, response: str) -> List[str]:
+        return [term.strip() for term in response.split('\n') if term.strip()]
+
+    def suggest_search_terms(self, topic: str) -> List[str]:
+        """Generate relevant search terms for finding subreddits"""
+        response = self._call_llm(
+            self._suggest_search_terms_messages(topic), "suggest_search_terms")
+        return self._parse_search_terms(response)
+
+    async def asuggest_search_terms(self, topic: str) -> List[str]:
+        """Async variant of suggest_search_terms"""
+        response = await self._acall_llm(
+            self._suggest_search_terms_messages(topic), "suggest_search_terms")
+        return self._parse_search_terms(response)
@@ -0,0 +1,160 @@
+import asyncio
+import os
+import re
+import threading
+from typing import Dict, List
+
+from agents import RedditAnalyzerAgent, SubredditDiscoveryAgent
+from llms import BaseLLM, OpenAIModel, estimate_tokens
+from semantic_index import SemanticCluster
+
+
+class FakeLLM(BaseLLM):
+    def __init__(self) -> None:
+        super().__init__("fake_key", OpenAIModel.GPT_4_O)
+
+
+def shared_prefix(first: List[Dict], second: List[Dict]) -> str:
+    a = "".join(m["role"] + m["content"] for m in first)
+    b = "".join(m["role"] + m["content"] for m in second)
+    return os.path.commonprefix([a, b])
+
+
+def assert_data_comes_last(first: List[Dict], second: List[Dict], fixed: str) -> None:
+    """Prompts for different inputs must share every fixed instruction as a prefix."""
+    prefix = shared_prefix(first, second)
+    assert fixed in prefix
+    assert first[0] == second[0]
+
+
+def test_analyzer_prompts_keep_instructions_before_data():
+    agent = RedditAnalyzerAgent("k", FakeLLM())
+    assert_data_comes_last(
+        agent._analyze_comments_messages(["battery drains fast"]),
+        agent._analyze_comments_messages(["app crashes on launch"]),
+        "4. Notable Quotes or Examples")
+    assert_data_comes_last(
+        agent._merge_analyses_messages(["a"], 10),
+        agent._merge_analyses_messages(["b"], 20),
+        "4. Notable Quotes or Examples")
+    assert_data_comes_last(
+        agent._analyze_clusters_messages([SemanticCluster(3, ["battery"], ["drains"])]),
+        agent._analyze_clusters_messages([SemanticCluster(5, ["crash"], ["crashes"])]),
+        "4. Notable Quotes or Examples")
+    assert_data_comes_last(
+        agent._summarize_findings_messages("analysis one"),
+        agent._summarize_findings_messages("analysis two"),
+        "patterns in user behavior or sentiment.")
+
+
+def test_discovery_prompts_keep_instructions_before_data():
+    agent = SubredditDiscoveryAgent("k", FakeLLM())
+    sub = {"name": "deals", "title": "Deals", "description": "Bargains", "subscribers": 10}
+    assert_data_comes_last(
+        agent._analyze_subreddits_messages("coupons", [sub]),
+        agent._analyze_subreddits_messages("flights", [sub]),
+        "4. Communities to Avoid (if any)")
+    assert_data_comes_last(
+        agent._suggest_search_terms_messages("coupons"),
+        agent._suggest_search_terms_messages("flights"),
+        "one per line.")
+
+
+class StubLLM(BaseLLM):
+    """Answers chunk prompts with the comment numbers it saw, merge prompts with their inputs."""
+
+    def __init__(self, padding: int = 0) -> None:
+        super().__init__("fake_key", OpenAIModel.GPT_4_O)
+        self.padding = padding
+        self.prompts: List[str] = []
+        self._lock = threading.Lock()
+
+    def _answer(self, messages: List[Dict[str, str]]) -> str:
+        prompt = messages[-1]["content"]
+        with self._lock:
+            self.prompts.append(prompt)
+        if "partial analyses" in prompt:
+            parts = re.findall(r"Partial Analysis \d+:\n(\S+)", prompt)
+            answer = "+".join(part.split("|")[0] for part in parts)
+        else:
+            answer = ",".join(re.findall(r"^Comment (\d+)", prompt, re.M))
+        return answer + "|" + "pad " * self.padding
+
+    def _call_llm(self, messages: List[Dict[str, str]]) -> str:
+        return self._answer(messages)
+
+    async def _acall_llm(self, messages: List[Dict[str, str]]) -> str:
+        return self._answer(messages)
+
+
+def chunk_prompts(llm: StubLLM) -> List[str]:
+    return [prompt for prompt in llm.prompts if "partial analyses" not in prompt]
+
+
+def comment_numbers(prompt: str) -> List[int]:
+    return [int(n) for n in re.findall(r"^Comment (\d+)", prompt, re.M)]
+
+
+COMMENTS = [f"comment number {i} says the battery drains overnight" for i in range(40)]
+
+
+def test_split_by_budget_keeps_chunks_within_budget():
+    agent = RedditAnalyzerAgent("k", StubLLM(), chunk_tokens=50)
+    oversized = "word " * 200
+    texts = COMMENTS[:10] + [oversized] + COMMENTS[10:20]
+
+    groups = agent._split_by_budget(texts)
+
+    assert [i for group in groups for i in group] == list(range(len(texts)))
+    for group in groups:
+        tokens = sum(estimate_tokens(texts[i], "gpt-4o") for i in group)
+        assert tokens <= 50 or group == [10]
+    # The oversized comment gets a chunk of its own rather than being dropped
+    assert [10] in groups
+
+
+def test_chunks_number_comments_globally():
+    llm = StubLLM()
+    agent = RedditAnalyzerAgent("k", llm, chunk_tokens=60)
+
+    result = agent.analyze_comments(COMMENTS, counts=[2] * len(COMMENTS))
+
+    prompts = chunk_prompts(llm)
+    assert len(prompts) > 1
+    assert [n for prompt in prompts for n in comment_numbers(prompt)] == list(range(1, 41))
+    assert "Comment 1 (x2): comment number 0 says" in prompts[0]
+    # Every comment number survives the reduce in order
+    assert result.split("|")[0].replace("+", ",").split(",") == [str(n) for n in range(1, 41)]
+    assert all("Total comments analyzed: 80" in prompt
+               for prompt in llm.prompts if "partial analyses" in prompt)
+
+
+def test_reduce_terminates_when_partials_exceed_the_budget():
+    # Every answer alone is larger than the budget, so partials cannot be grouped
+    llm = StubLLM(padding=200)
+    agent = RedditAnalyzerAgent("k", llm, chunk_tokens=60)
+
+    result = agent.analyze_comments(COMMENTS)
+
+    merges = [prompt for prompt in llm.prompts if "partial analyses" in prompt]
+    assert len(merges) == 1
+    assert len(re.findall(r"Partial Analysis \d+:", merges[0])) == len(chunk_prompts(llm))
+    assert result.startswith("1,2,")
+
+
+def test_sync_and_async_map_reduce_agree():
+    sync_llm, async_llm = StubLLM(), StubLLM()
+    sync_agent = RedditAnalyzerAgent("k", sync_llm, chunk_tokens=60, max_parallel_chunks=3)
+    async_agent = RedditAnalyzerAgent("k", async_llm, chunk_tokens=60, max_parallel_chunks=3)
+
+    expected = sync_agent.analyze_comments(COMMENTS)
+    assert asyncio.run(async_agent.aanalyze_comments(COMMENTS)) == expected
+    assert sorted(sync_llm.prompts) == sorted(async_llm.prompts)
+
+
+def test_small_inputs_use_a_single_prompt():
+    llm = StubLLM()
+    agent = RedditAnalyzerAgent("k", llm, chunk_tokens=8000)
+
+    assert agent.analyze_comments(COMMENTS[:3]) == "1,2,3|"
+    assert len(llm.prompts) == 1
@@ -0,0 +1,424 @@
+"""
+Offline benchmark for AgentCoordinator.analyze_reddit_complaints.
+
+Recorded Reddit responses are replayed through the real RedditScraper (by
+cassette.CassetteRequestor) and LLM completions from a fixture, both with
+injected latency, so runs need no credentials and are repeatable. Reports
+wall-clock time, per-step latency percentiles, peak Python memory and token
+counts, and can fail when a run regresses against a saved baseline:
+
+    python benchmark.py --runs 5 --output baseline.json
+    python benchmark.py --runs 5 --baseline baseline.json --tolerance 0.2
+"""
+import argparse
+import asyncio
+import json
+import math
+import random
+import sys
+import time
+import tracemalloc
+from dataclasses import asdict
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional, Sequence, Tuple
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import BaseAdapter
+from requests.structures import CaseInsensitiveDict
+
+from cassette import RECORD, REPLAY, Cassette, CassetteRequestor
+from coordinator import AgentCoordinator
+from llm_cache import make_cache_key
+from llms import BaseLLM, OpenAIModel, estimate_tokens
+from rate_limiter import RequestScheduler
+from reddit_utils import RedditScraper
+from records import Comment
+
+_USER_AGENT = "RedditAnalyzerBot/1.0 benchmark"
+
+_COMPLAINTS = [
+    "the app crashes every time I open the settings page after the latest update",
+    "battery drains overnight even with background refresh turned off",
+    "customer support closed my ticket without answering the actual question",
+    "sync between my phone and laptop silently fails and I lose my notes",
+    "the new subscription price doubled and they removed the offline mode",
+    "login loops back to the start screen when two factor authentication is on",
+    "search results are slow and miss items I know are there",
+    "dark mode makes half of the text unreadable in the editor",
+]
+_OPENERS = ["Honestly", "Same here,", "For what it's worth", "Ugh,", "Not sure if related but",
+            "Can confirm,", "This is so frustrating:", "Day three of this and"]
+_CLOSERS = ["Anyone found a fix?", "I'm on the latest version.", "Really considering switching.",
+            "Reinstalling did not help.", "It used to work fine last month.", ""]
+
+
+def synthetic_fixture(num_comments: int = 400,
+                      subreddit: str = "techsupport",
+                      comments_per_submission: int = 40,
+                      seed: int = 0) -> Dict[str, Any]:
+    """
+    A deterministic stand-in for a recorded fixture: complaint-style comments
+    with near-duplicates, bot posts and short replies mixed in, like real threads,
+    recorded as the Reddit responses a scrape of them gets.
+    """
+    rng = random.Random(seed)
+    # The scraper reads the top 25 submissions, so every comment must fit in them
+    comments_per_submission = max(comments_per_submission, math.ceil(num_comments / 25))
+    comments = []
+    for i in range(num_comments):
+        kind = rng.random()
+        if kind < 0.05:
+            author, body = "AutoModerator", "I am a bot, and this action was performed automatically."
+        elif kind < 0.12:
+            author, body = f"user{rng.randrange(500)}", rng.choice(["this", "+1", "same", "lol"])
+        else:
+            author = f"user{rng.randrange(500)}"
+            body = " ".join(filter(None, [rng.choice(_OPENERS), rng.choice(_COMPLAINTS),
+                                          rng.choice(_CLOSERS)]))
+        comments.append(asdict(Comment(
+            id=f"c{i}", submission_id=f"s{i // comments_per_submission}", subreddit=subreddit,
+            body=body, author=author, score=rng.randrange(-5, 200),
+            created_utc=1_700_000_000.0 + i * 60
+        )))
+    return {
+        "subreddit": subreddit,
+        "search_query": None,
+        "comments": comments,
+        "reddit": _record_reddit(subreddit, None, len(comments),
+                                 requestor_kwargs={"session": _synthetic_session(comments)},
+                                 scheduler=RequestScheduler(burst=10_000))[1],
+        "completions": {},
+        "latency": {
+            # Seconds; median and log-normal spread per request
+            "reddit": {"median": 0.25, "sigma": 0.3},
+            "llm": {"median": 0.6, "sigma": 0.4, "tokens_per_second": 80.0},
+            "completion_tokens": 300,
+        },
+    }
+
+
+def load_fixture(path: str) -> Dict[str, Any]:
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_fixture(fixture: Dict[str, Any], path: str) -> None:
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(fixture, f)
+
+
+def _record_reddit(subreddit: str,
+                   search_query: Optional[str],
+                   limit: int,
+                   client_id: str = "-",
+                   client_secret: str = "-",
+                   **scraper_kwargs: Any) -> Tuple[List[Comment], List[Dict[str, Any]]]:
+    """Scrape through a recording cassette: the comments and the Reddit interactions."""
+    cassette = Cassette(None, RECORD)
+    options = cassette.reddit_options()
+    options["requestor_kwargs"].update(scraper_kwargs.pop("requestor_kwargs", {}))
+    scraper = RedditScraper(client_id, client_secret, _USER_AGENT, **options, **scraper_kwargs)
+    if search_query:
+        records = scraper.iter_search_subreddit_comments(subreddit, search_query, limit)
+    else:
+        records = scraper.iter_subreddit_comments(subreddit, limit=limit)
+    comments = list(records)
+    return comments, cassette.interactions
+
+
+def record_fixture(client_id: str,
+                   client_secret: str,
+                   subreddit: str,
+                   search_query: Optional[str] = None,
+                   limit: int = 100,
+                   completions: Optional[Dict[str, str]] = None) -> Dict[str, Any]:
+    """
+    Record a live scrape (and optionally completions keyed by llm_cache.make_cache_key)
+    into the fixture format, keeping the synthetic latency model.
+    """
+    fixture = synthetic_fixture(0, subreddit)
+    comments, interactions = _record_reddit(subreddit, search_query, limit,
+                                            client_id, client_secret)
+    fixture["search_query"] = search_query
+    fixture["comments"] = [asdict(comment) for comment in comments]
+    fixture["reddit"] = interactions
+    fixture["completions"] = {key: {"text": text} for key, text in (completions or {}).items()}
+    return fixture
+
+
+def _listing(children: List[Dict[str, Any]]) -> Dict[str, Any]:
+    return {"kind": "Listing", "data": {"children": children, "after": None}}
+
+
+class _SyntheticReddit(BaseAdapter):
+    """Answers Reddit API requests from fixture comments, so they can be recorded."""
+
+    def __init__(self, comments: Sequence[Dict[str, Any]]) -> None:
+        super().__init__()
+        self.threads: Dict[str, List[Dict[str, Any]]] = {}
+        for comment in comments:
+            self.threads.setdefault(comment["submission_id"], []).append(comment)
+
+    def _submission(self, submission_id: str) -> Dict[str, Any]:
+        first = self.threads[submission_id][0]
+        return {"kind": "t3", "data": {
+            "id": submission_id, "name": f"t3_{submission_id}", "title": f"Thread {submission_id}",
+            "author": first["author"], "score": first["score"], "selftext": "", "url": "",
+            "subreddit": first["subreddit"], "created_utc": first["created_utc"],
+            "num_comments": len(self.threads[submission_id]),
+            "permalink": f"/r/{first['subreddit']}/comments/{submission_id}/"}}
+
+    def _comment(self, comment: Dict[str, Any]) -> Dict[str, Any]:
+        parent = f"t3_{comment['submission_id']}"
+        return {"kind": "t1", "data": {
+            "id": comment["id"], "name": f"t1_{comment['id']}", "link_id": parent,
+            "parent_id": parent, "body": comment["body"], "author": comment["author"],
+            "score": comment["score"], "created_utc": comment["created_utc"], "replies": ""}}
+
+    def send(self, request, **kwargs):
+        path = urlparse(request.url).path.rstrip("/")
+        body: Any
+        if path.endswith("/access_token"):
+            body = {"access_token": "synthetic", "expires_in": 3600, "scope": "*",
+                    "token_type": "bearer"}
+        elif "/comments/" in path:
+            submission_id = path.split("/comments/", 1)[1].split("/")[0]
+            body = [_listing([self._submission(submission_id)]),
+                    _listing([self._comment(c) for c in self.threads[submission_id]])]
+        else:  # the top or search listing
+            body = _listing([self._submission(submission_id) for submission_id in self.threads])
+        response = requests.Response()
+        response.status_code = 200
+        response.headers = CaseInsensitiveDict({"content-type": "application/json"})
+        response._content = json.dumps(body).encode("utf-8")
+        response.encoding = "utf-8"
+        response.url = request.url
+        response.request = request
+        return response
+
+    def close(self) -> None:
+        pass
+
+
+def _synthetic_session(comments: Sequence[Dict[str, Any]]) -> requests.Session:
+    session = requests.Session()
+    session.mount("https://", _SyntheticReddit(comments))
+    return session
+
+
+class _Latency:
+    def __init__(self, model: Dict[str, float], rng: random.Random, scale: float) -> None:
+        self.median = model.get("median", 0.0) * scale
+        self.sigma = model.get("sigma", 0.0)
+        self.token_seconds = scale / model["tokens_per_second"] if model.get("tokens_per_second") else 0.0
+        self._rng = rng
+
+    def sample(self) -> float:
+        if self.median <= 0:
+            return 0.0
+        return self.median * self._rng.lognormvariate(0.0, self.sigma)
+
+    def per_token(self) -> float:
+        return self.token_seconds
+
+
+class _LatencyRequestor(CassetteRequestor):
+    """Replays a cassette, sleeping a sampled network latency before each request."""
+
+    def __init__(self, *args, latency: _Latency, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.latency = latency
+
+    def request(self, *args, **kwargs):
+        time.sleep(self.latency.sample())
+        return super().request(*args, **kwargs)
+
+
+def fixture_scraper(fixture: Dict[str, Any],
+                    latency_scale: float = 1.0,
+                    seed: int = 0,
+                    max_workers: int = 1) -> RedditScraper:
+    """A RedditScraper whose requests are answered from the fixture's recorded responses."""
+    latency = _Latency(fixture["latency"]["reddit"], random.Random(seed), latency_scale)
+    return RedditScraper("fake_id", "fake_secret", _USER_AGENT, max_workers=max_workers,
+                         requestor_class=_LatencyRequestor,
+                         requestor_kwargs={"cassette": Cassette(None, REPLAY, fixture["reddit"]),
+                                           "latency": latency})
+
+
+class FixtureLLM(BaseLLM):
+    """
+    Replays recorded completions by cache key; prompts that were not recorded
+    get a deterministic filler completion of the fixture's typical length.
+    Latency is a sampled time to first token plus a per-token generation time.
+    """
+
+    def __init__(self,
+                 fixture: Dict[str, Any],
+                 model: OpenAIModel = OpenAIModel.GPT_4_O_MINI,
+                 latency_scale: float = 1.0,
+                 seed: int = 0) -> None:
+        super().__init__("fake_key", model)
+        self.completions = {key: entry["text"] for key, entry in fixture["completions"].items()}
+        self.completion_tokens = fixture["latency"].get("completion_tokens", 300)
+        self.latency = _Latency(fixture["latency"]["llm"], random.Random(seed), latency_scale)
+
+    def _completion(self, messages: List[Dict[str, str]]) -> str:
+        key = make_cache_key(self.model.value, None, messages)
+        if key in self.completions:
+            return self.completions[key]
+        words = messages[-1]["content"].split()[:50] or ["ok"]
+        return " ".join(words[i % len(words)] for i in range(self.completion_tokens))
+
+    def _delay(self, text: str) -> float:
+        return self.latency.sample() + estimate_tokens(text) * self.latency.per_token()
+
+    def _call_llm(self, messages: List[Dict[str, str]]) -> str:
+        text = self._completion(messages)
+        time.sleep(self._delay(text))
+        return text
+
+    async def _acall_llm(self, messages: List[Dict[str, str]]) -> str:
+        text = self._completion(messages)
+        await asyncio.sleep(self._delay(text))
+        return text
+
+    def _stream_llm(self, messages: List[Dict[str, str]]) -> Iterator[str]:
+        text = self._completion(messages)
+        time.sleep(self.latency.sample())
+        for word in text.split(" "):
+            time.sleep(self.latency.per_token())
+            yield word + " "
+
+    async def _astream_llm(self, messages: List[Dict[str, str]]) -> AsyncIterator[str]:
+        text = self._completion(messages)
+        await asyncio.sleep(self.latency.sample())
+        for word in text.split(" "):
+            await asyncio.sleep(self.latency.per_token())
+            yield word + " "
+
+
+def percentile(values: Sequence[float], q: float) -> float:
+    """Nearest-rank percentile, q in [0, 100]."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1, math.ceil(q / 100 * len(ordered)) - 1))
+    return ordered[rank]
+
+
+def _summary(values: Sequence[float]) -> Dict[str, float]:
+    return {"p50": percentile(values, 50), "p90": percentile(values, 90),
+            "p99": percentile(values, 99), "max": max(values) if values else 0.0}
+
+
+def run_benchmark(fixture: Dict[str, Any],
+                  runs: int = 3,
+                  limit: Optional[int] = None,
+                  latency_scale: float = 1.0,
+                  seed: int = 0) -> Dict[str, Any]:
+    """
+    Run analyze_reddit_complaints end-to-end `runs` times against the fixture.
+    Peak memory covers Python allocations in this process (tracemalloc), not
+    the preprocessing worker processes.
+    """
+    coordinator = AgentCoordinator(
+        "fake_key", "fake_id", "fake_secret",
+        llm=FixtureLLM(fixture, latency_scale=latency_scale, seed=seed)
+    )
+    coordinator.reddit_scraper = fixture_scraper(fixture, latency_scale, seed,
+                                                 coordinator.reddit_scraper.max_workers)
+    limit = limit or len(fixture["comments"])
+
+    walls: List[float] = []
+    peaks: List[int] = []
+    steps: Dict[str, List[float]] = {}
+    tokens: List[Dict[str, float]] = []
+    try:
+        for _ in range(runs):
+            tracemalloc.start()
+            try:
+                start = time.perf_counter()
+                result = coordinator.analyze_reddit_complaints(
+                    fixture["subreddit"], fixture.get("search_query"), limit=limit)
+                walls.append(time.perf_counter() - start)
+                peaks.append(tracemalloc.get_traced_memory()[1])
+            finally:
+                tracemalloc.stop()
+            for name, timing in result["step_timings"].items():
+                steps.setdefault(name, []).append(timing["duration"])
+            totals = result["llm_usage"]["totals"]
+            tokens.append({"calls": totals.get("calls", 0),
+                           "prompt_tokens": totals.get("prompt_tokens", 0),
+                           "completion_tokens": totals.get("completion_tokens", 0)})
+    finally:
+        coordinator.close()
+
+    return {
+        "runs": runs,
+        "comments": limit,
+        "wall_seconds": _summary(walls),
+        "steps": {name: _summary(durations) for name, durations in steps.items()},
+        "peak_memory_bytes": max(peaks),
+        "tokens": {key: sum(t[key] for t in tokens) / runs for key in tokens[0]},
+    }
+
+
+def compare(report: Dict[str, Any],
+            baseline: Dict[str, Any],
+            tolerance: float = 0.2,
+            min_seconds: float = 0.05) -> List[str]:
+    """
+    Regressions of report against baseline beyond tolerance (a fraction).
+    Timings that grew by less than min_seconds are treated as noise.
+    """
+    checks = [("wall_seconds.p50", report["wall_seconds"]["p50"], baseline["wall_seconds"]["p50"], min_seconds),
+              ("peak_memory_bytes", report["peak_memory_bytes"], baseline["peak_memory_bytes"], 0)]
+    checks += [(f"tokens.{key}", report["tokens"][key], baseline["tokens"].get(key, 0), 0)
+               for key in ("prompt_tokens", "completion_tokens")]
+    checks += [(f"steps.{name}.p50", summary["p50"], baseline["steps"][name]["p50"], min_seconds)
+               for name, summary in report["steps"].items() if name in baseline["steps"]]
+    return [f"{name}: {current:.4g} vs baseline {previous:.4g}"
+            for name, current, previous, floor in checks
+            if previous > 0 and current > previous * (1 + tolerance) and current - previous > floor]
+
+
+def print_report(report: Dict[str, Any]) -> None:
+    wall = report["wall_seconds"]
+    print(f"{report['runs']} runs over {report['comments']} comments")
+    print(f"wall clock: p50 {wall['p50']:.3f}s  p90 {wall['p90']:.3f}s  max {wall['max']:.3f}s")
+    print(f"peak memory: {report['peak_memory_bytes'] / 1e6:.1f} MB")
+    print("tokens per run: " + ", ".join(f"{k} {v:.0f}" for k, v in report["tokens"].items()))
+    print(f"{'step':<16}{'p50':>10}{'p90':>10}{'p99':>10}")
+    for name, summary in report["steps"].items():
+        print(f"{name:<16}{summary['p50']:>10.3f}{summary['p90']:>10.3f}{summary['p99']:>10.3f}")
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--fixture", help="recorded fixture JSON (default: synthetic)")
+    parser.add_argument("--comments", type=int, default=400, help="size of the synthetic fixture")
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--latency-scale", type=float, default=1.0,
+                        help="multiply injected latency; 0 measures CPU-bound paths only")
+    parser.add_argument("--output", help="write the report as JSON")
+    parser.add_argument("--baseline", help="fail if slower than this saved report")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    args = parser.parse_args(argv)
+
+    fixture = load_fixture(args.fixture) if args.fixture else synthetic_fixture(args.comments)
+    report = run_benchmark(fixture, args.runs, latency_scale=args.latency_scale)
+    print_report(report)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    if args.baseline:
+        regressions = compare(report, load_fixture(args.baseline), args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,65 @@
+import tracemalloc
+from dataclasses import asdict
+
+import pytest
+
+from benchmark import (compare, fixture_scraper, load_fixture, percentile, run_benchmark,
+                       save_fixture, synthetic_fixture)
+from coordinator import AgentCoordinator
+
+
+def test_percentile_nearest_rank():
+    values = [float(i) for i in range(1, 11)]
+    assert percentile(values, 50) == 5.0
+    assert percentile(values, 90) == 9.0
+    assert percentile(values, 100) == 10.0
+    assert percentile([], 50) == 0.0
+
+
+def test_run_benchmark_reports_steps_memory_and_tokens():
+    fixture = synthetic_fixture(60, seed=1)
+    assert synthetic_fixture(60, seed=1) == fixture
+
+    report = run_benchmark(fixture, runs=2, latency_scale=0.0)
+
+    assert report["runs"] == 2
+    assert report["comments"] == 60
+    assert {"comments", "analysis", "final_report"} <= set(report["steps"])
+    assert report["peak_memory_bytes"] > 0
+    assert report["tokens"]["calls"] > 0
+    assert report["tokens"]["completion_tokens"] > 0
+    assert compare(report, report) == []
+
+
+def test_fixture_replays_recorded_reddit_responses_through_the_scraper(tmp_path):
+    path = str(tmp_path / "fixture.json")
+    save_fixture(synthetic_fixture(60, seed=1), path)
+    fixture = load_fixture(path)
+
+    comments = list(fixture_scraper(fixture, latency_scale=0.0).iter_subreddit_comments(
+        fixture["subreddit"], limit=100))
+
+    # The scraper's own filtering applies, as it would to live responses
+    assert [asdict(comment) for comment in comments] == [
+        comment for comment in fixture["comments"] if len(comment["body"].split()) > 5]
+
+
+def test_tracing_stops_when_a_run_fails(monkeypatch):
+    def fail(*args, **kwargs):
+        raise RuntimeError("analysis failed")
+
+    monkeypatch.setattr(AgentCoordinator, "analyze_reddit_complaints", fail)
+    with pytest.raises(RuntimeError):
+        run_benchmark(synthetic_fixture(10), runs=1, latency_scale=0.0)
+    assert not tracemalloc.is_tracing()
+
+
+def test_compare_flags_regressions_beyond_tolerance():
+    baseline = {"wall_seconds": {"p50": 1.0}, "peak_memory_bytes": 100,
+                "tokens": {"prompt_tokens": 10, "completion_tokens": 10},
+                "steps": {"analysis": {"p50": 0.5}}}
+    report = {"wall_seconds": {"p50": 1.1}, "peak_memory_bytes": 200,
+              "tokens": {"prompt_tokens": 10, "completion_tokens": 10},
+              "steps": {"analysis": {"p50": 1.0}}}
+    regressions = compare(report, baseline, tolerance=0.2, min_seconds=0.0)
+    assert [r.split(":")[0] for r in regressions] == ["peak_memory_bytes", "steps.analysis.p50"]
@@ -0,0 +1,293 @@
+"""
+Record/replay of Reddit and LLM HTTP traffic.
+
+In record mode requests go to the network as usual and every response is
+captured; in replay mode responses come from the cassette and nothing touches
+the network, so a recorded analysis can be re-run instantly and offline:
+
+    with Cassette("techsupport.cassette.gz", "record") as cassette:
+        AgentCoordinator(api_key, client_id, secret, cassette=cassette).analyze_reddit_complaints(...)
+
+    with Cassette("techsupport.cassette.gz", "replay") as cassette:
+        AgentCoordinator("-", "-", "-", cassette=cassette).analyze_reddit_complaints(...)
+
+Requests are matched on method, URL, query and body, never on headers, so
+credentials are neither needed for replay nor written to the cassette.
+"""
+import gzip
+import hashlib
+import json
+import os
+import threading
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional
+from urllib.parse import urlencode
+
+import httpx2
+import prawcore
+import requests
+from requests.structures import CaseInsensitiveDict
+
+from llms import set_http_transports
+from reddit_utils import ScheduledRequestor
+
+RECORD = "record"
+REPLAY = "replay"
+
+# Response headers worth keeping; rate limit headers are dropped so replays never sleep
+_KEPT_HEADERS = ("content-type", "location")
+
+
+class CassetteMiss(LookupError):
+    """A request in replay mode that the cassette has no response for."""
+
+
+class Cassette:
+    """
+    Recorded responses keyed by request, stored as gzipped JSON. Identical
+    requests are replayed in the order they were recorded; once a key's
+    responses run out the last one is repeated.
+
+    With path None the cassette lives in memory only: it replays the given
+    interactions, or records for the caller to read back from interactions.
+    """
+
+    def __init__(self,
+                 path: Optional[str],
+                 mode: str = REPLAY,
+                 interactions: Optional[List[Dict[str, Any]]] = None) -> None:
+        if mode not in (RECORD, REPLAY):
+            raise ValueError(f"Cassette mode must be {RECORD!r} or {REPLAY!r}, not {mode!r}")
+        self.path = path
+        self.mode = mode
+        self._recorded: List[Dict[str, Any]] = []
+        self._queues: Dict[str, Deque[Dict[str, Any]]] = {}
+        self._last: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+        self._loaded = 0
+        if mode == REPLAY:
+            if interactions is None:
+                if path is None:
+                    raise ValueError("A replay cassette needs a path or interactions")
+                with gzip.open(path, "rt", encoding="utf-8") as f:
+                    interactions = json.load(f)["interactions"]
+            for interaction in interactions:
+                self._queues.setdefault(interaction["key"], deque()).append(interaction)
+                self._loaded += 1
+
+    @property
+    def recording(self) -> bool:
+        return self.mode == RECORD
+
+    def record(self, key: str, status: int, headers: Any, body: str) -> None:
+        kept = {name: headers[name] for name in _KEPT_HEADERS if name in headers}
+        with self._lock:
+            self._recorded.append({"key": key, "status": status, "headers": kept, "body": body})
+
+    def play(self, key: str) -> Dict[str, Any]:
+        with self._lock:
+            queue = self._queues.get(key)
+            if queue:
+                self._last[key] = queue.popleft()
+            if key not in self._last:
+                raise CassetteMiss(f"No recorded response for {key}")
+            return self._last[key]
+
+    @property
+    def interactions(self) -> List[Dict[str, Any]]:
+        """The interactions recorded so far (record mode)."""
+        with self._lock:
+            return list(self._recorded)
+
+    def save(self) -> None:
+        """Write the recorded interactions (record mode with a path only)."""
+        if not self.recording or self.path is None:
+            return
+        data = {"version": 1, "interactions": self.interactions}
+        temp_path = f"{self.path}.tmp"
+        with gzip.open(temp_path, "wt", encoding="utf-8") as f:
+            json.dump(data, f, separators=(",", ":"))
+        os.replace(temp_path, self.path)
+
+    def __len__(self) -> int:
+        return len(self._recorded) if self.recording else self._loaded
+
+    # LLM side: transports for the openai SDK's httpx2 clients
+
+    def transport(self) -> "CassetteTransport":
+        return CassetteTransport(self)
+
+    def async_transport(self) -> "AsyncCassetteTransport":
+        return AsyncCassetteTransport(self)
+
+    def install(self) -> None:
+        """
+        Record or replay the traffic of every LLM backend created from now on.
+        Reddit traffic goes through CassetteRequestor; see reddit_options().
+        """
+        set_http_transports(self.transport, self.async_transport)
+
+    def reddit_options(self) -> Dict[str, Any]:
+        """RedditScraper keyword arguments that route its requests through this cassette."""
+        return {"requestor_class": CassetteRequestor, "requestor_kwargs": {"cassette": self}}
+
+    def uninstall(self) -> None:
+        set_http_transports()
+
+    def __enter__(self) -> "Cassette":
+        self.install()
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.uninstall()
+        self.save()
+
+
+def _body_digest(body: bytes) -> str:
+    if not body:
+        return ""
+    try:  # key JSON bodies on their content, not their formatting
+        body = json.dumps(json.loads(body), sort_keys=True, separators=(",", ":")).encode()
+    except ValueError:
+        pass
+    return "#" + hashlib.sha256(body).hexdigest()[:16]
+
+
+def _scrub(url: str, body: str) -> str:
+    """Never store OAuth tokens; prawcore only needs the token response's shape."""
+    if not url.endswith("/access_token"):
+        return body
+    try:
+        payload = json.loads(body)
+    except ValueError:
+        return body
+    if "access_token" in payload:
+        payload["access_token"] = "replayed"
+    return json.dumps(payload)
+
+
+class _HttpxCassette:
+    def __init__(self, cassette: Cassette) -> None:
+        self.cassette = cassette
+
+    def _key(self, request: httpx2.Request) -> str:
+        return f"{request.method} {request.url}{_body_digest(request.content)}"
+
+    def _recorded(self, request: httpx2.Request, key: str, response: httpx2.Response) -> httpx2.Response:
+        self.cassette.record(key, response.status_code, response.headers, response.text)
+        # The body has been read (and decoded), so hand over a plain copy
+        return httpx2.Response(response.status_code, content=response.content,
+                               headers={"content-type": response.headers.get("content-type", "")},
+                               request=request)
+
+    def _replayed(self, request: httpx2.Request, key: str) -> httpx2.Response:
+        try:
+            interaction = self.cassette.play(key)
+        except CassetteMiss as e:
+            # A 404 fails the call at once instead of being retried like a connection error
+            return httpx2.Response(404, json={"error": {"message": str(e)}}, request=request)
+        return httpx2.Response(interaction["status"], headers=interaction["headers"],
+                               content=interaction["body"].encode("utf-8"), request=request)
+
+
+class CassetteTransport(_HttpxCassette, httpx2.BaseTransport):
+    """httpx2 transport for openai.OpenAI clients. Streams are buffered while recording."""
+
+    def __init__(self, cassette: Cassette) -> None:
+        super().__init__(cassette)
+        self._network = httpx2.HTTPTransport() if cassette.recording else None
+
+    def handle_request(self, request: httpx2.Request) -> httpx2.Response:
+        request.read()
+        key = self._key(request)
+        if self._network is None:
+            return self._replayed(request, key)
+        response = self._network.handle_request(request)
+        try:
+            response.read()
+        finally:
+            response.close()
+        return self._recorded(request, key, response)
+
+    def close(self) -> None:
+        if self._network is not None:
+            self._network.close()
+
+
+class AsyncCassetteTransport(_HttpxCassette, httpx2.AsyncBaseTransport):
+    """httpx2 transport for openai.AsyncOpenAI clients."""
+
+    def __init__(self, cassette: Cassette) -> None:
+        super().__init__(cassette)
+        self._network = httpx2.AsyncHTTPTransport() if cassette.recording else None
+
+    async def handle_async_request(self, request: httpx2.Request) -> httpx2.Response:
+        await request.aread()
+        key = self._key(request)
+        if self._network is None:
+            return self._replayed(request, key)
+        response = await self._network.handle_async_request(request)
+        try:
+            await response.aread()
+        finally:
+            await response.aclose()
+        return self._recorded(request, key, response)
+
+    async def aclose(self) -> None:
+        if self._network is not None:
+            await self._network.aclose()
+
+
+def _encode_pairs(value: Any) -> str:
+    if not value:
+        return ""
+    items = value.items() if isinstance(value, dict) else value
+    return urlencode(sorted((str(k), str(v)) for k, v in items))
+
+
+class CassetteRequestor(ScheduledRequestor):
+    """
+    prawcore requestor that records responses to, or replays them from, a
+    Cassette. Replayed requests skip the scheduler since they cost no quota.
+    """
+
+    def __init__(self, *args, cassette: Cassette, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.cassette = cassette
+
+    def _key(self, method: str, url: str, kwargs: Dict[str, Any]) -> str:
+        key = f"{method.upper()} {url}"
+        query = _encode_pairs(kwargs.get("params"))
+        if query:
+            key += f"?{query}"
+        data = kwargs.get("data")
+        if isinstance(data, (dict, list, tuple)):
+            data = _encode_pairs(data)
+        body = data or (json.dumps(kwargs["json"], sort_keys=True) if kwargs.get("json") else "")
+        if isinstance(body, str):
+            body = body.encode("utf-8")
+        return key + _body_digest(body or b"")
+
+    def _response(self, url: str, status: int, headers: Dict[str, str], body: str) -> requests.Response:
+        response = requests.Response()
+        response.status_code = status
+        response.headers = CaseInsensitiveDict(headers)
+        response._content = body.encode("utf-8")
+        response.encoding = "utf-8"
+        response.url = url
+        return response
+
+    def request(self, method, url, *args, **kwargs):
+        key = self._key(method, url, kwargs)
+        if not self.cassette.recording:
+            try:
+                interaction = self.cassette.play(key)
+            except CassetteMiss as e:
+                raise prawcore.RequestException(e, (method, url), kwargs) from None
+            return self._response(url, interaction["status"], interaction["headers"],
+                                  interaction["body"])
+        response = super().request(method, url, *args, **kwargs)
+        self.cassette.record(key, response.status_code, response.headers,
+                             _scrub(url, response.text))
+        return response
+
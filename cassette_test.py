@@ -0,0 +1,73 @@
+import asyncio
+import threading
+from http.server import ThreadingHTTPServer
+
+import openai
+import prawcore
+import pytest
+
+from cassette import Cassette, CassetteRequestor
+from llms import OpenAI, OpenAIModel
+from llms_test import start_fake_server
+from rate_limiter import RequestScheduler
+from rate_limiter_test import StubRedditHandler
+
+MESSAGES = [{"role": "user", "content": "hello"}]
+
+
+def run_llm(base_url: str):
+    llm = OpenAI("fake_key", OpenAIModel.GPT_4_O_MINI, base_url=base_url)
+
+    async def run() -> str:
+        return await llm.acomplete(MESSAGES, use_cache=False)
+
+    return (llm.complete(MESSAGES, use_cache=False),
+            "".join(llm.stream(MESSAGES, use_cache=False)),
+            asyncio.run(run()))
+
+
+def test_llm_calls_replay_without_network(tmp_path):
+    path = str(tmp_path / "llm.cassette.gz")
+    server, base_url = start_fake_server()
+    try:
+        with Cassette(path, "record") as cassette:
+            recorded = run_llm(base_url)
+        assert len(cassette) == 3
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    with Cassette(path, "replay"):
+        assert run_llm(base_url) == recorded
+        llm = OpenAI("other_key", OpenAIModel.GPT_4_O_MINI, base_url=base_url)
+        with pytest.raises(openai.NotFoundError):
+            llm._call_llm([{"role": "user", "content": "not recorded"}])
+
+
+def test_reddit_requests_replay_without_network(tmp_path):
+    path = str(tmp_path / "reddit.cassette.gz")
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubRedditHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_address[1]}/r/python/top"
+
+    def requestor(cassette: Cassette) -> CassetteRequestor:
+        return CassetteRequestor(user_agent="RedditAnalyzerBot/1.0 tests",
+                                 scheduler=RequestScheduler(), cassette=cassette)
+
+    try:
+        with Cassette(path, "record") as cassette:
+            response = requestor(cassette).request("GET", url, params={"limit": 5, "t": "week"})
+            assert response.status_code == 200
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    replay = requestor(Cassette(path, "replay"))
+    # Query parameters are matched regardless of order
+    response = replay.request("GET", url, params={"t": "week", "limit": 5})
+    assert response.status_code == 200
+    assert response.json() == {}
+    # Rate limit headers are not kept, so prawcore never sleeps on replay
+    assert "x-ratelimit-remaining" not in response.headers
+    with pytest.raises(prawcore.RequestException):
+        replay.request("GET", url, params={"limit": 6, "t": "week"})
@@ -0,0 +1,194 @@
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Sequence, Set
+
+from records import Comment, CommentBatch
+
+
+class CommentStore:
+    """
+    SQLite store of scraped comments keyed by comment id.
+
+    Besides the comments themselves it keeps, per subreddit/query, the
+    created_utc watermark of the newest comment seen, and per submission the
+    comment count at the last scrape, so repeat scrapes only need the delta.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS comments (
+                id TEXT PRIMARY KEY,
+                submission_id TEXT NOT NULL,
+                subreddit TEXT NOT NULL,
+                author TEXT NOT NULL,
+                score INTEGER NOT NULL,
+                created_utc REAL NOT NULL,
+                body TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS comments_subreddit_created
+                ON comments (subreddit, created_utc);
+            CREATE TABLE IF NOT EXISTS submissions (
+                id TEXT NOT NULL,
+                query TEXT NOT NULL,
+                num_comments INTEGER NOT NULL,
+                checked_utc REAL NOT NULL,
+                PRIMARY KEY (id, query)
+            );
+            CREATE TABLE IF NOT EXISTS watermarks (
+                subreddit TEXT NOT NULL,
+                query TEXT NOT NULL,
+                created_utc REAL NOT NULL,
+                PRIMARY KEY (subreddit, query)
+            );
+            """
+        )
+        self._conn.commit()
+
+    def _insert_comments(self, comments: Iterable[Comment]) -> int:
+        before = self._conn.total_changes
+        rows = [(c.id, c.submission_id, c.subreddit, c.author, c.score, c.created_utc, c.body)
+                for c in comments]
+        self._conn.executemany(
+            "INSERT OR IGNORE INTO comments "
+            "(id, submission_id, subreddit, author, score, created_utc, body) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            rows
+        )
+        inserted = self._conn.total_changes - before
+        self._conn.executemany(
+            "UPDATE comments SET score = ? WHERE id = ?",
+            [(row[4], row[0]) for row in rows]
+        )
+        return inserted
+
+    def add_comments(self, comments: Iterable[Comment]) -> int:
+        """Insert comments, refreshing the score of known ones. Returns how many were new."""
+        with self._lock:
+            inserted = self._insert_comments(comments)
+            self._conn.commit()
+            return inserted
+
+    def known_ids(self, ids: Iterable[str]) -> Set[str]:
+        """The subset of ids already stored."""
+        ids = list(ids)
+        known: Set[str] = set()
+        with self._lock:
+            # Stay under SQLite's bound-parameter limit
+            for start in range(0, len(ids), 500):
+                batch = ids[start:start + 500]
+                rows = self._conn.execute(
+                    f"SELECT id FROM comments WHERE id IN ({','.join('?' * len(batch))})", batch
+                ).fetchall()
+                known.update(row[0] for row in rows)
+        return known
+
+    def mark_seen(self,
+                  subreddit: str,
+                  query: Optional[str],
+                  comments: Sequence[Comment],
+                  submission_counts: Dict[str, int]) -> None:
+        """
+        Record comments as analyzed in one transaction: store them, advance the
+        subreddit/query watermark to the newest, and record the comment counts
+        of submissions that need no re-scrape until they change.
+        """
+        with self._lock:
+            self._insert_comments(comments)
+            if comments:
+                self._conn.execute(
+                    "INSERT INTO watermarks (subreddit, query, created_utc) VALUES (?, ?, ?) "
+                    "ON CONFLICT (subreddit, query) DO UPDATE SET "
+                    "created_utc = MAX(created_utc, excluded.created_utc)",
+                    (subreddit, query or "", max(c.created_utc for c in comments))
+                )
+            now = time.time()
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO submissions (id, query, num_comments, checked_utc) "
+                "VALUES (?, ?, ?, ?)",
+                [(submission_id, query or "", count, now)
+                 for submission_id, count in submission_counts.items()]
+            )
+            self._conn.commit()
+
+    def _select_comments(self,
+                         subreddit: str,
+                         since: Optional[float],
+                         limit: Optional[int]) -> List[tuple]:
+        sql = ("SELECT id, submission_id, subreddit, body, author, score, created_utc "
+               "FROM comments WHERE subreddit = ? AND created_utc > ? ORDER BY created_utc")
+        params: list = [subreddit, since if since is not None else float("-inf")]
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(limit)
+        with self._lock:
+            return self._conn.execute(sql, params).fetchall()
+
+    def get_comments(self,
+                     subreddit: str,
+                     since: Optional[float] = None,
+                     limit: Optional[int] = None) -> List[Comment]:
+        """Stored comments for a subreddit, oldest first, optionally newer than since."""
+        return [Comment(*row) for row in self._select_comments(subreddit, since, limit)]
+
+    def get_comment_batch(self,
+                          subreddit: str,
+                          since: Optional[float] = None,
+                          limit: Optional[int] = None) -> CommentBatch:
+        """get_comments in columnar form, without building a Comment per row."""
+        return CommentBatch.from_rows(self._select_comments(subreddit, since, limit))
+
+    def get_watermark(self, subreddit: str, query: Optional[str] = None) -> float:
+        """created_utc of the newest comment seen for subreddit/query (0 if never scraped)."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT created_utc FROM watermarks WHERE subreddit = ? AND query = ?",
+                (subreddit, query or "")
+            ).fetchone()
+        return row[0] if row else 0.0
+
+    def set_watermark(self, subreddit: str, query: Optional[str], created_utc: float) -> None:
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO watermarks (subreddit, query, created_utc) VALUES (?, ?, ?) "
+                "ON CONFLICT (subreddit, query) DO UPDATE SET "
+                "created_utc = MAX(created_utc, excluded.created_utc)",
+                (subreddit, query or "", created_utc)
+            )
+            self._conn.commit()
+
+    def get_submission_comment_count(self,
+                                     submission_id: str,
+                                     query: Optional[str] = None) -> Optional[int]:
+        """num_comments recorded when a query last scraped a submission, if ever."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT num_comments FROM submissions WHERE id = ? AND query = ?",
+                (submission_id, query or "")
+            ).fetchone()
+        return row[0] if row else None
+
+    def set_submission_comment_count(self,
+                                     submission_id: str,
+                                     query: Optional[str],
+                                     num_comments: int) -> None:
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO submissions (id, query, num_comments, checked_utc) "
+                "VALUES (?, ?, ?, ?)",
+                (submission_id, query or "", num_comments, time.time())
+            )
+            self._conn.commit()
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
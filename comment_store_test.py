@@ -0,0 +1,48 @@
+import os
+import tempfile
+
+from comment_store import CommentStore
+from records import Comment
+
+
+def make_comment(comment_id: str, created_utc: float, score: int = 1) -> Comment:
+    return Comment(comment_id, "s1", "python", f"body of {comment_id}", "someone", score, created_utc)
+
+
+def test_add_comments_counts_only_new_ids_and_refreshes_scores():
+    with tempfile.TemporaryDirectory() as tmp:
+        store = CommentStore(os.path.join(tmp, "comments.sqlite"))
+        assert store.add_comments([make_comment("a", 1.0), make_comment("b", 2.0)]) == 2
+        assert store.add_comments([make_comment("b", 2.0, score=10), make_comment("c", 3.0)]) == 1
+
+        comments = store.get_comments("python")
+        assert [c.id for c in comments] == ["a", "b", "c"]
+        assert comments[1].score == 10
+        assert [c.id for c in store.get_comments("python", since=1.0, limit=1)] == ["b"]
+        store.close()
+
+
+def test_watermarks_are_per_query_and_only_move_forward():
+    with tempfile.TemporaryDirectory() as tmp:
+        store = CommentStore(os.path.join(tmp, "comments.sqlite"))
+        assert store.get_watermark("python") == 0.0
+        store.set_watermark("python", None, 10.0)
+        store.set_watermark("python", None, 5.0)
+        store.set_watermark("python", "django", 3.0)
+        assert store.get_watermark("python") == 10.0
+        assert store.get_watermark("python", "django") == 3.0
+        store.close()
+
+
+def test_submission_comment_counts_survive_reopen():
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "comments.sqlite")
+        store = CommentStore(path)
+        assert store.get_submission_comment_count("s1") is None
+        store.set_submission_comment_count("s1", None, 42)
+        store.close()
+
+        reopened = CommentStore(path)
+        assert reopened.get_submission_comment_count("s1") == 42
+        assert reopened.get_submission_comment_count("s1", "django") is None
+        reopened.close()
@@ -1,105 +1,582 @@
+import asyncio
+import contextvars
+import queue
+import threading
+from functools import partial
+
+from cassette import Cassette
+from comment_store import CommentStore
+from corpus import Corpus
 from agents import ResearchAgent, AnalystAgent, WriterAgent, RedditAnalyzerAgent, SubredditDiscoveryAgent
-from reddit_utils import RedditScraper
-from typing import Optional, List, Dict
+from llm_batch import BatchLLM
+from llm_cache import LLMCache
+from llm_metrics import RunMetrics, collect
+from llm_policy import PolicyLLM
+from llm_router import ModelRouter
+from llms import AsyncTokenStream, BaseLLM, OpenAI, run_async
+from near_duplicates import CommentCluster, NearDuplicateCollapser
+from pipeline import Pipeline, PipelineResult
+from preprocessing import CommentPreprocessor, PreprocessReport
+from records import Comment, CommentBatch
+from reddit_utils import NewComments, RedditScraper
+from semantic_index import SemanticCluster, SemanticClusterer
+from subreddit_discovery import SubredditCache, SubredditDiscovery
+from subreddit_ranking import SubredditRanker
+from typing import Any, AsyncIterator, Callable, Iterator, Optional, List, Dict, Sequence, Tuple, TypeVar
+
+T = TypeVar("T")
+
+
+def _unique_subreddits(subreddits: Sequence[str]) -> List[str]:
+    """subreddits without repeats, comparing names case-insensitively as Reddit does."""
+    unique: Dict[str, str] = {}
+    for subreddit in subreddits:
+        unique.setdefault(subreddit.lower(), subreddit)
+    return list(unique.values())
+
 
 class AgentCoordinator:
-    def __init__(self, api_key: str, reddit_client_id: str, reddit_client_secret: str):
-        self.researcher = ResearchAgent(api_key)
-        self.analyst = AnalystAgent(api_key)
-        self.writer = WriterAgent(api_key)
-        self.reddit_analyzer = RedditAnalyzerAgent(api_key)
+    def __init__(self,
+                 api_key: str,
+                 reddit_client_id: str,
+                 reddit_client_secret: str,
+                 scraper_workers: int = 8,
+                 llm: Optional[BaseLLM] = None,
+                 llm_cache: Optional[LLMCache] = None,
+                 comment_store: Optional[CommentStore] = None,
+                 preprocessor: Optional[CommentPreprocessor] = None,
+                 collapse_near_duplicates: bool = True,
+                 semantic_clusterer: Optional[SemanticClusterer] = None,
+                 semantic_threshold: int = 1000,
+                 model_routes: Optional[Dict] = None,
+                 cassette: Optional[Cassette] = None,
+                 subreddit_cache: Optional[SubredditCache] = None,
+                 discovery_depth: int = 1,
+                 discovery_budget: int = 25,
+                 subreddit_top_k: Optional[int] = 30,
+                 corpus: Optional[Corpus] = None,
+                 batch: bool = False):
+        self.api_key = api_key
+        # Reddit traffic goes through the cassette; LLM traffic too while the
+        # caller has it entered (`with cassette:`), which also saves it
+        self.cassette = cassette
+        # By default transient API errors are retried with backoff instead of
+        # turning into empty answers. With batch=True (or llm=BatchLLM(...)) every
+        # completion goes through the Batch API instead: cheaper, but each pipeline
+        # step waits for its job to finish; close() submits what is still queued
+        if llm is None:
+            llm = BatchLLM(OpenAI(api_key)) if batch else PolicyLLM([OpenAI(api_key)])
+        self.llm = llm
+        if model_routes:
+            # Per agent-method models, e.g. llm_router.DEFAULT_ROUTES; self.llm stays the default
+            self.llm = ModelRouter.from_config(model_routes, api_key, default=self.llm)
+        if llm_cache is not None:
+            self.llm.cache = llm_cache
+        self.researcher = ResearchAgent(api_key, self.llm)
+        self.analyst = AnalystAgent(api_key, self.llm)
+        self.writer = WriterAgent(api_key, self.llm)
+        self.reddit_analyzer = RedditAnalyzerAgent(api_key, self.llm)
+        # Needed for incremental scraping, which only analyzes comments not seen before
+        self.comment_store = comment_store
+        self.preprocessor = preprocessor or CommentPreprocessor()
+        self.deduplicator = NearDuplicateCollapser() if collapse_near_duplicates else None
+        # Above semantic_threshold distinct comments the analyzer only sees topic
+        # clusters, keeping the token cost flat however many comments were scraped
+        self.semantic_clusterer = semantic_clusterer
+        self.semantic_threshold = semantic_threshold
+        self._semantic_lock = threading.Lock()
         self.reddit_scraper = RedditScraper(
             client_id=reddit_client_id,
             client_secret=reddit_client_secret,
-            user_agent="RedditAnalyzerBot/1.0"
+            user_agent="RedditAnalyzerBot/1.0",
+            max_workers=scraper_workers,
+            **(cassette.reddit_options() if cassette is not None else {})
         )
+        # Pass a file-backed SubredditCache to make repeat discoveries warm across runs
+        self.discovery = SubredditDiscovery(
+            self.reddit_scraper, subreddit_cache,
+            max_depth=discovery_depth, budget=discovery_budget, max_workers=scraper_workers
+        )
+        # Only the subreddit_top_k most relevant candidates (None: all) go to the LLM
+        self.subreddit_ranker = SubredditRanker(top_k=subreddit_top_k)
+        # Scraped comments and analyses are archived here for offline reprocessing
+        self.corpus = corpus
 
-    def analyze_reddit_complaints(self, 
-                                subreddit: str, 
-                                search_query: Optional[str] = None,
-                                limit: int = 100) -> Dict:
+    def close(self) -> None:
         """
-        Analyze complaints and problems from a subreddit
+        Submit any batched completions still queued, release the LLM's workers
+        and metrics listener, and shut down the preprocessor's worker processes.
+        Stores passed in are left to the caller.
         """
-        # Step 1: Gather comments
-        if search_query:
-            comments = self.reddit_scraper.search_subreddit_comments(
-                subreddit, search_query, limit
-            )
-        else:
-            comments = self.reddit_scraper.get_subreddit_comments(
+        close = getattr(self.llm, "close", None)
+        if close is not None:
+            close()
+        self.preprocessor.close()
+
+    def __enter__(self) -> "AgentCoordinator":
+        return self
+
+    def __exit__(self, *exc_info: object) -> None:
+        self.close()
+
+    async def _consume_report(self,
+                              stream: AsyncTokenStream,
+                              on_report_delta: Optional[Callable[[str], None]]) -> AsyncTokenStream:
+        async for delta in stream:
+            if on_report_delta is not None:
+                on_report_delta(delta)
+        return stream
+
+    def _complaints_pipeline(self,
+                             subreddit: str,
+                             search_query: Optional[str],
+                             limit: int,
+                             on_report_delta: Optional[Callable[[str], None]] = None,
+                             source: Optional[Callable[[], CommentBatch]] = None,
+                             comments: Optional[CommentBatch] = None) -> Pipeline:
+        pipeline = Pipeline("analyze_reddit_complaints")
+
+        # Step 1: Gather comments, held in columnar form for the rest of the run
+        def gather_comments() -> CommentBatch:
+            if comments is not None:
+                return comments
+            if source is not None:
+                return source()
+            if search_query:
+                return CommentBatch.from_comments(self.reddit_scraper.iter_search_subreddit_comments(
+                    subreddit, search_query, limit
+                ))
+            return CommentBatch.from_comments(self.reddit_scraper.iter_subreddit_comments(
                 subreddit, limit=limit
+            ))
+
+        # Step 1b: Clean and filter them on the CPU pool before they cost tokens
+        def preprocess(comments: CommentBatch) -> Tuple[List[Comment], PreprocessReport]:
+            return self.preprocessor.process(comments)
+
+        # Step 1c: Collapse near-duplicates into one representative with a count
+        def collapse(preprocessed: Tuple[List[Comment], PreprocessReport]) -> List[CommentCluster]:
+            cleaned, _ = preprocessed
+            bodies = [comment.body for comment in cleaned]
+            if self.deduplicator is None:
+                return [CommentCluster(body, [i]) for i, body in enumerate(bodies)]
+            return self.deduplicator.collapse(bodies)
+
+        # Step 1d: Large inputs are grouped by topic so only exemplars reach the LLM
+        def cluster_topics(preprocessed: Tuple[List[Comment], PreprocessReport],
+                           clusters: List[CommentCluster]) -> Optional[List[SemanticCluster]]:
+            if len(clusters) <= self.semantic_threshold:
+                return None
+            with self._semantic_lock:  # the default embedder may load a model; do it once
+                if self.semantic_clusterer is None:
+                    self.semantic_clusterer = SemanticClusterer()
+            cleaned, _ = preprocessed
+            return self.semantic_clusterer.cluster(
+                [cleaned[cluster.members[0]] for cluster in clusters],
+                [cluster.count for cluster in clusters]
             )
 
         # Step 2: Analyze comments for complaints and problems
-        analysis = self.reddit_analyzer.analyze_comments(comments)
-        
-        # Step 3: Generate summary
-        summary = self.reddit_analyzer.summarize_findings(analysis)
-        
+        async def analyze(clusters: List[CommentCluster],
+                          topics: Optional[List[SemanticCluster]]) -> str:
+            if topics is not None:
+                return await self.reddit_analyzer.aanalyze_clusters(topics)
+            return await self.reddit_analyzer.aanalyze_comments(
+                [cluster.representative for cluster in clusters],
+                [cluster.count for cluster in clusters]
+            )
+
         # Step 4: Get additional insights from the analyst
-        deeper_insights = self.analyst.analyze(
-            f"Based on this analysis and summary of Reddit comments:\n\n"
-            f"Analysis: {analysis}\n\n"
-            f"Summary: {summary}\n\n"
-            f"What additional patterns or insights can you identify?"
+        async def deeper_insights(analysis: str, summary: str) -> str:
+            return await self.analyst.aanalyze(
+                "What additional patterns or insights can you identify in this analysis "
+                "and summary of Reddit comments?\n\n"
+                f"Analysis: {analysis}\n\n"
+                f"Summary: {summary}"
+            )
+
+        # Step 5: Generate final report, streamed
+        async def final_report(analysis: str, summary: str, insights: str) -> AsyncTokenStream:
+            return await self._consume_report(self.writer.awrite_stream(
+                f"Reddit Analysis: {analysis}\nSummary: {summary}",
+                insights
+            ), on_report_delta)
+
+        pipeline.add_step("comments", gather_comments)
+        pipeline.add_step("preprocessed", preprocess, deps=["comments"])
+        pipeline.add_step("clusters", collapse, deps=["preprocessed"])
+        pipeline.add_step("topics", cluster_topics, deps=["preprocessed", "clusters"])
+        pipeline.add_step("analysis", analyze, deps=["clusters", "topics"])
+        # Step 3: Generate summary
+        pipeline.add_step(
+            "summary", self.reddit_analyzer.asummarize_findings, deps=["analysis"])
+        pipeline.add_step("insights", deeper_insights, deps=["analysis", "summary"])
+        pipeline.add_step("final_report", final_report, deps=["analysis", "summary", "insights"])
+        return pipeline
+
+    def _new_comments(self,
+                      subreddit: str,
+                      search_query: Optional[str],
+                      limit: int) -> Tuple[CommentBatch, NewComments]:
+        """The oldest limit comments not analyzed before, and the scrape they came from."""
+        if self.comment_store is None:
+            raise ValueError("Incremental analysis requires a comment_store")
+        new = self.reddit_scraper.fetch_new_comments(self.comment_store, subreddit, search_query)
+        # Comments past limit are newer than these and wait for the next run
+        return CommentBatch.from_comments(new.comments[:limit]), new
+
+    async def _in_executor(self, func: Callable[..., T], *args: Any) -> T:
+        # Blocking work off the event loop, still attributed to the caller's llm_metrics run
+        context = contextvars.copy_context()
+        return await asyncio.get_running_loop().run_in_executor(None, context.run, func, *args)
+
+    def _skipped_result(self, usage: RunMetrics) -> Dict:
+        # Nothing new since the last incremental run, so no LLM stage ran
+        return {"skipped": True, "raw_comments": [], "llm_usage": usage.to_dict()}
+
+    def _complaints_result(self, result: PipelineResult, usage: RunMetrics) -> Dict:
+        outputs = result.outputs
+        return {
+            "raw_comments": outputs["comments"].column("body"),
+            "detailed_analysis": outputs["analysis"],
+            "summary": outputs["summary"],
+            "insights": outputs["insights"],
+            "final_report": outputs["final_report"].text,
+            "report_time_to_first_token": outputs["final_report"].time_to_first_token,
+            "preprocessing": outputs["preprocessed"][1].to_dict(),
+            "near_duplicate_clusters": len(outputs["clusters"]),
+            "semantic_clusters": len(outputs["topics"]) if outputs["topics"] is not None else None,
+            "step_timings": result.timings_dict(),
+            "llm_usage": usage.to_dict()
+        }
+
+    def _archive(self,
+                 subreddit: str,
+                 search_query: Optional[str],
+                 result: PipelineResult,
+                 output: Dict) -> None:
+        """
+        Archive the run's comments, the posts they came from and the analysis.
+        The analysis stands if this fails; the error is in output["corpus_error"].
+        """
+        if self.corpus is None:
+            return
+        try:
+            comments = result.outputs["comments"]
+            self.corpus.export_comments(comments)
+            self.corpus.export_posts(
+                self.reddit_scraper.get_posts(subreddit, comments.column("submission_id")))
+            output["corpus_run_id"] = self.corpus.export_analysis(subreddit, output, search_query)
+        except Exception as e:
+            print(f"Error archiving analysis of r/{subreddit}: {e}")
+            output["corpus_error"] = str(e)
+
+    def analyze_reddit_complaints(self, 
+                                subreddit: str, 
+                                search_query: Optional[str] = None,
+                                limit: int = 100,
+                                incremental: bool = False,
+                                on_report_delta: Optional[Callable[[str], None]] = None,
+                                skip_empty: bool = False) -> Dict:
+        """
+        Analyze complaints and problems from a subreddit. With incremental=True
+        only comments not already in the comment store are analyzed, the oldest
+        limit of them, and they are stored only once the analysis succeeds; the
+        rest are picked up by the next run. With skip_empty as well a run that
+        finds none returns {"skipped": True, ...} without calling the LLM.
+        on_report_delta receives the final report's text as it is generated.
+        """
+        with collect("analyze_reddit_complaints") as usage:
+            comments, new = None, None
+            if incremental:
+                comments, new = self._new_comments(subreddit, search_query, limit)
+                if skip_empty and not len(comments):
+                    new.mark_seen(self.comment_store, 0)
+                    return self._skipped_result(usage)
+            pipeline = self._complaints_pipeline(
+                subreddit, search_query, limit, on_report_delta, comments=comments)
+            result = pipeline.run()
+        if new is not None:
+            # Only once the analysis succeeded, and only for what it covered
+            new.mark_seen(self.comment_store, len(comments))
+        output = self._complaints_result(result, usage)
+        self._archive(subreddit, search_query, result, output)
+        return output
+
+    def analyze_corpus(self,
+                       subreddit: str,
+                       since: Optional[float] = None,
+                       until: Optional[float] = None,
+                       limit: Optional[int] = None,
+                       on_report_delta: Optional[Callable[[str], None]] = None) -> Dict:
+        """
+        Re-run the complaints analysis on archived comments (since <= created_utc
+        < until) without touching Reddit. The result is not archived again.
+        """
+        if self.corpus is None:
+            raise ValueError("Analyzing archived comments requires a corpus")
+        # The scraping limit is unused: comments come from source
+        pipeline = self._complaints_pipeline(
+            subreddit, None, 0, on_report_delta=on_report_delta,
+            source=lambda: self.corpus.load_comments(subreddit, since, until, limit))
+        with collect("analyze_corpus") as usage:
+            result = pipeline.run()
+        return self._complaints_result(result, usage)
+
+    async def aanalyze_reddit_complaints(self,
+                                         subreddit: str,
+                                         search_query: Optional[str] = None,
+                                         limit: int = 100,
+                                         incremental: bool = False,
+                                         on_report_delta: Optional[Callable[[str], None]] = None,
+                                         skip_empty: bool = False) -> Dict:
+        """
+        Async variant of analyze_reddit_complaints, for callers that already
+        run an event loop
+        """
+        with collect("analyze_reddit_complaints") as usage:
+            comments, new = None, None
+            if incremental:
+                comments, new = await self._in_executor(
+                    self._new_comments, subreddit, search_query, limit)
+                if skip_empty and not len(comments):
+                    await self._in_executor(new.mark_seen, self.comment_store, 0)
+                    return self._skipped_result(usage)
+            pipeline = self._complaints_pipeline(
+                subreddit, search_query, limit, on_report_delta, comments=comments)
+            result = await pipeline.arun()
+        if new is not None:
+            await self._in_executor(new.mark_seen, self.comment_store, len(comments))
+        output = self._complaints_result(result, usage)
+        await self._in_executor(self._archive, subreddit, search_query, result, output)
+        return output
+
+    async def aiter_analyze_many(self,
+                                 subreddits: Sequence[str],
+                                 search_query: Optional[str] = None,
+                                 limit: int = 100,
+                                 max_concurrency: int = 4,
+                                 incremental: bool = False) -> AsyncIterator[Tuple[str, Dict]]:
+        """
+        Analyze several subreddits concurrently, yielding (subreddit, result)
+        pairs in completion order. At most max_concurrency analyses run at once;
+        a failed subreddit yields {"error": ...} instead of stopping the batch.
+        Subreddits are analyzed once each, however often (or in whatever case)
+        they are listed.
+        """
+        semaphore = asyncio.Semaphore(max_concurrency)
+
+        async def analyze_one(subreddit: str) -> Tuple[str, Dict]:
+            async with semaphore:
+                try:
+                    return subreddit, await self.aanalyze_reddit_complaints(
+                        subreddit, search_query, limit, incremental)
+                except Exception as e:
+                    print(f"Error analyzing r/{subreddit}: {e}")
+                    return subreddit, {"error": str(e)}
+
+        tasks = [asyncio.ensure_future(analyze_one(subreddit))
+                 for subreddit in _unique_subreddits(subreddits)]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                yield await next_done
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    def iter_analyze_many(self,
+                          subreddits: Sequence[str],
+                          search_query: Optional[str] = None,
+                          limit: int = 100,
+                          max_concurrency: int = 4,
+                          incremental: bool = False) -> Iterator[Tuple[str, Dict]]:
+        """
+        Synchronous variant of aiter_analyze_many. The analyses run on an event
+        loop in a background thread and results are handed over as they finish.
+        """
+        results: "queue.Queue[Optional[Tuple[str, Dict]]]" = queue.Queue()
+        running: Dict = {}
+        started = threading.Event()
+
+        async def produce() -> None:
+            running["loop"] = asyncio.get_running_loop()
+            running["task"] = asyncio.current_task()
+            started.set()
+            try:
+                async for item in self.aiter_analyze_many(
+                        subreddits, search_query, limit, max_concurrency, incremental):
+                    results.put(item)
+            finally:
+                results.put(None)
+
+        def run() -> None:
+            try:
+                run_async(produce())
+            except asyncio.CancelledError:
+                pass
+
+        # The copied context lets the caller's llm_metrics.collect() see these calls
+        worker = threading.Thread(target=contextvars.copy_context().run, args=(run,), daemon=True)
+        worker.start()
+        try:
+            while True:
+                item = results.get()
+                if item is None:
+                    break
+                yield item
+        finally:
+            # Consumer stopped early: cancel the analyses still in flight, once
+            # the worker's loop is up (it may not have started yet)
+            while worker.is_alive():
+                if started.wait(0.05):
+                    try:
+                        running["loop"].call_soon_threadsafe(running["task"].cancel)
+                    except RuntimeError:  # the loop finished in the meantime
+                        pass
+                    break
+
+    def _aggregate_many(self, results: Dict[str, Dict]) -> Dict:
+        summaries = "\n\n".join(
+            f"r/{subreddit}:\n{result['summary']}"
+            for subreddit, result in results.items() if "summary" in result
         )
-        
-        # Step 5: Generate final report
-        final_report = self.writer.write(
-            f"Reddit Analysis: {analysis}\nSummary: {summary}",
-            deeper_insights
+        insights = self.analyst.analyze(
+            "Which problems are shared across communities, and which are specific to one? "
+            f"Base your answer on these summaries of Reddit complaints from {len(results)} "
+            f"subreddits:\n\n{summaries}"
         )
-        
-        return {
-            "raw_comments": comments,
-            "detailed_analysis": analysis,
-            "summary": summary,
-            "insights": deeper_insights,
-            "final_report": final_report
-        } 
+        final_report = self.writer.write(f"Cross-Subreddit Summaries: {summaries}", insights)
+        return {"insights": insights, "final_report": final_report}
 
-    def discover_subreddits(self, topic: str, limit: int = 25) -> Dict:
+    def analyze_many(self,
+                     subreddits: Sequence[str],
+                     search_query: Optional[str] = None,
+                     limit: int = 100,
+                     max_concurrency: int = 4,
+                     incremental: bool = False,
+                     aggregate: bool = False,
+                     on_result: Optional[Callable[[str, Dict], None]] = None) -> Dict:
         """
-        Find and analyze relevant subreddits for a given topic
+        Analyze complaints across several subreddits concurrently.
+
+        on_result is called with each subreddit's result as soon as it finishes.
+        With aggregate=True the per-subreddit summaries are combined into a
+        cross-subreddit report at the end.
         """
+        subreddits = _unique_subreddits(subreddits)
+        results: Dict[str, Dict] = {}
+        with collect("analyze_many") as usage:
+            for subreddit, result in self.iter_analyze_many(
+                    subreddits, search_query, limit, max_concurrency, incremental):
+                results[subreddit] = result
+                if on_result is not None:
+                    on_result(subreddit, result)
+
+            # Report in the order the subreddits were given
+            output: Dict = {"results": {subreddit: results[subreddit] for subreddit in subreddits}}
+            if aggregate:
+                output["aggregate"] = self._aggregate_many(results)
+        output["llm_usage"] = usage.to_dict()
+        return output
+
+    def _discovery_pipeline(self,
+                            topic: str,
+                            limit: int,
+                            on_report_delta: Optional[Callable[[str], None]] = None) -> Pipeline:
         # Initialize the discovery agent
         discovery_agent = SubredditDiscoveryAgent(self.api_key, self.llm)
-        
-        # Get search terms
-        search_terms = discovery_agent.suggest_search_terms(topic)
-        
-        # Search for subreddits using each term
-        all_subreddits = []
-        seen_subreddits = set()
-        
-        for term in search_terms:
-            results = self.reddit_scraper.search_subreddits(term, limit=limit)
-            for sub in results:
-                if sub['name'] not in seen_subreddits:
-                    all_subreddits.append(sub)
-                    seen_subreddits.add(sub['name'])
-        
-        # Analyze the found subreddits
-        analysis = discovery_agent.analyze_subreddits(topic, all_subreddits)
-        
+        pipeline = Pipeline("discover_subreddits")
+
+        # Merge per-term results, keeping the first occurrence of each subreddit
+        def merge_subreddits(term_results: List[List[Dict]]) -> List[Dict]:
+            all_subreddits = []
+            seen_subreddits = set()
+            for results in term_results:
+                for sub in results:
+                    if sub['name'].lower() not in seen_subreddits:
+                        all_subreddits.append(sub)
+                        seen_subreddits.add(sub['name'].lower())
+            return all_subreddits
+
         # Get additional insights
-        deeper_insights = self.analyst.analyze(
-            f"Based on this analysis of subreddits related to '{topic}':\n\n"
-            f"{analysis}\n\n"
-            "What additional patterns or insights can you identify about these communities?"
-        )
-        
-        # Generate final report
-        final_report = self.writer.write(
-            f"Subreddit Discovery Analysis: {analysis}",
-            deeper_insights
-        )
-        
+        async def deeper_insights(analysis: str) -> str:
+            return await self.analyst.aanalyze(
+                "What additional patterns or insights can you identify about the communities "
+                "in this analysis of subreddits related to the topic below?\n\n"
+                f"Topic: {topic}\n\n"
+                f"{analysis}"
+            )
+
+        # Generate final report, streamed
+        async def final_report(analysis: str, insights: str) -> AsyncTokenStream:
+            return await self._consume_report(self.writer.awrite_stream(
+                f"Subreddit Discovery Analysis: {analysis}",
+                insights
+            ), on_report_delta)
+
+        # Get search terms
+        pipeline.add_step(
+            "search_terms", partial(discovery_agent.asuggest_search_terms, topic))
+        # Search for subreddits using each term, all terms at once (cached)
+        pipeline.add_step(
+            "term_results",
+            lambda term: self.discovery.search(term, limit=limit),
+            deps=["search_terms"],
+            map_over="search_terms")
+        pipeline.add_step("seed_subreddits", merge_subreddits, deps=["term_results"])
+        # Follow related-subreddit links out from the search results
+        pipeline.add_step(
+            "subreddits",
+            lambda seed_subreddits: self.discovery.expand(seed_subreddits),
+            deps=["seed_subreddits"])
+        # Pre-rank locally so the prompt stays small however many were found
+        pipeline.add_step(
+            "ranked_subreddits",
+            lambda subreddits: self.subreddit_ranker.rank(topic, subreddits),
+            deps=["subreddits"])
+        # Analyze the most relevant subreddits
+        async def analyze(ranked_subreddits: List[Dict]) -> str:
+            return await discovery_agent.aanalyze_subreddits(topic, ranked_subreddits)
+
+        pipeline.add_step("analysis", analyze, deps=["ranked_subreddits"])
+        pipeline.add_step("insights", deeper_insights, deps=["analysis"])
+        pipeline.add_step("final_report", final_report, deps=["analysis", "insights"])
+        return pipeline
+
+    def _discovery_result(self, result: PipelineResult, usage: RunMetrics) -> Dict:
+        outputs = result.outputs
         return {
-            "search_terms_used": search_terms,
-            "subreddits_found": all_subreddits,
-            "analysis": analysis,
-            "insights": deeper_insights,
-            "final_report": final_report
-        } 
\ No newline at end of file
+            "search_terms_used": outputs["search_terms"],
+            "subreddits_found": outputs["subreddits"],
+            "subreddits_analyzed": outputs["ranked_subreddits"],
+            "analysis": outputs["analysis"],
+            "insights": outputs["insights"],
+            "final_report": outputs["final_report"].text,
+            "report_time_to_first_token": outputs["final_report"].time_to_first_token,
+            "step_timings": result.timings_dict(),
+            "llm_usage": usage.to_dict()
+        }
+
+    def discover_subreddits(self,
+                            topic: str,
+                            limit: int = 25,
+                            on_report_delta: Optional[Callable[[str], None]] = None) -> Dict:
+        """
+        Find and analyze relevant subreddits for a given topic
+        """
+        pipeline = self._discovery_pipeline(topic, limit, on_report_delta)
+        with collect("discover_subreddits") as usage:
+            result = pipeline.run()
+        return self._discovery_result(result, usage)
+
+    async def adiscover_subreddits(self,
+                                   topic: str,
+                                   limit: int = 25,
+                                   on_report_delta: Optional[Callable[[str], None]] = None) -> Dict:
+        """
+        Async variant of discover_subreddits
+        """
+        pipeline = self._discovery_pipeline(topic, limit, on_report_delta)
+        with collect("discover_subreddits") as usage:
+            result = await pipeline.arun()
+        return self._discovery_result(result, usage)
@@ -0,0 +1,293 @@
+import asyncio
+import threading
+import time
+from typing import Dict, List, Optional
+
+import pytest
+
+import llms
+from cassette import Cassette
+from comment_store import CommentStore
+from coordinator import AgentCoordinator
+from llm_batch import BatchLLM
+from llm_policy import LLMUnavailableError
+from llms import BaseLLM, OpenAI, OpenAIModel
+from preprocessing import CommentPreprocessor
+from records import Comment, Post
+from reddit_utils import NewComments
+
+
+def make_comments(subreddit: str, count: int = 3, start: float = 100.0) -> List[Comment]:
+    return [Comment(f"{subreddit}-{i}", "s1", subreddit,
+                    f"the app in r/{subreddit} keeps crashing when I open it, issue number {i}",
+                    "someone", 1, start + i)
+            for i in range(count)]
+
+
+class FakeScraper:
+    def __init__(self, comments: Dict[str, List[Comment]]) -> None:
+        self.comments = comments
+
+    def iter_subreddit_comments(self, subreddit_name: str, time_filter: str = "week",
+                                limit: int = 100) -> List[Comment]:
+        return self.comments.get(subreddit_name, [])[:limit]
+
+    def iter_search_subreddit_comments(self, subreddit_name: str, search_query: str,
+                                       limit: int = 100) -> List[Comment]:
+        return self.comments.get(subreddit_name, [])[:limit]
+
+    def get_posts(self, subreddit_name: str, submission_ids) -> List[Post]:
+        return [Post(submission_id, subreddit_name, f"Thread {submission_id}", "op", 1, 3, "", "",
+                     100.0)
+                for submission_id in dict.fromkeys(submission_ids)]
+
+    def fetch_new_comments(self, store: CommentStore, subreddit_name: str,
+                           search_query: Optional[str] = None,
+                           time_filter: str = "week") -> NewComments:
+        comments = self.comments.get(subreddit_name, [])
+        known = store.known_ids(c.id for c in comments)
+        return NewComments(subreddit_name, search_query,
+                           [c for c in comments if c.id not in known], {})
+
+
+class StubLLM(BaseLLM):
+    """Echoes which subreddits a prompt mentions; delays and failures are per subreddit."""
+
+    def __init__(self, delays: Optional[Dict[str, float]] = None, failing: str = "") -> None:
+        super().__init__("fake_key", OpenAIModel.GPT_4_O_MINI)
+        self.delays = delays or {}
+        self.failing = failing
+        self.calls = 0
+        self.active: Dict[str, int] = {}
+        self.max_active = 0
+        self._lock = threading.Lock()
+
+    def _subreddits(self, messages: List[Dict[str, str]]) -> List[str]:
+        prompt = messages[-1]["content"]
+        return sorted({name for name in self.delays if f"r/{name} " in prompt})
+
+    def _call_llm(self, messages: List[Dict[str, str]]) -> str:
+        with self._lock:
+            self.calls += 1
+        return self._answer(self._subreddits(messages))
+
+    async def _acall_llm(self, messages: List[Dict[str, str]]) -> str:
+        subreddits = self._subreddits(messages)
+        with self._lock:
+            self.calls += 1
+        if self.failing and self.failing in subreddits:
+            raise LLMUnavailableError(f"backend down for r/{self.failing}")
+        for name in subreddits:
+            self.active[name] = self.active.get(name, 0) + 1
+        self.max_active = max(self.max_active, sum(1 for n in self.active.values() if n))
+        try:
+            await asyncio.sleep(max((self.delays.get(name, 0.0) for name in subreddits), default=0.0))
+        finally:
+            for name in subreddits:
+                self.active[name] -= 1
+        return self._answer(subreddits)
+
+    def _answer(self, subreddits: List[str]) -> str:
+        # Mentions its subreddits the same way, so later stages see them too
+        return "findings about " + "".join(f"r/{name} " for name in subreddits)
+
+
+@pytest.fixture
+def make_coordinator(tmp_path):
+    coordinators = []
+
+    def make(llm: BaseLLM, comments: Dict[str, List[Comment]], **kwargs) -> AgentCoordinator:
+        coordinator = AgentCoordinator("fake_key", "fake_id", "fake_secret", llm=llm,
+                                       scraper_workers=1, **kwargs)
+        coordinator.reddit_scraper = FakeScraper(comments)
+        coordinators.append(coordinator)
+        return coordinator
+
+    yield make
+    for coordinator in coordinators:
+        coordinator.close()
+        if coordinator.comment_store is not None:
+            coordinator.comment_store.close()
+
+
+def test_analyze_many_yields_in_completion_order_within_the_cap(make_coordinator):
+    delays = {"slow": 0.2, "medium": 0.1, "fast": 0.0, "other": 0.0}
+    llm = StubLLM(delays)
+    coordinator = make_coordinator(llm, {name: make_comments(name) for name in delays})
+
+    order = [subreddit for subreddit, _ in
+             coordinator.iter_analyze_many(list(delays), max_concurrency=2)]
+
+    # slow and medium take both slots; the quick ones run in medium's slot
+    # and all finish while slow is still going
+    assert order == ["medium", "fast", "other", "slow"]
+    assert llm.max_active <= 2
+
+
+def test_analyze_many_dedupes_and_reports_errors(make_coordinator):
+    llm = StubLLM({"python": 0.0, "broken": 0.0}, failing="broken")
+    coordinator = make_coordinator(
+        llm, {name: make_comments(name) for name in ("python", "broken")})
+    seen = []
+
+    output = coordinator.analyze_many(["python", "broken", "Python", "python"], aggregate=True,
+                                      on_result=lambda subreddit, result: seen.append(subreddit))
+
+    assert sorted(seen) == ["broken", "python"]
+    assert list(output["results"]) == ["python", "broken"]
+    assert "backend down" in output["results"]["broken"]["error"]
+    assert output["results"]["python"]["summary"] == "findings about r/python "
+    assert set(output["aggregate"]) == {"insights", "final_report"}
+    assert output["llm_usage"]["totals"]["calls"] > 0
+
+
+def test_stopping_early_cancels_the_analyses_in_flight(make_coordinator):
+    names = [f"sub{i}" for i in range(8)]
+    delays = {name: 0.2 for name in names}
+    delays["sub0"] = 0.0
+    llm = StubLLM(delays)
+    coordinator = make_coordinator(llm, {name: make_comments(name) for name in names})
+
+    stream = coordinator.iter_analyze_many(names, max_concurrency=3)
+    first, _ = next(stream)
+    stream.close()
+    time.sleep(0.1)
+    calls = llm.calls
+    time.sleep(0.5)
+
+    assert first == "sub0"
+    # Cancelled analyses make no further LLM calls, and the rest never start
+    assert llm.calls == calls
+    assert calls < 4 * len(names) / 2
+    assert all(count == 0 for count in llm.active.values())
+
+
+def test_a_cassette_only_routes_llm_traffic_while_entered(make_coordinator, tmp_path):
+    cassette = Cassette(str(tmp_path / "run.cassette.gz"), "record")
+
+    make_coordinator(StubLLM(), {}, cassette=cassette)
+    assert llms._HTTP_TRANSPORT is None
+
+    with cassette:
+        make_coordinator(StubLLM(), {}, cassette=cassette)
+        assert llms._HTTP_TRANSPORT is not None
+    assert llms._HTTP_TRANSPORT is None
+
+
+def test_analyses_round_trip_through_the_corpus(make_coordinator, tmp_path):
+    pytest.importorskip("pyarrow")
+    from corpus import Corpus
+
+    corpus = Corpus(str(tmp_path / "corpus"))
+    comments = make_comments("python")
+    coordinator = make_coordinator(StubLLM({"python": 0.0}), {"python": comments}, corpus=corpus)
+    archive_threads = []
+    export_comments = corpus.export_comments
+
+    def recording_export(batch):
+        archive_threads.append(threading.current_thread())
+        return export_comments(batch)
+
+    corpus.export_comments = recording_export
+
+    scraped = coordinator.analyze_reddit_complaints("python")
+    archived = asyncio.run(coordinator.aanalyze_reddit_complaints("python"))
+
+    assert "corpus_error" not in scraped and "corpus_error" not in archived
+    # The async path archives off the event loop
+    assert archive_threads[0] is threading.main_thread()
+    assert archive_threads[1] is not threading.main_thread()
+    assert [c.id for c in corpus.load_comments("python")] == [c.id for c in comments]
+    assert [post.id for post in corpus.load_posts("python")] == ["s1"]
+    runs = corpus.load_analyses("python")
+    assert {run["run_id"] for run in runs} == {scraped["corpus_run_id"], archived["corpus_run_id"]}
+    assert runs[0]["summary"] == scraped["summary"]
+
+    replayed = coordinator.analyze_corpus("python")
+    assert replayed["raw_comments"] == scraped["raw_comments"]
+    assert replayed["summary"] == scraped["summary"]
+    assert "corpus_run_id" not in replayed
+
+
+def test_archive_failures_are_reported_with_the_result(make_coordinator, tmp_path):
+    pytest.importorskip("pyarrow")
+    from corpus import Corpus
+
+    corpus = Corpus(str(tmp_path / "corpus"))
+    coordinator = make_coordinator(StubLLM({"python": 0.0}), {"python": make_comments("python")},
+                                   corpus=corpus)
+
+    def fail(*args, **kwargs):
+        raise OSError("disk full")
+
+    corpus.export_posts = fail
+
+    result = coordinator.analyze_reddit_complaints("python")
+
+    assert result["corpus_error"] == "disk full"
+    assert result["summary"] == "findings about r/python "
+    assert "corpus_run_id" not in result
+
+
+def test_a_failed_incremental_run_leaves_its_comments_for_the_next(make_coordinator, tmp_path):
+    comments = make_comments("python")
+    llm = StubLLM({"python": 0.0}, failing="python")
+    coordinator = make_coordinator(llm, {"python": comments},
+                                   comment_store=CommentStore(str(tmp_path / "comments.db")))
+
+    def run() -> Dict:
+        return asyncio.run(coordinator.aanalyze_reddit_complaints(
+            "python", incremental=True, skip_empty=True))
+
+    with pytest.raises(LLMUnavailableError):
+        run()
+    assert coordinator.comment_store.known_ids(c.id for c in comments) == set()
+
+    llm.failing = ""
+    retried = run()
+    assert not retried.get("skipped")
+    assert len(retried["raw_comments"]) == len(comments)
+    assert run()["skipped"] is True
+
+
+def test_batch_mode_maps_job_results_back_to_the_pipeline(make_coordinator):
+    from llm_batch_test import start_fake_server
+
+    server, base_url = start_fake_server()
+    try:
+        llm = BatchLLM(OpenAI("fake_key", OpenAIModel.GPT_4_O_MINI, base_url=base_url),
+                       max_wait=0.05, poll_interval=0.01)
+        coordinator = make_coordinator(
+            llm, {name: make_comments(name) for name in ("python", "rust")})
+
+        output = coordinator.analyze_many(["python", "rust"])
+
+        for subreddit in ("python", "rust"):
+            result = output["results"][subreddit]
+            assert result["summary"].startswith("answer to ")
+            assert result["final_report"].startswith("answer to ")
+        # Both subreddits' concurrent steps share jobs, and usage is the jobs' own
+        calls = output["llm_usage"]["totals"]["calls"]
+        assert len(server.batches) < calls
+        assert output["llm_usage"]["totals"]["prompt_tokens"] == 11 * calls
+
+        coordinator.close()
+        with pytest.raises(RuntimeError):
+            llm.submit([{"role": "user", "content": "too late"}])
+    finally:
+        server.shutdown()
+
+
+def test_closing_the_coordinator_shuts_down_the_preprocessor_pool():
+    comments = make_comments("python", count=30)
+    with AgentCoordinator("fake_key", "fake_id", "fake_secret", llm=StubLLM(),
+                          preprocessor=CommentPreprocessor(max_workers=1, batch_size=10),
+                          scraper_workers=1) as coordinator:
+        coordinator.reddit_scraper = FakeScraper({"python": comments})
+        coordinator.analyze_reddit_complaints("python")
+        executor = coordinator.preprocessor._executor
+        assert executor is not None
+
+    assert coordinator.preprocessor._executor is None
+    with pytest.raises(RuntimeError):
+        executor.submit(print)
@@ -0,0 +1,243 @@
+"""
+Columnar archive of scraped comments, posts and analysis results.
+
+Each kind is a hive-partitioned dataset under root, one directory per
+subreddit and UTC day:
+
+    root/comments/subreddit=python/date=2024-05-01/part-<run>-0.parquet
+    root/posts/...
+    root/analyses/...
+
+Files are Parquet (compact, the default) or Arrow IPC (format="arrow",
+larger but read back without decoding). Reads are lazy: filters on subreddit
+and date skip whole directories, files are memory-mapped, and comment
+columns become CommentBatch columns without copying the text.
+"""
+import json
+import os
+import time
+import uuid
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Union
+
+import numpy as np
+
+from records import Comment, CommentBatch, Post, StringColumn
+
+try:
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+    import pyarrow.fs as pafs
+except ImportError:  # pyarrow is optional; only needed to export and import corpora
+    pa = None
+
+_FORMATS = {"parquet": ("parquet", "parquet"), "arrow": ("ipc", "arrow")}
+_ANALYSIS_TEXT = ("summary", "detailed_analysis", "insights", "final_report")
+
+
+def _days(created_utc: np.ndarray) -> np.ndarray:
+    """UTC calendar day of each timestamp, as YYYY-MM-DD strings."""
+    return np.asarray(created_utc, dtype="datetime64[s]").astype("datetime64[D]").astype(str)
+
+
+def _day(timestamp: float) -> str:
+    return str(_days(np.array([timestamp]))[0])
+
+
+def _string_array(column: StringColumn) -> "pa.Array":
+    offsets = np.ascontiguousarray(column.offsets - column.offsets[0], dtype=np.int64)
+    first, last = int(column.offsets[0]), int(column.offsets[-1])
+    return pa.LargeStringArray.from_buffers(
+        len(column), pa.py_buffer(offsets), pa.py_buffer(column.buffer[first:last]))
+
+
+def _string_column(array: "pa.Array") -> StringColumn:
+    """View an Arrow string array as a StringColumn, sharing its buffers."""
+    if pa.types.is_dictionary(array.type):
+        array = array.cast(pa.string())
+    if array.null_count:
+        array = array.fill_null("")
+    _, offsets, data = array.buffers()
+    dtype = np.int64 if pa.types.is_large_string(array.type) else np.int32
+    offsets = np.frombuffer(offsets, dtype=dtype)[array.offset:array.offset + len(array) + 1]
+    return StringColumn(memoryview(data).cast("B") if data is not None else b"", offsets)
+
+
+def batch_to_arrow(batch: CommentBatch) -> "pa.Table":
+    """A CommentBatch as an Arrow table; the text buffers are shared, not copied."""
+    columns = {name: _string_array(batch.columns[name]) for name in CommentBatch._STRINGS}
+    columns["score"] = pa.array(batch.score)
+    columns["created_utc"] = pa.array(batch.created_utc)
+    return pa.table(columns)
+
+
+def _arrays(table: Union["pa.Table", "pa.RecordBatch"]) -> Dict[str, "pa.Array"]:
+    if isinstance(table, pa.RecordBatch):
+        return dict(zip(table.schema.names, table.columns))
+    table = table.combine_chunks()
+    return {name: column.chunk(0) if column.num_chunks else pa.array([], column.type)
+            for name, column in zip(table.column_names, table.columns)}
+
+
+def arrow_to_batch(table: Union["pa.Table", "pa.RecordBatch"]) -> CommentBatch:
+    """The comment columns of an Arrow table as a CommentBatch, without copying the text."""
+    arrays = _arrays(table)
+    return CommentBatch(
+        {name: _string_column(arrays[name]) for name in CommentBatch._STRINGS},
+        arrays["score"].to_numpy(zero_copy_only=False).astype(np.int64, copy=False),
+        arrays["created_utc"].to_numpy(zero_copy_only=False).astype(np.float64, copy=False))
+
+
+class Corpus:
+    """Writes and lazily reads back a partitioned archive rooted at root."""
+
+    def __init__(self, root: str, format: str = "parquet"):
+        if pa is None:
+            raise ImportError("pyarrow is not installed")
+        if format not in _FORMATS:
+            raise ValueError(f"Unknown corpus format {format!r}, expected one of {sorted(_FORMATS)}")
+        self.root = root
+        self.format, self.extension = _FORMATS[format]
+        self._partitioning = ds.partitioning(
+            pa.schema([("subreddit", pa.string()), ("date", pa.string())]), flavor="hive")
+        self._filesystem = pafs.LocalFileSystem(use_mmap=True)
+
+    def _write(self, kind: str, table: "pa.Table") -> int:
+        if table.num_rows == 0:
+            return 0
+        table = table.append_column("date", pa.array(_days(table.column("created_utc").to_numpy())))
+        ds.write_dataset(
+            table, os.path.join(self.root, kind), format=self.format,
+            partitioning=self._partitioning,
+            # A unique name per export, so later exports add files instead of replacing them
+            basename_template=f"part-{uuid.uuid4().hex}-{{i}}.{self.extension}",
+            existing_data_behavior="overwrite_or_ignore")
+        return table.num_rows
+
+    def _dataset(self, kind: str) -> Optional["ds.Dataset"]:
+        path = os.path.join(self.root, kind)
+        if not os.path.isdir(path):
+            return None
+        return ds.dataset(path, format=self.format, partitioning=self._partitioning,
+                          filesystem=self._filesystem)
+
+    def _filter(self,
+                subreddit: Optional[str],
+                since: Optional[float],
+                until: Optional[float]) -> Optional["ds.Expression"]:
+        conditions = []
+        if subreddit is not None:
+            conditions.append(ds.field("subreddit") == subreddit)
+        if since is not None:
+            # The date conditions prune directories; created_utc is exact
+            conditions += [ds.field("date") >= _day(since), ds.field("created_utc") >= since]
+        if until is not None:
+            conditions += [ds.field("date") <= _day(until), ds.field("created_utc") < until]
+        if not conditions:
+            return None
+        expression = conditions[0]
+        for condition in conditions[1:]:
+            expression = expression & condition
+        return expression
+
+    def export_comments(self, comments: Union[CommentBatch, Iterable[Comment]]) -> int:
+        """Append comments to the archive. Returns how many were written."""
+        if not isinstance(comments, CommentBatch):
+            comments = CommentBatch.from_comments(comments)
+        return self._write("comments", batch_to_arrow(comments))
+
+    def export_posts(self, posts: Sequence[Post]) -> int:
+        columns = {name: [getattr(post, name) for post in posts] for name in Post.__slots__}
+        return self._write("posts", pa.table(columns))
+
+    def export_analysis(self,
+                        subreddit: str,
+                        result: Dict[str, Any],
+                        search_query: Optional[str] = None,
+                        created_utc: Optional[float] = None) -> str:
+        """
+        Archive an analyze_reddit_complaints result (without its raw comments,
+        which belong in export_comments). Returns the run id.
+        """
+        run_id = uuid.uuid4().hex
+        details = {key: value for key, value in result.items()
+                   if key not in _ANALYSIS_TEXT and key != "raw_comments"}
+        row = {
+            "run_id": [run_id],
+            "subreddit": [subreddit],
+            "search_query": [search_query or ""],
+            "created_utc": [created_utc if created_utc is not None else time.time()],
+            **{key: [result.get(key) or ""] for key in _ANALYSIS_TEXT},
+            "details": [json.dumps(details, default=str)],
+        }
+        self._write("analyses", pa.table(row))
+        return run_id
+
+    def iter_comment_batches(self,
+                             subreddit: Optional[str] = None,
+                             since: Optional[float] = None,
+                             until: Optional[float] = None) -> Iterator[CommentBatch]:
+        """
+        Stream archived comments (since <= created_utc < until) one Arrow record
+        batch at a time, in storage order, so history larger than memory can be reprocessed.
+        """
+        dataset = self._dataset("comments")
+        if dataset is None:
+            return
+        columns = list(CommentBatch._STRINGS) + ["score", "created_utc"]
+        for record_batch in dataset.to_batches(columns=columns,
+                                               filter=self._filter(subreddit, since, until)):
+            if record_batch.num_rows:
+                yield arrow_to_batch(record_batch)
+
+    def load_comments(self,
+                      subreddit: Optional[str] = None,
+                      since: Optional[float] = None,
+                      until: Optional[float] = None,
+                      limit: Optional[int] = None) -> CommentBatch:
+        """
+        Archived comments oldest first, each id once even if exported several
+        times, capped at limit (the newest are dropped).
+        """
+        dataset = self._dataset("comments")
+        if dataset is None:
+            return CommentBatch.from_comments([])
+        columns = list(CommentBatch._STRINGS) + ["score", "created_utc"]
+        table = dataset.to_table(columns=columns, filter=self._filter(subreddit, since, until))
+        if table.num_rows:
+            ids = table.column("id").to_numpy(zero_copy_only=False)
+            _, first = np.unique(ids, return_index=True)
+            if len(first) < table.num_rows:
+                table = table.take(np.sort(first))
+            table = table.sort_by("created_utc")
+        if limit is not None:
+            table = table.slice(0, limit)
+        return arrow_to_batch(table)
+
+    def load_posts(self,
+                   subreddit: Optional[str] = None,
+                   since: Optional[float] = None,
+                   until: Optional[float] = None) -> List[Post]:
+        """Archived posts oldest first, each id once even if exported by several runs."""
+        dataset = self._dataset("posts")
+        if dataset is None:
+            return []
+        table = dataset.to_table(columns=list(Post.__slots__),
+                                 filter=self._filter(subreddit, since, until))
+        posts = {row["id"]: Post(**row) for row in reversed(table.to_pylist())}
+        return sorted(posts.values(), key=lambda post: post.created_utc)
+
+    def load_analyses(self,
+                      subreddit: Optional[str] = None,
+                      since: Optional[float] = None,
+                      until: Optional[float] = None) -> List[Dict[str, Any]]:
+        """Archived analysis results oldest first, with their details unpacked."""
+        dataset = self._dataset("analyses")
+        if dataset is None:
+            return []
+        table = dataset.to_table(filter=self._filter(subreddit, since, until))
+        analyses = []
+        for row in table.sort_by("created_utc").to_pylist():
+            details = json.loads(row.pop("details"))
+            row.pop("date", None)
+            analyses.append({**details, **row})
+        return analyses
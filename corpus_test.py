@@ -0,0 +1,59 @@
+import os
+
+import pytest
+
+pytest.importorskip("pyarrow")
+
+from corpus import Corpus  # noqa: E402
+from records import Comment, Post  # noqa: E402
+
+DAY = 86400.0
+
+
+def make_comments(subreddit: str, n: int, start: float = 1_700_000_000.0) -> list:
+    return [Comment(f"{subreddit}{i}", f"s{i // 4}", subreddit, f"comment {i} in r/{subreddit} ✓",
+                    f"user{i}", i, start + i * DAY / 2)
+            for i in range(n)]
+
+
+@pytest.mark.parametrize("format", ["parquet", "arrow"])
+def test_comments_round_trip_partitioned_by_subreddit_and_day(tmp_path, format):
+    corpus = Corpus(str(tmp_path), format)
+    python, rust = make_comments("python", 8), make_comments("rust", 3)
+    assert corpus.export_comments(python + rust) == 11
+    corpus.export_comments(python[:2])  # exported again by a later run
+
+    assert sorted(os.listdir(tmp_path / "comments")) == ["subreddit=python", "subreddit=rust"]
+    assert len(os.listdir(tmp_path / "comments" / "subreddit=python")) == 5  # 8 half-days
+
+    loaded = corpus.load_comments("python")
+    assert list(loaded) == python
+    window = corpus.load_comments("python", since=python[2].created_utc, until=python[5].created_utc)
+    assert [c.id for c in window] == ["python2", "python3", "python4"]
+    assert len(corpus.load_comments(limit=5)) == 5
+    assert sum(len(batch) for batch in corpus.iter_comment_batches("rust")) == 3
+
+
+def test_posts_and_analyses_round_trip(tmp_path):
+    corpus = Corpus(str(tmp_path))
+    post = Post("p1", "python", "Title", "author", 10, 3, "https://example.com", "text",
+                1_700_000_000.0)
+    corpus.export_posts([post])
+    run_id = corpus.export_analysis(
+        "python", {"summary": "s", "detailed_analysis": "d", "insights": "i",
+                   "final_report": "r", "raw_comments": ["x"], "step_timings": {"a": 1.0}},
+        search_query="bug")
+
+    assert corpus.load_posts("python") == [post]
+    [analysis] = corpus.load_analyses("python")
+    assert analysis["run_id"] == run_id
+    assert analysis["summary"] == "s" and analysis["search_query"] == "bug"
+    assert analysis["step_timings"] == {"a": 1.0}
+    assert "raw_comments" not in analysis
+
+
+def test_empty_corpus_loads_nothing(tmp_path):
+    corpus = Corpus(str(tmp_path / "missing"))
+    assert len(corpus.load_comments()) == 0
+    assert list(corpus.iter_comment_batches()) == []
+    assert corpus.load_analyses() == []
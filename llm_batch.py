@@ -0,0 +1,191 @@
+import asyncio
+import itertools
+import json
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Dict, List, Optional, Tuple
+
+from openai.types import CompletionUsage
+
+from llm_metrics import record_usage
+from llms import BaseLLM, ReasoningEffort, _OpenAICompatibleLLM
+
+BATCH_ENDPOINT = "/v1/chat/completions"
+TERMINAL_STATUSES = ("completed", "failed", "expired", "cancelled")
+
+
+class BatchJobError(Exception):
+    """A batch job, or one request inside it, did not produce a completion."""
+
+
+class BatchLLM(BaseLLM):
+    """
+    Submits completions through the provider's Batch API instead of one
+    request at a time.
+
+    Calls from any number of threads or coroutines are queued; once
+    max_batch_size requests are waiting, or max_wait seconds after the first
+    one arrived, the queue is written out as a JSONL batch job, submitted, and
+    polled until it finishes. Each caller blocks (or awaits) until its own
+    result has been mapped back by custom_id, with the usage the job reported
+    for it. Suited to overnight bulk runs where cost and throughput matter
+    more than latency. close() it when done, e.g. through AgentCoordinator.close().
+    """
+
+    def __init__(self,
+                 backend: _OpenAICompatibleLLM,
+                 max_batch_size: int = 1000,
+                 max_wait: float = 10.0,
+                 poll_interval: float = 30.0,
+                 completion_window: str = "24h") -> None:
+        super().__init__(backend.api_key, backend.model)
+        self.backend = backend
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.poll_interval = poll_interval
+        self.completion_window = completion_window
+
+        self._pending: List[Tuple[str, Dict[str, Any], "Future[Tuple[str, Any]]"]] = []
+        self._first_pending_at: Optional[float] = None
+        self._ids = itertools.count()
+        self._cond = threading.Condition()
+        self._collector: Optional[threading.Thread] = None
+        self._closed = False
+
+    @property
+    def reasoning_effort(self) -> ReasoningEffort:
+        return getattr(self.backend, "reasoning_effort", ReasoningEffort.NONE)
+
+    def _enqueue(self, messages: List[Dict[str, str]]) -> "Future[Tuple[str, Any]]":
+        future: "Future[Tuple[str, Any]]" = Future()
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("BatchLLM is closed")
+            custom_id = f"request-{next(self._ids)}"
+            self._pending.append((custom_id, self.backend._completion_kwargs(messages), future))
+            if self._first_pending_at is None:
+                self._first_pending_at = time.monotonic()
+            if self._collector is None or not self._collector.is_alive():
+                self._collector = threading.Thread(target=self._collect, daemon=True)
+                self._collector.start()
+            self._cond.notify_all()
+        return future
+
+    def submit(self, messages: List[Dict[str, str]]) -> "Future[str]":
+        """Queue one completion and return a future for its text."""
+        text: "Future[str]" = Future()
+
+        def done(result: "Future[Tuple[str, Any]]") -> None:
+            error = result.exception()
+            if error is not None:
+                text.set_exception(error)
+            else:
+                text.set_result(result.result()[0])
+
+        self._enqueue(messages).add_done_callback(done)
+        return text
+
+    def _call_llm(self, messages: List[Dict[str, str]]) -> str:
+        text, usage = self._enqueue(messages).result()
+        record_usage(usage)
+        return text
+
+    async def _acall_llm(self, messages: List[Dict[str, str]]) -> str:
+        text, usage = await asyncio.wrap_future(self._enqueue(messages))
+        record_usage(usage)
+        return text
+
+    def flush(self) -> None:
+        """Submit whatever is queued now instead of waiting for max_wait."""
+        with self._cond:
+            if self._pending:
+                self._first_pending_at = float("-inf")
+                self._cond.notify_all()
+
+    def close(self) -> None:
+        """Flush the queue and refuse new requests."""
+        with self._cond:
+            self._closed = True
+        self.flush()
+
+    def _collect(self) -> None:
+        while True:
+            with self._cond:
+                while True:
+                    if not self._pending:
+                        self._collector = None
+                        return
+                    waited = time.monotonic() - self._first_pending_at
+                    if len(self._pending) >= self.max_batch_size or waited >= self.max_wait:
+                        break
+                    self._cond.wait(self.max_wait - waited)
+                items = self._pending[:self.max_batch_size]
+                self._pending = self._pending[self.max_batch_size:]
+                self._first_pending_at = time.monotonic() if self._pending else None
+            # Each job is polled on its own thread so collection keeps going
+            threading.Thread(target=self._run_job, args=(items,), daemon=True).start()
+
+    def _run_job(self, items: List[Tuple[str, Dict[str, Any], "Future[Tuple[str, Any]]"]]) -> None:
+        futures = {custom_id: future for custom_id, _, future in items}
+        try:
+            results = self._execute_batch([(custom_id, body) for custom_id, body, _ in items])
+        except Exception as e:
+            for future in futures.values():
+                future.set_exception(e)
+            return
+
+        for custom_id, future in futures.items():
+            outcome = results.get(custom_id)
+            if outcome is None:
+                future.set_exception(BatchJobError(f"No result returned for {custom_id}"))
+            elif isinstance(outcome, Exception):
+                future.set_exception(outcome)
+            else:
+                future.set_result(outcome)
+
+    def _execute_batch(self, requests: List[Tuple[str, Dict[str, Any]]]) -> Dict[str, Any]:
+        """Run one batch job to completion. Returns custom_id -> (text, usage) or exception."""
+        client = self.backend.client
+        lines = [
+            json.dumps({"custom_id": custom_id, "method": "POST", "url": BATCH_ENDPOINT, "body": body})
+            for custom_id, body in requests
+        ]
+        input_file = client.files.create(
+            file=("batch.jsonl", "\n".join(lines).encode("utf-8")),
+            purpose="batch"
+        )
+        batch = client.batches.create(
+            input_file_id=input_file.id,
+            endpoint=BATCH_ENDPOINT,
+            completion_window=self.completion_window
+        )
+        while batch.status not in TERMINAL_STATUSES:
+            time.sleep(self.poll_interval)
+            batch = client.batches.retrieve(batch.id)
+
+        results: Dict[str, Any] = {}
+        for file_id in (batch.output_file_id, batch.error_file_id):
+            if not file_id:
+                continue
+            for line in client.files.content(file_id).text.splitlines():
+                if line.strip():
+                    custom_id, outcome = self._parse_result_line(json.loads(line))
+                    results[custom_id] = outcome
+
+        if not results and batch.status != "completed":
+            raise BatchJobError(f"Batch {batch.id} ended with status {batch.status}")
+        return results
+
+    def _parse_result_line(self, record: Dict[str, Any]) -> Tuple[str, Any]:
+        custom_id = record["custom_id"]
+        response = record.get("response") or {}
+        if record.get("error") or response.get("status_code") != 200:
+            return custom_id, BatchJobError(f"{custom_id} failed: {record.get('error') or response}")
+        body = response["body"]
+        usage = CompletionUsage.model_validate(body["usage"]) if body.get("usage") else None
+        return custom_id, (body["choices"][0]["message"]["content"], usage)
+
+    def to_string(self) -> str:
+        """Convert the object to a string representation."""
+        return f"Batch API via {self.backend.to_string()}"
@@ -0,0 +1,151 @@
+import asyncio
+import json
+import threading
+from email.parser import BytesParser
+from email.policy import HTTP
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Tuple
+
+from llm_batch import BatchLLM
+from llm_metrics import collect
+from llms import OpenAI, OpenAIModel
+
+
+class FakeBatchServer(ThreadingHTTPServer):
+    request_queue_size = 64
+
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self.files: Dict[str, bytes] = {}
+        self.batches: Dict[str, Dict] = {}
+        self.polls = 0
+        self.lock = threading.Lock()
+
+
+class FakeBatchHandler(BaseHTTPRequestHandler):
+    """Implements just enough of /files and /batches to run a job."""
+
+    server: FakeBatchServer
+
+    def _send_json(self, payload: Dict) -> None:
+        body = json.dumps(payload).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _file_object(self, file_id: str, purpose: str) -> Dict:
+        return {"id": file_id, "object": "file", "bytes": len(self.server.files[file_id]),
+                "created_at": 0, "filename": f"{file_id}.jsonl", "purpose": purpose,
+                "status": "processed"}
+
+    def do_POST(self) -> None:
+        raw = self.rfile.read(int(self.headers["Content-Length"]))
+        with self.server.lock:
+            if self.path.endswith("/files"):
+                message = BytesParser(policy=HTTP).parsebytes(
+                    b"Content-Type: " + self.headers["Content-Type"].encode() + b"\r\n\r\n" + raw)
+                upload = next(part for part in message.iter_parts()
+                              if part.get_param("name", header="content-disposition") == "file")
+                file_id = f"file-{len(self.server.files)}"
+                self.server.files[file_id] = upload.get_payload(decode=True)
+                self._send_json(self._file_object(file_id, "batch"))
+            elif self.path.endswith("/batches"):
+                request = json.loads(raw)
+                batch_id = f"batch-{len(self.server.batches)}"
+                self.server.batches[batch_id] = {
+                    "id": batch_id, "object": "batch", "endpoint": request["endpoint"],
+                    "input_file_id": request["input_file_id"],
+                    "completion_window": request["completion_window"],
+                    "created_at": 0, "status": "in_progress", "output_file_id": None,
+                    "error_file_id": None
+                }
+                self._send_json(self.server.batches[batch_id])
+
+    def do_GET(self) -> None:
+        with self.server.lock:
+            parts = self.path.rstrip("/").split("/")
+            if "batches" in parts:
+                batch = self.server.batches[parts[-1]]
+                self.server.polls += 1
+                if batch["status"] == "in_progress":
+                    batch["output_file_id"] = self._complete(batch)
+                    batch["status"] = "completed"
+                    self._send_json({**batch, "status": "in_progress", "output_file_id": None})
+                else:
+                    self._send_json(batch)
+            elif parts[-1] == "content":
+                body = self.server.files[parts[-2]]
+                self.send_response(200)
+                self.send_header("Content-Type", "application/octet-stream")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+    def _complete(self, batch: Dict) -> str:
+        lines = []
+        for line in self.server.files[batch["input_file_id"]].decode().splitlines():
+            request = json.loads(line)
+            question = request["body"]["messages"][-1]["content"]
+            lines.append(json.dumps({
+                "id": f"response-{request['custom_id']}",
+                "custom_id": request["custom_id"],
+                "error": None,
+                "response": {"status_code": 200, "body": {
+                    "choices": [{"index": 0, "message": {"role": "assistant",
+                                                         "content": f"answer to {question}"}}],
+                    "usage": {"prompt_tokens": 11, "completion_tokens": 3, "total_tokens": 14}
+                }}
+            }))
+        output_id = f"file-{len(self.server.files)}"
+        self.server.files[output_id] = "\n".join(lines).encode()
+        return output_id
+
+    def log_message(self, *args) -> None:
+        pass
+
+
+def start_fake_server() -> Tuple[FakeBatchServer, str]:
+    server = FakeBatchServer(("127.0.0.1", 0), FakeBatchHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}/v1"
+
+
+def test_concurrent_calls_share_one_batch_job():
+    server, base_url = start_fake_server()
+    try:
+        backend = OpenAI("fake_key", OpenAIModel.GPT_4_O_MINI, base_url=base_url)
+        llm = BatchLLM(backend, max_batch_size=5, max_wait=5.0, poll_interval=0.05)
+
+        async def run() -> List[str]:
+            return await asyncio.gather(*[
+                llm.acomplete([{"role": "user", "content": f"question {i}"}])
+                for i in range(5)
+            ])
+
+        with collect("batch") as usage:
+            answers = asyncio.run(run())
+
+        assert answers == [f"answer to question {i}" for i in range(5)]
+        assert len(server.batches) == 1
+        assert server.polls >= 2
+        # Usage comes from the job's results, not local estimates
+        assert [(c.prompt_tokens, c.completion_tokens, c.estimated) for c in usage.calls] == [
+            (11, 3, False)] * 5
+    finally:
+        server.shutdown()
+
+
+def test_flush_submits_a_partial_batch():
+    server, base_url = start_fake_server()
+    try:
+        backend = OpenAI("fake_key", OpenAIModel.GPT_4_O_MINI, base_url=base_url)
+        llm = BatchLLM(backend, max_batch_size=100, max_wait=60.0, poll_interval=0.05)
+
+        future = llm.submit([{"role": "user", "content": "lonely"}])
+        llm.flush()
+
+        assert future.result(timeout=5) == "answer to lonely"
+    finally:
+        server.shutdown()
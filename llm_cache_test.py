@@ -0,0 +1,68 @@
+import os
+import tempfile
+import time
+
+from llm_cache import LLMCache, MemoryCache, SQLiteCache, make_cache_key
+
+MESSAGES = [{"role": "user", "content": "What is the capital of France?"}]
+
+
+def test_cache_key_depends_on_model_effort_and_messages():
+    key = make_cache_key("gpt-4o", None, MESSAGES)
+    assert key == make_cache_key("gpt-4o", None, [dict(m) for m in MESSAGES])
+    assert key != make_cache_key("gpt-4o-mini", None, MESSAGES)
+    assert key != make_cache_key("gpt-4o", "high", MESSAGES)
+    assert key != make_cache_key("gpt-4o", None, [{"role": "user", "content": "?"}])
+
+
+def test_memory_tier_evicts_least_recently_used():
+    cache = MemoryCache(max_entries=2)
+    cache.set("a", "1")
+    cache.set("b", "2")
+    assert cache.get("a") == "1"
+    cache.set("c", "3")
+    assert cache.get("b") is None
+    assert cache.get("a") == "1"
+    assert cache.get("c") == "3"
+
+
+def test_memory_tier_expires_entries():
+    cache = MemoryCache(ttl=0.05)
+    cache.set("a", "1")
+    time.sleep(0.1)
+    assert cache.get("a") is None
+
+
+def test_disk_tier_survives_reopen_and_bounds_size():
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "cache.sqlite")
+        disk = SQLiteCache(path, max_entries=3)
+        for i in range(5):
+            disk.set(str(i), f"value {i}")
+        assert len(disk) == 3
+        disk.close()
+
+        reopened = SQLiteCache(path, max_entries=3)
+        assert reopened.get("0") is None
+        assert reopened.get("4")[1] == "value 4"
+        reopened.close()
+
+
+def test_two_tier_cache_counts_hits_and_misses():
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "cache.sqlite")
+        cache = LLMCache(path)
+        assert cache.get("k") is None
+        cache.set("k", "v")
+        assert cache.get("k") == "v"
+        cache.close()
+
+        warm = LLMCache(path)
+        assert warm.get("k") == "v"
+        assert warm.get("k") == "v"
+        assert warm.stats.disk_hits == 1
+        assert warm.stats.memory_hits == 1
+        warm.close()
+
+        assert cache.stats.misses == 1
+        assert cache.stats.memory_hits == 1
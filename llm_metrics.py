@@ -0,0 +1,387 @@
+import contextvars
+import json
+import threading
+import time
+import weakref
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass, replace
+from typing import (Any, AsyncIterator, Callable, Dict, Iterator, List, Optional, Sequence,
+                    Tuple)
+
+# USD per million tokens: (input, cached input, output). Reasoning tokens are
+# billed as output and are already included in completion_tokens.
+PRICES_PER_MILLION: Dict[str, Tuple[float, float, float]] = {
+    "gpt-3.5-turbo": (0.50, 0.50, 1.50),
+    "gpt-4": (30.00, 30.00, 60.00),
+    "gpt-4-turbo": (10.00, 10.00, 30.00),
+    "gpt-4o": (2.50, 1.25, 10.00),
+    "gpt-4o-mini": (0.15, 0.075, 0.60),
+    "o1": (15.00, 7.50, 60.00),
+    "o1-mini": (1.10, 0.55, 4.40),
+    "o3-mini": (1.10, 0.55, 4.40),
+    "deepseek-chat": (0.27, 0.07, 1.10),
+    "deepseek-reasoner": (0.55, 0.14, 2.19),
+}
+
+_current_agent: "contextvars.ContextVar[Optional[str]]" = contextvars.ContextVar(
+    "llm_metrics_agent", default=None)
+_current_task: "contextvars.ContextVar[Optional[str]]" = contextvars.ContextVar(
+    "llm_metrics_task", default=None)
+_current_call: "contextvars.ContextVar[Optional[CallRecord]]" = contextvars.ContextVar(
+    "llm_metrics_call", default=None)
+_active_runs: "contextvars.ContextVar[Tuple[RunMetrics, ...]]" = contextvars.ContextVar(
+    "llm_metrics_runs", default=())
+
+
+def estimate_cost(model: str,
+                  prompt_tokens: int,
+                  completion_tokens: int,
+                  cached_tokens: int = 0) -> Optional[float]:
+    """Estimated USD cost of one call, or None for models without a known price."""
+    prices = PRICES_PER_MILLION.get(model)
+    if prices is None:
+        return None
+    input_price, cached_price, output_price = prices
+    return ((prompt_tokens - cached_tokens) * input_price
+            + cached_tokens * cached_price
+            + completion_tokens * output_price) / 1_000_000
+
+
+@dataclass
+class CallRecord:
+    """Timing, token usage and cost of one LLM call."""
+    model: str
+    operation: str
+    agent: Optional[str] = None
+    # Agent method that made the call, e.g. "summarize_findings"
+    task: Optional[str] = None
+    started: float = 0.0
+    duration: float = 0.0
+    time_to_first_token: Optional[float] = None
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    reasoning_tokens: int = 0
+    cached_tokens: int = 0
+    cost: Optional[float] = None
+    cache_hit: bool = False
+    # True when the backend reported no usage and tokens were counted locally
+    estimated: bool = False
+    error: bool = False
+    # Requests sent for this call, counting retries and hedged duplicates
+    attempts: int = 1
+
+
+class RunMetrics:
+    """
+    Aggregates CallRecords by model and agent. Per-call records are kept only
+    when keep_calls is set, so a process-wide collector stays bounded.
+    """
+
+    def __init__(self, name: str, keep_calls: bool = True) -> None:
+        self.name = name
+        self.keep_calls = keep_calls
+        self.calls: List[CallRecord] = []
+        self._totals: Dict[Tuple[str, str, bool], Dict[str, float]] = {}
+        self._lock = threading.Lock()
+
+    def record(self, call: CallRecord) -> None:
+        key = (call.model, call.agent or "", call.cache_hit)
+        with self._lock:
+            if self.keep_calls:
+                self.calls.append(call)
+            totals = self._totals.setdefault(key, dict.fromkeys(
+                ("calls", "errors", "prompt_tokens", "completion_tokens", "reasoning_tokens",
+                 "cached_tokens", "cost", "duration"), 0))
+            totals["calls"] += 1
+            totals["errors"] += call.error
+            totals["prompt_tokens"] += call.prompt_tokens
+            totals["completion_tokens"] += call.completion_tokens
+            totals["reasoning_tokens"] += call.reasoning_tokens
+            totals["cached_tokens"] += call.cached_tokens
+            totals["cost"] += call.cost or 0.0
+            totals["duration"] += call.duration
+
+    def _group(self, index: int) -> Dict[str, Dict[str, float]]:
+        groups: Dict[str, Dict[str, float]] = {}
+        with self._lock:
+            for key, totals in self._totals.items():
+                group = groups.setdefault(str(key[index]), {})
+                for name, value in totals.items():
+                    group[name] = group.get(name, 0) + value
+        return groups
+
+    def totals(self) -> Dict[str, float]:
+        overall: Dict[str, float] = {}
+        for group in self._group(0).values():
+            for name, value in group.items():
+                overall[name] = overall.get(name, 0) + value
+        return overall
+
+    def prompt_cache(self) -> Dict[str, float]:
+        """How much of the prompt input the provider served from its prompt cache."""
+        totals = self.totals()
+        prompt_tokens = totals.get("prompt_tokens", 0)
+        cached_tokens = totals.get("cached_tokens", 0)
+        return {"prompt_tokens": prompt_tokens, "cached_tokens": cached_tokens,
+                "hit_rate": cached_tokens / prompt_tokens if prompt_tokens else 0.0}
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "totals": self.totals(),
+            "prompt_cache": self.prompt_cache(),
+            "by_model": self._group(0),
+            "by_agent": self._group(1),
+            "calls": [asdict(call) for call in self.calls]
+        }
+
+    def to_json(self, **kwargs: Any) -> str:
+        return json.dumps(self.to_dict(), **kwargs)
+
+    def to_prometheus(self, prefix: str = "redditbot_llm") -> str:
+        """Render the totals in the Prometheus text exposition format."""
+        metrics = [
+            ("calls_total", "counter", "LLM calls", "calls"),
+            ("errors_total", "counter", "LLM calls that raised", "errors"),
+            ("prompt_tokens_total", "counter", "Prompt tokens", "prompt_tokens"),
+            ("completion_tokens_total", "counter", "Completion tokens", "completion_tokens"),
+            ("reasoning_tokens_total", "counter", "Reasoning tokens", "reasoning_tokens"),
+            ("cached_tokens_total", "counter", "Prompt tokens served from the provider cache",
+             "cached_tokens"),
+            ("cost_usd_total", "counter", "Estimated cost in USD", "cost"),
+            ("call_duration_seconds_total", "counter", "Time spent in LLM calls", "duration"),
+        ]
+        with self._lock:
+            totals = sorted(self._totals.items())
+        lines = []
+        for suffix, kind, help_text, field_name in metrics:
+            name = f"{prefix}_{suffix}"
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for (model, agent, cache_hit), values in totals:
+                labels = (f'model="{_escape(model)}",agent="{_escape(agent)}",'
+                          f'cache="{"hit" if cache_hit else "miss"}"')
+                lines.append(f"{name}{{{labels}}} {values[field_name]:g}")
+        return "\n".join(lines) + "\n"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+_process_metrics = RunMetrics("process", keep_calls=False)
+
+
+def process_metrics() -> RunMetrics:
+    """Totals for every call made in this process, e.g. for a /metrics endpoint."""
+    return _process_metrics
+
+
+@contextmanager
+def collect(name: str) -> Iterator[RunMetrics]:
+    """Collect every LLM call made in this context (and tasks it spawns) into a RunMetrics."""
+    run = RunMetrics(name)
+    token = _active_runs.set(_active_runs.get() + (run,))
+    try:
+        yield run
+    finally:
+        _active_runs.reset(token)
+
+
+@contextmanager
+def agent_context(agent: str, task: Optional[str] = None) -> Iterator[None]:
+    """Attribute LLM calls made in this context to agent (and its method, task)."""
+    agent_token = _current_agent.set(agent)
+    task_token = _current_task.set(task)
+    try:
+        yield
+    finally:
+        _current_task.reset(task_token)
+        _current_agent.reset(agent_token)
+
+
+_listeners: "List[weakref.WeakMethod]" = []
+_listeners_lock = threading.Lock()
+
+
+def add_listener(method: Callable[[CallRecord], None]) -> None:
+    """
+    Call a bound method with every finished CallRecord. Held weakly, so the
+    owner can be garbage collected without unsubscribing.
+    """
+    with _listeners_lock:
+        _listeners.append(weakref.WeakMethod(method))
+
+
+def remove_listener(method: Callable[[CallRecord], None]) -> None:
+    """Stop calling a method registered with add_listener."""
+    with _listeners_lock:
+        _listeners[:] = [ref for ref in _listeners if ref() not in (None, method)]
+
+
+def _notify(record: CallRecord) -> None:
+    with _listeners_lock:
+        _listeners[:] = [ref for ref in _listeners if ref() is not None]
+        methods = [ref() for ref in _listeners]
+    for method in methods:
+        if method is not None:
+            method(record)
+
+
+def record_usage(usage: Any) -> None:
+    """Attach a provider usage object to the call in progress, if any."""
+    call = _current_call.get()
+    if call is None or usage is None:
+        return
+    call.prompt_tokens = getattr(usage, "prompt_tokens", 0) or 0
+    call.completion_tokens = getattr(usage, "completion_tokens", 0) or 0
+    details = getattr(usage, "completion_tokens_details", None)
+    call.reasoning_tokens = getattr(details, "reasoning_tokens", 0) or 0
+    prompt_details = getattr(usage, "prompt_tokens_details", None)
+    # DeepSeek reports prompt cache hits under its own field
+    call.cached_tokens = (getattr(prompt_details, "cached_tokens", 0)
+                          or getattr(usage, "prompt_cache_hit_tokens", 0) or 0)
+    call.estimated = False
+
+
+def record_backend(model: str, attempts: int) -> None:
+    """Note which model served the call in progress, and after how many requests."""
+    call = _current_call.get()
+    if call is not None:
+        call.model = model
+        call.attempts = attempts
+
+
+def isolate_call() -> Optional[CallRecord]:
+    """
+    Bind a copy of the call in progress as current and return it, so one of
+    several concurrent requests made for that call (e.g. hedged duplicates)
+    records its usage apart from the others. Call it from the request's own
+    context; adopt_usage() then keeps the usage of the request that won.
+    """
+    call = _current_call.get()
+    if call is None:
+        return None
+    isolated = replace(call)
+    _current_call.set(isolated)
+    return isolated
+
+
+def adopt_usage(isolated: Optional[CallRecord]) -> None:
+    """Copy the usage an isolate_call() request recorded to the call in progress."""
+    call = _current_call.get()
+    if call is None or isolated is None:
+        return
+    call.prompt_tokens = isolated.prompt_tokens
+    call.completion_tokens = isolated.completion_tokens
+    call.reasoning_tokens = isolated.reasoning_tokens
+    call.cached_tokens = isolated.cached_tokens
+    call.estimated = isolated.estimated
+
+
+class CallTracker:
+    """
+    Times one call and publishes its CallRecord when it ends. Used as a context
+    manager around complete()-style calls, or via iterate()/aiterate() around a
+    stream of deltas. Backends report usage with record_usage() while the call
+    is bound as current.
+    """
+
+    def __init__(self,
+                 model: str,
+                 operation: str,
+                 messages: Sequence[Dict[str, str]],
+                 estimator: Callable[[str], int]) -> None:
+        # The agent is captured now: streams are consumed outside the agent's context
+        self.record = CallRecord(model=model, operation=operation,
+                                 agent=_current_agent.get(), task=_current_task.get())
+        self._messages = messages
+        self._estimator = estimator
+        self._runs = _active_runs.get()
+        self._text: List[str] = []
+        self._start = 0.0
+
+    def completed(self, text: str) -> str:
+        """Note the completion text (used for local token estimates) and return it."""
+        self._text.append(text or "")
+        return text
+
+    def _begin(self) -> None:
+        self.record.started = time.time()
+        self._start = time.perf_counter()
+        self.record.estimated = True
+
+    def _finish(self, error: bool) -> None:
+        record = self.record
+        record.duration = time.perf_counter() - self._start
+        record.error = error
+        if record.cache_hit:
+            record.estimated = False
+        elif record.estimated:
+            record.prompt_tokens = sum(self._estimator(m["content"]) for m in self._messages)
+            record.completion_tokens = self._estimator("".join(self._text))
+        if not record.cache_hit:
+            record.cost = estimate_cost(record.model, record.prompt_tokens,
+                                        record.completion_tokens, record.cached_tokens)
+        _process_metrics.record(record)
+        for run in self._runs:
+            run.record(record)
+        _notify(record)
+
+    def __enter__(self) -> "CallTracker":
+        self._begin()
+        self._token = _current_call.set(self.record)
+        return self
+
+    def __exit__(self, exc_type: Any, exc: Any, tb: Any) -> None:
+        _current_call.reset(self._token)
+        self._finish(exc_type is not None)
+
+    def _first_delta(self) -> None:
+        if self.record.time_to_first_token is None:
+            self.record.time_to_first_token = time.perf_counter() - self._start
+
+    def iterate(self, deltas: Iterator[str]) -> Iterator[str]:
+        self._begin()
+        error = True
+        try:
+            while True:
+                # Bound per step: the consumer may resume the stream from another context
+                token = _current_call.set(self.record)
+                try:
+                    delta = next(deltas)
+                except StopIteration:
+                    break
+                finally:
+                    _current_call.reset(token)
+                self._first_delta()
+                self._text.append(delta)
+                yield delta
+            error = False
+        except GeneratorExit:  # the consumer stopped early; not a failure
+            error = False
+            raise
+        finally:
+            self._finish(error)
+
+    async def aiterate(self, deltas: AsyncIterator[str]) -> AsyncIterator[str]:
+        self._begin()
+        error = True
+        try:
+            while True:
+                token = _current_call.set(self.record)
+                try:
+                    delta = await deltas.__anext__()
+                except StopAsyncIteration:
+                    break
+                finally:
+                    _current_call.reset(token)
+                self._first_delta()
+                self._text.append(delta)
+                yield delta
+            error = False
+        except GeneratorExit:  # the consumer stopped early; not a failure
+            error = False
+            raise
+        finally:
+            self._finish(error)
@@ -0,0 +1,61 @@
+import asyncio
+from typing import Dict, List
+
+from agents import ResearchAgent, WriterAgent
+from llm_cache import LLMCache
+from llm_metrics import RunMetrics, collect
+from llms import BaseLLM, OpenAIModel
+
+
+class EchoLLM(BaseLLM):
+    """Backend that reports no usage, so tokens are estimated locally."""
+
+    def __init__(self) -> None:
+        super().__init__("fake_key", OpenAIModel.GPT_4_O)
+
+    def _call_llm(self, messages: List[Dict[str, str]]) -> str:
+        return "x" * 40
+
+
+def test_calls_are_attributed_to_agents_and_runs():
+    llm = EchoLLM()
+    researcher, writer = ResearchAgent("k", llm), WriterAgent("k", llm)
+
+    with collect("outer") as outer:
+        researcher.research("a question")
+        with collect("inner") as inner:
+            asyncio.run(researcher.aresearch("another question"))
+            stream = writer.write_stream("content", "insights")
+        # Consumed outside the agent and the inner run, still attributed to both
+        "".join(stream)
+
+    assert len(outer.calls) == 3 and len(inner.calls) == 2
+    assert outer.to_dict()["by_agent"]["ResearchAgent"]["calls"] == 2
+    assert outer.to_dict()["by_agent"]["WriterAgent"]["calls"] == 1
+    call = outer.calls[0]
+    assert call.estimated and call.completion_tokens == 11 and call.cost > 0
+
+
+def test_cache_hits_are_free_and_labelled():
+    llm = EchoLLM()
+    llm.cache = LLMCache()
+    messages = [{"role": "user", "content": "hi"}]
+    with collect("run") as usage:
+        llm.complete(messages)
+        llm.complete(messages)
+
+    assert [call.cache_hit for call in usage.calls] == [False, True]
+    assert usage.calls[1].cost is None and usage.calls[1].prompt_tokens == 0
+
+
+def test_prometheus_export():
+    metrics = RunMetrics("run")
+    with collect("run") as usage:
+        EchoLLM().complete([{"role": "user", "content": "hi"}])
+    for call in usage.calls:
+        metrics.record(call)
+
+    text = metrics.to_prometheus()
+    assert "# TYPE redditbot_llm_calls_total counter" in text
+    assert 'redditbot_llm_calls_total{model="gpt-4o",agent="",cache="miss"} 1' in text
+    assert text.endswith("\n")
@@ -0,0 +1,305 @@
+import asyncio
+import contextvars
+import random
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass
+from typing import AsyncIterator, Dict, Iterator, List, Optional, Sequence, Set, Tuple
+
+import openai
+
+from llm_metrics import CallRecord, adopt_usage, isolate_call, record_backend
+from llms import BaseLLM, ReasoningEffort
+
+RETRYABLE_STATUS_CODES = frozenset({408, 409, 429, 500, 502, 503, 504})
+
+
+class LLMUnavailableError(Exception):
+    """Every backend failed after retries. errors holds what each attempt raised."""
+
+    def __init__(self, message: str, errors: Sequence[BaseException] = ()) -> None:
+        super().__init__(message)
+        self.errors = list(errors)
+
+
+class LLMDeadlineExceeded(LLMUnavailableError, TimeoutError):
+    """The call's deadline passed before any backend answered."""
+
+
+def is_retryable(error: BaseException) -> bool:
+    """Transient failures worth retrying on the same backend: timeouts, 429s, 5xx."""
+    if isinstance(error, (openai.APITimeoutError, openai.APIConnectionError,
+                          TimeoutError, ConnectionError)):
+        return True
+    if isinstance(error, openai.APIStatusError):
+        return error.status_code in RETRYABLE_STATUS_CODES
+    return False
+
+
+def _retry_after(error: BaseException) -> Optional[float]:
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None)
+    if not headers:
+        return None
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+@dataclass
+class RetryPolicy:
+    """Exponential backoff with full jitter, honoring Retry-After when sent."""
+    max_attempts: int = 3  # per backend
+    base_delay: float = 0.5
+    max_delay: float = 20.0
+
+    def backoff(self, retry: int, error: BaseException) -> float:
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** retry))
+        retry_after = _retry_after(error)
+        if retry_after is not None:
+            delay = max(delay, min(retry_after, self.max_delay))
+        return delay
+
+
+class PolicyLLM(BaseLLM):
+    """
+    Wraps an ordered list of backends, e.g. [OpenAI(gpt-4o), OpenAI(gpt-4o-mini),
+    DeepSeek()], and makes each call survive transient failures:
+
+    - retryable errors (timeouts, connection errors, 429s, 5xx) are retried on
+      the same backend with exponential backoff and jitter;
+    - other errors, or running out of attempts, fall back to the next backend;
+    - deadline bounds the whole call, retries and fallbacks included;
+    - with hedge_after, a duplicate request is sent when the first has not
+      answered within that many seconds, and whichever finishes first wins.
+
+    Streams are retried and fall back only until their first delta arrives.
+    When everything fails, LLMUnavailableError is raised instead of an empty
+    completion. Note the openai SDK's own retries still apply inside each attempt.
+    """
+
+    def __init__(self,
+                 backends: Sequence[BaseLLM],
+                 retry: Optional[RetryPolicy] = None,
+                 deadline: Optional[float] = None,
+                 hedge_after: Optional[float] = None,
+                 max_hedges: int = 1) -> None:
+        if not backends:
+            raise ValueError("PolicyLLM needs at least one backend")
+        super().__init__(backends[0].api_key, backends[0].model)
+        self.backends = list(backends)
+        self.retry = retry or RetryPolicy()
+        self.deadline = deadline
+        self.hedge_after = hedge_after
+        self.max_hedges = max_hedges
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+    @property
+    def reasoning_effort(self) -> ReasoningEffort:
+        return getattr(self.backends[0], "reasoning_effort", ReasoningEffort.NONE)
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(thread_name_prefix="llm-policy")
+        return self._executor
+
+    def _attempts(self,
+                  errors: List[BaseException],
+                  deadline: Optional[float]) -> Iterator[Tuple[BaseLLM, float]]:
+        """
+        Yield (backend, delay) for each attempt in order; the caller waits delay,
+        then tries backend and appends any error it raises to errors.
+        """
+        for backend in self.backends:
+            for attempt in range(self.retry.max_attempts):
+                delay = 0.0
+                if attempt:
+                    if not is_retryable(errors[-1]):
+                        break
+                    delay = self.retry.backoff(attempt - 1, errors[-1])
+                    if deadline is not None and time.monotonic() + delay >= deadline:
+                        break  # falling back now beats waiting out the deadline
+                yield backend, delay
+
+    def _remaining(self, deadline: Optional[float], errors: List[BaseException]) -> Optional[float]:
+        if deadline is None:
+            return None
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise LLMDeadlineExceeded(f"No completion within {self.deadline}s", errors)
+        return remaining
+
+    def _next_wait(self, started: float, timeout: Optional[float], hedges: int) -> Optional[float]:
+        waits = []
+        if timeout is not None:
+            waits.append(timeout - (time.monotonic() - started))
+        if self.hedge_after is not None and hedges < self.max_hedges:
+            waits.append(self.hedge_after * (hedges + 1) - (time.monotonic() - started))
+        return max(min(waits), 0.0) if waits else None
+
+    def _attempt(self, backend: BaseLLM, messages: List[Dict[str, str]],
+                 timeout: Optional[float]) -> Tuple[str, int]:
+        """One (possibly hedged) request. Returns the text and the requests sent."""
+        if timeout is None and self.hedge_after is None:
+            return backend._call_llm(messages), 1
+
+        executor = self._get_executor()
+
+        def isolated() -> Tuple[str, Optional[CallRecord]]:
+            # Hedged duplicates would overwrite each other's usage on the shared record
+            record = isolate_call()
+            return backend._call_llm(messages), record
+
+        def submit() -> "Future[Tuple[str, Optional[CallRecord]]]":
+            return executor.submit(contextvars.copy_context().run, isolated)
+
+        started = time.monotonic()
+        pending: Set["Future[Tuple[str, Optional[CallRecord]]]"] = {submit()}
+        hedges = 0
+        while True:
+            done, pending = wait(pending, timeout=self._next_wait(started, timeout, hedges),
+                                 return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    for other in pending:
+                        other.cancel()
+                    text, record = future.result()
+                    adopt_usage(record)
+                    return text, hedges + 1
+            if not pending:
+                raise next(iter(done)).exception()
+            if timeout is not None and time.monotonic() - started >= timeout:
+                raise LLMDeadlineExceeded(f"No completion within {self.deadline}s")
+            if self.hedge_after is not None and hedges < self.max_hedges:
+                pending.add(submit())
+                hedges += 1
+
+    async def _aattempt(self, backend: BaseLLM, messages: List[Dict[str, str]],
+                        timeout: Optional[float]) -> Tuple[str, int]:
+        if timeout is None and self.hedge_after is None:
+            return await backend._acall_llm(messages), 1
+
+        async def isolated() -> Tuple[str, Optional[CallRecord]]:
+            # Each task runs in its own copy of the context
+            record = isolate_call()
+            return await backend._acall_llm(messages), record
+
+        started = time.monotonic()
+        pending: Set["asyncio.Task[Tuple[str, Optional[CallRecord]]]"] = {
+            asyncio.ensure_future(isolated())}
+        hedges = 0
+        try:
+            while True:
+                done, pending = await asyncio.wait(
+                    pending, timeout=self._next_wait(started, timeout, hedges),
+                    return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        text, record = task.result()
+                        adopt_usage(record)
+                        return text, hedges + 1
+                if not pending:
+                    raise next(iter(done)).exception()
+                if timeout is not None and time.monotonic() - started >= timeout:
+                    raise LLMDeadlineExceeded(f"No completion within {self.deadline}s")
+                if self.hedge_after is not None and hedges < self.max_hedges:
+                    pending.add(asyncio.ensure_future(isolated()))
+                    hedges += 1
+        finally:
+            for task in pending:
+                task.cancel()
+
+    def _start_deadline(self) -> Optional[float]:
+        return time.monotonic() + self.deadline if self.deadline is not None else None
+
+    def _call_llm(self, messages: List[Dict[str, str]]) -> str:
+        deadline = self._start_deadline()
+        errors: List[BaseException] = []
+        sent = 0
+        for backend, delay in self._attempts(errors, deadline):
+            time.sleep(delay)
+            try:
+                text, requests = self._attempt(backend, messages, self._remaining(deadline, errors))
+            except LLMDeadlineExceeded as e:
+                raise LLMDeadlineExceeded(str(e), errors) from None
+            except Exception as e:
+                print(f"LLM call to {backend.to_string()} failed: {e}")
+                errors.append(e)
+                sent += 1
+                continue
+            record_backend(backend.model.value, sent + requests)
+            return text
+        raise LLMUnavailableError(f"All LLM backends failed after {len(errors)} attempts", errors)
+
+    async def _acall_llm(self, messages: List[Dict[str, str]]) -> str:
+        deadline = self._start_deadline()
+        errors: List[BaseException] = []
+        sent = 0
+        for backend, delay in self._attempts(errors, deadline):
+            await asyncio.sleep(delay)
+            try:
+                text, requests = await self._aattempt(
+                    backend, messages, self._remaining(deadline, errors))
+            except LLMDeadlineExceeded as e:
+                raise LLMDeadlineExceeded(str(e), errors) from None
+            except Exception as e:
+                print(f"LLM call to {backend.to_string()} failed: {e}")
+                errors.append(e)
+                sent += 1
+                continue
+            record_backend(backend.model.value, sent + requests)
+            return text
+        raise LLMUnavailableError(f"All LLM backends failed after {len(errors)} attempts", errors)
+
+    def _stream_llm(self, messages: List[Dict[str, str]]) -> Iterator[str]:
+        deadline = self._start_deadline()
+        errors: List[BaseException] = []
+        for backend, delay in self._attempts(errors, deadline):
+            time.sleep(delay)
+            self._remaining(deadline, errors)
+            deltas = backend._stream_llm(messages)
+            try:
+                first = next(deltas, None)
+            except Exception as e:
+                print(f"LLM stream from {backend.to_string()} failed: {e}")
+                errors.append(e)
+                continue
+            record_backend(backend.model.value, len(errors) + 1)
+            if first is not None:
+                yield first
+                yield from deltas
+            return
+        raise LLMUnavailableError(f"All LLM backends failed after {len(errors)} attempts", errors)
+
+    async def _astream_llm(self, messages: List[Dict[str, str]]) -> AsyncIterator[str]:
+        deadline = self._start_deadline()
+        errors: List[BaseException] = []
+        for backend, delay in self._attempts(errors, deadline):
+            await asyncio.sleep(delay)
+            self._remaining(deadline, errors)
+            deltas = backend._astream_llm(messages)
+            try:
+                first = await deltas.__anext__()
+            except StopAsyncIteration:
+                record_backend(backend.model.value, len(errors) + 1)
+                return
+            except Exception as e:
+                print(f"LLM stream from {backend.to_string()} failed: {e}")
+                errors.append(e)
+                continue
+            record_backend(backend.model.value, len(errors) + 1)
+            yield first
+            async for delta in deltas:
+                yield delta
+            return
+        raise LLMUnavailableError(f"All LLM backends failed after {len(errors)} attempts", errors)
+
+    def close(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+    def to_string(self) -> str:
+        """Convert the object to a string representation."""
+        return "Policy over " + ", then ".join(backend.to_string() for backend in self.backends)
@@ -0,0 +1,155 @@
+import asyncio
+import threading
+import time
+from types import SimpleNamespace
+from typing import Dict, Iterator, List, Optional
+
+import openai
+import pytest
+
+from agents import ResearchAgent
+from llm_cache import LLMCache
+from llm_metrics import collect, record_usage
+from llm_policy import LLMDeadlineExceeded, LLMUnavailableError, PolicyLLM, RetryPolicy
+from llms import BaseLLM, DeepSeekModel, OpenAIModel
+
+NO_WAIT = RetryPolicy(max_attempts=3, base_delay=0.0, max_delay=0.0)
+
+
+def rate_limit_error() -> openai.RateLimitError:
+    response = SimpleNamespace(request=None, status_code=429, headers={"retry-after": "0"})
+    return openai.RateLimitError("rate limited", response=response, body=None)
+
+
+class FaultyLLM(BaseLLM):
+    """
+    Fake backend that plays back a script of faults: each call takes the next
+    entry, raising it if it is an exception or sleeping that many seconds.
+    Calls past the end of the script answer immediately. Each answer reports
+    its call number as its completion tokens.
+    """
+
+    def __init__(self, model=OpenAIModel.GPT_4_O, script: Optional[List] = None) -> None:
+        super().__init__("fake_key", model)
+        self.script = list(script or [])
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def _next_fault(self):
+        with self._lock:
+            self.calls += 1
+            return self.calls, self.script.pop(0) if self.script else None
+
+    def _call_llm(self, messages: List[Dict[str, str]]) -> str:
+        call, fault = self._next_fault()
+        if isinstance(fault, BaseException):
+            raise fault
+        if fault:
+            time.sleep(fault)
+        record_usage(SimpleNamespace(prompt_tokens=10, completion_tokens=call))
+        return f"{self.model.value} answer"
+
+    async def _acall_llm(self, messages: List[Dict[str, str]]) -> str:
+        call, fault = self._next_fault()
+        if isinstance(fault, BaseException):
+            raise fault
+        if fault:
+            await asyncio.sleep(fault)
+        record_usage(SimpleNamespace(prompt_tokens=10, completion_tokens=call))
+        return f"{self.model.value} answer"
+
+    def _stream_llm(self, messages: List[Dict[str, str]]) -> Iterator[str]:
+        _, fault = self._next_fault()
+        if isinstance(fault, BaseException):
+            raise fault
+        yield f"{self.model.value} "
+        yield "answer"
+
+
+MESSAGES = [{"role": "user", "content": "hello"}]
+
+
+def test_transient_errors_are_retried_on_the_same_backend():
+    primary = FaultyLLM(script=[rate_limit_error(), openai.APITimeoutError(None)])
+    llm = PolicyLLM([primary], retry=NO_WAIT)
+
+    with collect("run") as usage:
+        assert llm.complete(MESSAGES) == "gpt-4o answer"
+    assert primary.calls == 3
+    assert usage.calls[0].attempts == 3
+
+
+def test_falls_back_in_order_and_records_the_serving_model():
+    primary = FaultyLLM(script=[ValueError("bad request")])
+    cheaper = FaultyLLM(OpenAIModel.GPT_4_O_MINI, script=[rate_limit_error()] * 3)
+    deepseek = FaultyLLM(DeepSeekModel.DEEPSEEK_CHAT)
+    llm = PolicyLLM([primary, cheaper, deepseek], retry=NO_WAIT)
+
+    with collect("run") as usage:
+        assert asyncio.run(llm.acomplete(MESSAGES)) == "deepseek-chat answer"
+    # Non-retryable errors fall back at once; retryable ones use up the attempts
+    assert (primary.calls, cheaper.calls, deepseek.calls) == (1, 3, 1)
+    assert usage.calls[0].model == "deepseek-chat"
+
+
+def test_exhausted_backends_raise_through_agents():
+    llm = PolicyLLM([FaultyLLM(script=[rate_limit_error()] * 3)], retry=NO_WAIT)
+    with pytest.raises(LLMUnavailableError) as raised:
+        ResearchAgent("k", llm).research("anything")
+    assert len(raised.value.errors) == 3
+
+
+def test_hedged_request_beats_a_slow_first_attempt():
+    backend = FaultyLLM(script=[2.0])
+    llm = PolicyLLM([backend], hedge_after=0.05)
+
+    start = time.monotonic()
+    assert llm.complete(MESSAGES) == "gpt-4o answer"
+    assert asyncio.run(llm.acomplete(MESSAGES)) == "gpt-4o answer"
+    assert time.monotonic() - start < 1.0
+    assert backend.calls == 3
+    llm.close()
+
+
+def test_only_the_winning_hedge_records_usage():
+    backend = FaultyLLM(script=[0.3])
+    llm = PolicyLLM([backend], hedge_after=0.05)
+
+    with collect("run") as usage:
+        assert llm.complete(MESSAGES) == "gpt-4o answer"
+        # Let the losing first request finish in the background
+        time.sleep(0.5)
+    assert backend.calls == 2
+    assert usage.calls[0].completion_tokens == 2
+    assert usage.calls[0].attempts == 2
+    llm.close()
+
+
+def test_fallback_answers_are_not_cached_as_the_primary_model():
+    primary = FaultyLLM(script=[ValueError("bad request")])
+    llm = PolicyLLM([primary, FaultyLLM(OpenAIModel.GPT_4_O_MINI)], retry=NO_WAIT)
+    llm.cache = LLMCache()
+
+    assert llm.complete(MESSAGES) == "gpt-4o-mini answer"
+    assert asyncio.run(llm.acomplete(MESSAGES)) == "gpt-4o answer"
+    # The primary's own answer is cached
+    assert llm.complete(MESSAGES) == "gpt-4o answer"
+    assert primary.calls == 2
+
+
+def test_deadline_bounds_the_whole_call():
+    llm = PolicyLLM([FaultyLLM(script=[2.0, 2.0])], deadline=0.1)
+
+    start = time.monotonic()
+    with pytest.raises(LLMDeadlineExceeded):
+        llm.complete(MESSAGES)
+    with pytest.raises(LLMDeadlineExceeded):
+        asyncio.run(llm.acomplete(MESSAGES))
+    assert time.monotonic() - start < 1.0
+    llm.close()
+
+
+def test_stream_falls_back_before_the_first_delta():
+    primary = FaultyLLM(script=[RuntimeError("boom")])
+    llm = PolicyLLM([primary, FaultyLLM(OpenAIModel.GPT_4_O_MINI)], retry=NO_WAIT)
+    assert "".join(llm.stream(MESSAGES)) == "gpt-4o-mini answer"
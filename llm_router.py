@@ -0,0 +1,254 @@
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Callable, Dict, Iterator, List, Optional, Tuple
+
+from llm_cache import LLMCache
+from llm_metrics import CallRecord, add_listener, remove_listener
+from llm_policy import PolicyLLM
+from llms import (DEEPSEEK_BASE_URL, BaseLLM, DeepSeek, DeepSeekModel, OpenAI, OpenAIModel,
+                  ReasoningEffort)
+
+# Cheap, short-output steps that do not need the primary model
+DEFAULT_ROUTES: Dict[str, Any] = {
+    "suggest_search_terms": {"model": "gpt-4o-mini"},
+    "summarize_findings": {"model": "gpt-4o-mini"},
+    "analyze_subreddits": {"model": "gpt-4o-mini"},
+}
+
+
+@dataclass
+class Route:
+    """
+    Candidate backends for one task, in order of preference (usually cheapest
+    or fastest first), and the budget a candidate must meet to be used.
+    """
+    candidates: List[BaseLLM]
+    max_latency: Optional[float] = None
+    min_success_rate: float = 0.9
+    min_quality: Optional[float] = None
+
+
+@dataclass
+class TaskStats:
+    """Exponentially weighted observations of one model on one task."""
+    samples: int = 0
+    latency: float = 0.0
+    success_rate: float = 1.0
+    quality: Optional[float] = None
+    updated: float = 0.0
+
+
+class ModelRouter(BaseLLM):
+    """
+    Picks the backend for each agent method ("Agent.method", or just "method"
+    to match any agent) instead of sending every call to one model. Unrouted
+    tasks use default.
+
+    Within a route the first candidate whose observed latency, success rate
+    and quality meet the route's budget is used. Candidates without enough
+    recent observations are tried optimistically, so a candidate that was
+    passed over is probed again after reprobe_after seconds. Latency and
+    success come from llm_metrics; quality comes from record_quality().
+    Only calls to a route's own candidate models count, since the metrics
+    listener also sees other routers' and backends' calls. close() (or
+    garbage collection) unsubscribes it.
+    """
+
+    def __init__(self,
+                 default: BaseLLM,
+                 routes: Optional[Dict[str, Route]] = None,
+                 min_samples: int = 3,
+                 alpha: float = 0.2,
+                 reprobe_after: float = 600.0,
+                 clock: Callable[[], float] = time.monotonic) -> None:
+        # Set before BaseLLM.__init__, whose cache assignment goes through the setter
+        self.default = default
+        self.routes = routes or {}
+        for task, route in self.routes.items():
+            models = [candidate.model.value for candidate in route.candidates]
+            if not models or len(set(models)) != len(models):
+                raise ValueError(f"Route {task!r} needs candidates with distinct models")
+        super().__init__(default.api_key, default.model)
+        self.min_samples = min_samples
+        self.alpha = alpha
+        self.reprobe_after = reprobe_after
+        self._clock = clock
+        self._stats: Dict[Tuple[str, str], TaskStats] = {}
+        self._lock = threading.Lock()
+        add_listener(self._observe)
+
+    @classmethod
+    def from_config(cls,
+                    config: Dict[str, Any],
+                    api_key: str,
+                    default: Optional[BaseLLM] = None,
+                    retry: bool = True,
+                    **kwargs: Any) -> "ModelRouter":
+        """
+        Build a router from a JSON-style config mapping tasks to a candidate,
+        a list of candidates, or {"candidates": [...], "max_latency": ...,
+        "min_success_rate": ..., "min_quality": ...}. A candidate is
+        {"model": "gpt-4o-mini", "reasoning_effort": "low", "api_key": ...,
+        "base_url": ...}; "default" configures the fallback for unrouted tasks.
+        With retry, every backend is wrapped in a PolicyLLM.
+        """
+        def build(spec: Dict[str, Any]) -> BaseLLM:
+            key = spec.get("api_key", api_key)
+            model = spec["model"]
+            if model in {m.value for m in DeepSeekModel}:
+                llm: BaseLLM = DeepSeek(key, DeepSeekModel(model),
+                                        spec.get("base_url", DEEPSEEK_BASE_URL))
+            elif model in {m.value for m in OpenAIModel}:
+                llm = OpenAI(key, OpenAIModel(model),
+                             ReasoningEffort(spec.get("reasoning_effort")),
+                             spec.get("base_url"))
+            else:
+                raise ValueError(f"Unknown model {model!r}")
+            return PolicyLLM([llm]) if retry else llm
+
+        routes = {}
+        for task, entry in config.items():
+            if task == "default":
+                continue
+            if isinstance(entry, dict) and "candidates" in entry:
+                options = {k: v for k, v in entry.items() if k != "candidates"}
+                routes[task] = Route([build(spec) for spec in entry["candidates"]], **options)
+            else:
+                specs = entry if isinstance(entry, list) else [entry]
+                routes[task] = Route([build(spec) for spec in specs])
+        if default is None:
+            default = build(config.get("default", {"model": OpenAIModel.GPT_3_5_TURBO.value}))
+        return cls(default, routes, **kwargs)
+
+    @property
+    def cache(self) -> Optional[LLMCache]:
+        return self._cache
+
+    @cache.setter
+    def cache(self, cache: Optional[LLMCache]) -> None:
+        self._cache = cache
+        # None (as BaseLLM.__init__ assigns) leaves caches attached to the backends alone
+        if cache is None:
+            return
+        self.default.cache = cache
+        for route in self.routes.values():
+            for candidate in route.candidates:
+                candidate.cache = cache
+
+    @property
+    def reasoning_effort(self) -> ReasoningEffort:
+        return getattr(self.default, "reasoning_effort", ReasoningEffort.NONE)
+
+    def _route(self, task: str) -> Optional[Route]:
+        route = self.routes.get(task)
+        if route is None and "." in task:
+            route = self.routes.get(task.split(".", 1)[1])
+        return route
+
+    def _meets_budget(self, stats: TaskStats, route: Route) -> bool:
+        if stats.success_rate < route.min_success_rate:
+            return False
+        if route.max_latency is not None and stats.latency > route.max_latency:
+            return False
+        if route.min_quality is not None and stats.quality is not None:
+            return stats.quality >= route.min_quality
+        return True
+
+    def for_task(self, task: str) -> BaseLLM:
+        route = self._route(task)
+        if route is None:
+            return self.default
+        now = self._clock()
+        with self._lock:
+            observed = []
+            for candidate in route.candidates:
+                key = (task, candidate.model.value)
+                stats = self._stats.get(key)
+                if stats is not None and now - stats.updated > self.reprobe_after:
+                    del self._stats[key]  # stale: measure it afresh
+                    stats = None
+                if stats is None or stats.samples < self.min_samples:
+                    return candidate
+                if self._meets_budget(stats, route):
+                    return candidate
+                observed.append((stats.success_rate, stats.quality or 0.0, -stats.latency, candidate))
+        # Nobody meets the budget: the most reliable, best, then fastest candidate
+        return max(observed, key=lambda entry: entry[:3])[3]
+
+    def _update(self, task: str, model: str, update: Callable[[TaskStats, bool], None]) -> None:
+        with self._lock:
+            stats = self._stats.get((task, model))
+            first = stats is None
+            if first:
+                stats = self._stats[(task, model)] = TaskStats()
+            update(stats, first)
+            stats.updated = self._clock()
+
+    def _observe(self, record: CallRecord) -> None:
+        if record.agent is None or record.task is None or record.cache_hit:
+            return
+        task = f"{record.agent}.{record.task}"
+        route = self._route(task)
+        if route is None or record.model not in {c.model.value for c in route.candidates}:
+            return
+        success = 0.0 if record.error or record.completion_tokens == 0 else 1.0
+
+        def update(stats: TaskStats, first: bool) -> None:
+            stats.samples += 1
+            if first:
+                stats.latency, stats.success_rate = record.duration, success
+            else:
+                stats.latency += self.alpha * (record.duration - stats.latency)
+                stats.success_rate += self.alpha * (success - stats.success_rate)
+
+        self._update(task, record.model, update)
+
+    def record_quality(self, task: str, model: str, score: float) -> None:
+        """Feed back a quality score in [0, 1] for model's output on task ("Agent.method")."""
+        def update(stats: TaskStats, first: bool) -> None:
+            if stats.quality is None:
+                stats.quality = score
+            else:
+                stats.quality += self.alpha * (score - stats.quality)
+
+        self._update(task, model, update)
+
+    def stats(self) -> Dict[str, Dict[str, Dict[str, Any]]]:
+        """Observed stats per task and model."""
+        with self._lock:
+            snapshot: Dict[str, Dict[str, Dict[str, Any]]] = {}
+            for (task, model), stats in sorted(self._stats.items()):
+                snapshot.setdefault(task, {})[model] = {
+                    "samples": stats.samples, "latency": stats.latency,
+                    "success_rate": stats.success_rate, "quality": stats.quality
+                }
+            return snapshot
+
+    def _call_llm(self, messages: List[Dict[str, str]]) -> str:
+        return self.default._call_llm(messages)
+
+    async def _acall_llm(self, messages: List[Dict[str, str]]) -> str:
+        return await self.default._acall_llm(messages)
+
+    def _stream_llm(self, messages: List[Dict[str, str]]) -> Iterator[str]:
+        return self.default._stream_llm(messages)
+
+    def _astream_llm(self, messages: List[Dict[str, str]]) -> AsyncIterator[str]:
+        return self.default._astream_llm(messages)
+
+    def close(self) -> None:
+        """Stop observing llm_metrics and close the backends that hold resources."""
+        remove_listener(self._observe)
+        backends = [self.default] + [c for route in self.routes.values() for c in route.candidates]
+        for backend in backends:
+            close = getattr(backend, "close", None)
+            if close is not None:
+                close()
+
+    def to_string(self) -> str:
+        """Convert the object to a string representation."""
+        routes = "; ".join(
+            f"{task}: " + ", ".join(c.model.value for c in route.candidates)
+            for task, route in self.routes.items())
+        return f"Router over {self.default.to_string()} ({routes})"
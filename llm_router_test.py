@@ -0,0 +1,119 @@
+import asyncio
+import time
+from typing import Dict, List
+
+from agents import RedditAnalyzerAgent, SubredditDiscoveryAgent
+from llm_cache import LLMCache
+from llm_metrics import collect
+from llm_policy import PolicyLLM
+from llm_router import ModelRouter, Route
+from llms import BaseLLM, DeepSeekModel, OpenAIModel, ReasoningEffort
+
+
+class FakeLLM(BaseLLM):
+    def __init__(self, model, delay: float = 0.0) -> None:
+        super().__init__("fake_key", model)
+        self.delay = delay
+        self.calls = 0
+
+    def _call_llm(self, messages: List[Dict[str, str]]) -> str:
+        self.calls += 1
+        time.sleep(self.delay)
+        return f"{self.model.value} says hi"
+
+
+def test_routes_agent_methods_to_their_models():
+    heavy = FakeLLM(OpenAIModel.GPT_O1)
+    cheap = FakeLLM(OpenAIModel.GPT_4_O_MINI)
+    router = ModelRouter(heavy, {"summarize_findings": Route([cheap])})
+    analyzer = RedditAnalyzerAgent("k", router)
+
+    with collect("run") as usage:
+        assert analyzer.analyze_comments(["the app keeps crashing on startup"]) == "o1 says hi"
+        assert asyncio.run(analyzer.asummarize_findings("analysis")) == "gpt-4o-mini says hi"
+
+    assert [(call.task, call.model) for call in usage.calls] == [
+        ("analyze_comments", "o1"), ("summarize_findings", "gpt-4o-mini")]
+
+
+def test_slow_candidates_are_passed_over_and_reprobed():
+    now = [0.0]
+    slow = FakeLLM(OpenAIModel.GPT_4_O_MINI, delay=0.05)
+    fast = FakeLLM(DeepSeekModel.DEEPSEEK_CHAT)
+    router = ModelRouter(FakeLLM(OpenAIModel.GPT_4_O), {
+        "SubredditDiscoveryAgent.suggest_search_terms": Route([slow, fast], max_latency=0.02)
+    }, min_samples=2, reprobe_after=60, clock=lambda: now[0])
+    agent = SubredditDiscoveryAgent("k", router)
+
+    for _ in range(4):
+        agent.suggest_search_terms("budget travel")
+    assert (slow.calls, fast.calls) == (2, 2)
+    assert router.stats()["SubredditDiscoveryAgent.suggest_search_terms"]["deepseek-chat"]["samples"] == 2
+
+    now[0] = 120.0
+    agent.suggest_search_terms("budget travel")
+    assert slow.calls == 3
+
+
+def test_low_quality_scores_move_traffic_to_the_next_candidate():
+    first = FakeLLM(OpenAIModel.GPT_4_O_MINI)
+    second = FakeLLM(OpenAIModel.GPT_4_O)
+    router = ModelRouter(second, {"summarize_findings": Route([first, second], min_quality=0.5)},
+                         min_samples=1)
+    agent = RedditAnalyzerAgent("k", router)
+
+    agent.summarize_findings("analysis")
+    router.record_quality("RedditAnalyzerAgent.summarize_findings", "gpt-4o-mini", 0.2)
+    agent.summarize_findings("analysis")
+    assert (first.calls, second.calls) == (1, 1)
+
+
+def test_from_config_builds_backends():
+    router = ModelRouter.from_config({
+        "default": {"model": "o3-mini", "reasoning_effort": "high"},
+        "summarize_findings": [{"model": "gpt-4o-mini"}, {"model": "deepseek-chat", "api_key": "ds"}],
+        "analyze_comments": {"candidates": [{"model": "gpt-4o"}], "max_latency": 30},
+    }, "fake_key")
+
+    assert router.reasoning_effort == ReasoningEffort.HIGH
+    candidates = router.routes["summarize_findings"].candidates
+    assert isinstance(candidates[0], PolicyLLM)
+    assert [c.model.value for c in candidates] == ["gpt-4o-mini", "deepseek-chat"]
+    assert candidates[1].backends[0].api_key == "ds"
+    assert router.routes["analyze_comments"].max_latency == 30
+    assert router.for_task("WriterAgent.write") is router.default
+
+
+def test_router_keeps_caches_already_attached_to_backends():
+    default, fast = FakeLLM(OpenAIModel.GPT_4_O), FakeLLM(OpenAIModel.GPT_4_O_MINI)
+    cache = LLMCache()
+    fast.cache = cache
+
+    router = ModelRouter(default, {"summarize_findings": Route([fast])})
+
+    assert fast.cache is cache and default.cache is None
+    shared = LLMCache()
+    router.cache = shared
+    assert default.cache is shared and fast.cache is shared
+
+
+def test_stats_only_count_this_routers_candidates_until_closed():
+    cheap = FakeLLM(OpenAIModel.GPT_4_O_MINI)
+    router = ModelRouter(FakeLLM(OpenAIModel.GPT_4_O), {"summarize_findings": Route([cheap])})
+    other = ModelRouter(FakeLLM(OpenAIModel.GPT_4_O), {
+        "summarize_findings": Route([FakeLLM(DeepSeekModel.DEEPSEEK_CHAT)])})
+
+    RedditAnalyzerAgent("k", router).summarize_findings("analysis")
+    RedditAnalyzerAgent("k", other).summarize_findings("analysis")
+    RedditAnalyzerAgent("k", router).analyze_comments(["the app keeps crashing on startup"])
+
+    # Neither the other router's model nor the unrouted default call is counted
+    stats = router.stats()
+    assert list(stats) == ["RedditAnalyzerAgent.summarize_findings"]
+    assert list(stats["RedditAnalyzerAgent.summarize_findings"]) == ["gpt-4o-mini"]
+    assert stats["RedditAnalyzerAgent.summarize_findings"]["gpt-4o-mini"]["samples"] == 1
+
+    router.close()
+    RedditAnalyzerAgent("k", router).summarize_findings("analysis")
+    assert router.stats()["RedditAnalyzerAgent.summarize_findings"]["gpt-4o-mini"]["samples"] == 1
+    other.close()
@@ -1,9 +1,147 @@
-from typing import Dict, List, Optional
+import asyncio
+import contextvars
+import functools
+import threading
+import time
+import weakref
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Iterator, List, Optional, TypeVar
 from enum import Enum, auto
 
 import openai
 from openai.types.chat import ChatCompletion
 
+from llm_cache import LLMCache, make_cache_key
+from llm_metrics import CallTracker, record_usage
+
+try:
+    import tiktoken
+except ImportError:  # tiktoken is optional; fall back to a character heuristic
+    tiktoken = None
+
+DEEPSEEK_BASE_URL = "https://api.deepseek.com"
+
+T = TypeVar("T")
+
+# One pooled HTTP client per event loop, shared by every async backend so that
+# concurrent completions reuse connections instead of opening their own.
+# Close it with aclose_http_clients() before the loop ends, or run through run_async.
+_ASYNC_HTTP_CLIENTS: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Any]" = (
+    weakref.WeakKeyDictionary()
+)
+# Closes scheduled on a running loop, referenced until they finish
+_CLOSING: "set[asyncio.Future]" = set()
+
+
+# Transport factories for every OpenAI-compatible client created afterwards
+# (see cassette.Cassette); None means the SDK's own network transport
+_HTTP_TRANSPORT: Optional[Callable[[], Any]] = None
+_ASYNC_HTTP_TRANSPORT: Optional[Callable[[], Any]] = None
+
+
+def set_http_transports(transport: Optional[Callable[[], Any]] = None,
+                        async_transport: Optional[Callable[[], Any]] = None) -> None:
+    """
+    Route the HTTP traffic of backends created from now on through custom
+    transports, e.g. to record or replay it. Call with no arguments to reset.
+    Pooled async clients built on the old transports are closed.
+    """
+    global _HTTP_TRANSPORT, _ASYNC_HTTP_TRANSPORT
+    _HTTP_TRANSPORT, _ASYNC_HTTP_TRANSPORT = transport, async_transport
+    _close_async_http_clients()
+
+
+def _close_async_http_clients() -> None:
+    """
+    Close every pooled client on its own loop: scheduled if that loop is
+    running, run to completion if it is idle. A client whose loop was already
+    closed cannot be closed any more; use run_async to avoid leaving one behind.
+    """
+    clients = list(_ASYNC_HTTP_CLIENTS.items())
+    _ASYNC_HTTP_CLIENTS.clear()
+    try:
+        current = asyncio.get_running_loop()
+    except RuntimeError:
+        current = None
+    for loop, client in clients:
+        if loop.is_closed():
+            continue
+        if loop is current:
+            task = loop.create_task(client.aclose())
+            _CLOSING.add(task)
+            task.add_done_callback(_CLOSING.discard)
+        elif loop.is_running():
+            asyncio.run_coroutine_threadsafe(client.aclose(), loop)
+        elif current is None:
+            loop.run_until_complete(client.aclose())
+        else:
+            # This thread is busy running another loop
+            closer = threading.Thread(target=loop.run_until_complete, args=(client.aclose(),))
+            closer.start()
+            closer.join()
+
+
+def _http_client() -> Any:
+    if _HTTP_TRANSPORT is None:
+        return None
+    return openai.DefaultHttpxClient(transport=_HTTP_TRANSPORT())
+
+
+def _shared_async_http_client() -> Any:
+    loop = asyncio.get_running_loop()
+    client = _ASYNC_HTTP_CLIENTS.get(loop)
+    if client is None:
+        if _ASYNC_HTTP_TRANSPORT is None:
+            client = openai.DefaultAsyncHttpxClient()
+        else:
+            client = openai.DefaultAsyncHttpxClient(transport=_ASYNC_HTTP_TRANSPORT())
+        _ASYNC_HTTP_CLIENTS[loop] = client
+    return client
+
+
+async def aclose_http_clients() -> None:
+    """
+    Close the running loop's pooled HTTP client and its connections. Backends
+    called on this loop afterwards open a new one.
+    """
+    client = _ASYNC_HTTP_CLIENTS.pop(asyncio.get_running_loop(), None)
+    if client is not None:
+        await client.aclose()
+
+
+def run_async(awaitable: Awaitable[T]) -> T:
+    """asyncio.run, closing the loop's pooled HTTP client before the loop is discarded."""
+    async def run() -> T:
+        try:
+            return await awaitable
+        finally:
+            await aclose_http_clients()
+
+    return asyncio.run(run())
+
+
+@functools.lru_cache(maxsize=None)
+def _get_encoding(model: Optional[str]) -> Any:
+    if tiktoken is None:
+        return None
+    try:
+        return tiktoken.encoding_for_model(model) if model else tiktoken.get_encoding("cl100k_base")
+    except Exception:
+        try:
+            return tiktoken.get_encoding("cl100k_base")
+        except Exception:
+            return None
+
+
+def estimate_tokens(text: str, model: Optional[str] = None) -> int:
+    """
+    Estimate the token count of text locally. Uses tiktoken when it is installed
+    and roughly four characters per token otherwise.
+    """
+    encoding = _get_encoding(model)
+    if encoding is None:
+        return len(text) // 4 + 1
+    return len(encoding.encode(text, disallowed_special=()))
+
 
 class OpenAIModel(Enum):
     GPT_3_5_TURBO = "gpt-3.5-turbo"
@@ -28,14 +166,171 @@ class DeepSeekModel(Enum):
     DEEPSEEK_REASONER = "deepseek-reasoner"
 
 
+class TokenStream:
+    """
+    Iterator over completion text deltas. Records the time to the first
+    delta and accumulates the full text as it is consumed.
+    """
+
+    def __init__(self, deltas: Iterator[str]) -> None:
+        self._deltas = deltas
+        self._started = time.perf_counter()
+        self.time_to_first_token: Optional[float] = None
+        self.chunks: List[str] = []
+
+    def __iter__(self) -> "TokenStream":
+        return self
+
+    def __next__(self) -> str:
+        delta = next(self._deltas)
+        if self.time_to_first_token is None:
+            self.time_to_first_token = time.perf_counter() - self._started
+        self.chunks.append(delta)
+        return delta
+
+    @property
+    def text(self) -> str:
+        return "".join(self.chunks)
+
+
+class AsyncTokenStream:
+    """Async counterpart of TokenStream."""
+
+    def __init__(self, deltas: AsyncIterator[str]) -> None:
+        self._deltas = deltas
+        self._started = time.perf_counter()
+        self.time_to_first_token: Optional[float] = None
+        self.chunks: List[str] = []
+
+    def __aiter__(self) -> "AsyncTokenStream":
+        return self
+
+    async def __anext__(self) -> str:
+        delta = await self._deltas.__anext__()
+        if self.time_to_first_token is None:
+            self.time_to_first_token = time.perf_counter() - self._started
+        self.chunks.append(delta)
+        return delta
+
+    @property
+    def text(self) -> str:
+        return "".join(self.chunks)
+
+
 class BaseLLM:
     def __init__(self, api_key: str, model: Enum) -> None:
         self.api_key = api_key
         self.model = model
+        # Optional response cache consulted by complete()/acomplete()
+        self.cache: Optional[LLMCache] = None
+
+    def for_task(self, task: str) -> "BaseLLM":
+        """The backend to use for task ("Agent.method"); routers override this."""
+        return self
+
+    def _cache_key(self, messages: List[Dict[str, str]]) -> str:
+        reasoning_effort = getattr(self, "reasoning_effort", ReasoningEffort.NONE)
+        return make_cache_key(self.model.value, reasoning_effort.value, messages)
+
+    def _cacheable(self, call: CallTracker) -> bool:
+        # A fallback model's answer (see llm_policy) must not be cached under this model's key
+        return call.record.model == self.model.value
+
+    def _track(self, operation: str, messages: List[Dict[str, str]]) -> CallTracker:
+        """Tracker that records this call's timing, usage and cost in llm_metrics."""
+        return CallTracker(self.model.value, operation, messages,
+                           functools.partial(estimate_tokens, model=self.model.value))
+
+    def complete(self, messages: List[Dict[str, str]], use_cache: bool = True) -> str:
+        """Return a completion, served from the cache when one is attached."""
+        with self._track("complete", messages) as call:
+            if self.cache is None or not use_cache:
+                return call.completed(self._call_llm(messages))
+            key = self._cache_key(messages)
+            cached = self.cache.get(key)
+            if cached is not None:
+                call.record.cache_hit = True
+                return cached
+            response = call.completed(self._call_llm(messages))
+            if response and self._cacheable(call):
+                self.cache.set(key, response)
+            return response
+
+    async def acomplete(self, messages: List[Dict[str, str]], use_cache: bool = True) -> str:
+        """Async variant of complete."""
+        with self._track("complete", messages) as call:
+            if self.cache is None or not use_cache:
+                return call.completed(await self._acall_llm(messages))
+            key = self._cache_key(messages)
+            cached = self.cache.get(key)
+            if cached is not None:
+                call.record.cache_hit = True
+                return cached
+            response = call.completed(await self._acall_llm(messages))
+            if response and self._cacheable(call):
+                self.cache.set(key, response)
+            return response
+
+    def stream(self, messages: List[Dict[str, str]], use_cache: bool = True) -> TokenStream:
+        """Stream a completion as text deltas. Cache hits arrive as a single delta."""
+        call = self._track("stream", messages)
+
+        def deltas() -> Iterator[str]:
+            key = self._cache_key(messages) if self.cache is not None and use_cache else None
+            cached = self.cache.get(key) if key is not None else None
+            if cached is not None:
+                call.record.cache_hit = True
+                yield cached
+                return
+            chunks = []
+            for delta in self._stream_llm(messages):
+                chunks.append(delta)
+                yield delta
+            if key is not None and chunks and self._cacheable(call):
+                self.cache.set(key, "".join(chunks))
+
+        return TokenStream(call.iterate(deltas()))
+
+    def astream(self, messages: List[Dict[str, str]], use_cache: bool = True) -> AsyncTokenStream:
+        """Async variant of stream."""
+        call = self._track("stream", messages)
+
+        async def deltas() -> AsyncIterator[str]:
+            key = self._cache_key(messages) if self.cache is not None and use_cache else None
+            cached = self.cache.get(key) if key is not None else None
+            if cached is not None:
+                call.record.cache_hit = True
+                yield cached
+                return
+            chunks = []
+            async for delta in self._astream_llm(messages):
+                chunks.append(delta)
+                yield delta
+            if key is not None and chunks and self._cacheable(call):
+                self.cache.set(key, "".join(chunks))
+
+        return AsyncTokenStream(call.aiterate(deltas()))
 
     def _call_llm(self, messages: List[Dict[str, str]]) -> str:
         raise NotImplementedError
 
+    def _stream_llm(self, messages: List[Dict[str, str]]) -> Iterator[str]:
+        """Yield completion deltas. Backends without streaming yield the whole text once."""
+        yield self._call_llm(messages)
+
+    async def _astream_llm(self, messages: List[Dict[str, str]]) -> AsyncIterator[str]:
+        yield await self._acall_llm(messages)
+
+    async def _acall_llm(self, messages: List[Dict[str, str]]) -> str:
+        """
+        Async counterpart of _call_llm. Backends without a native async client
+        run the blocking call in the loop's default executor.
+        """
+        loop = asyncio.get_running_loop()
+        # Carry the context over so usage is attributed to the call in progress
+        return await loop.run_in_executor(
+            None, contextvars.copy_context().run, self._call_llm, messages)
+
     def _format_message(self, role: str, content: str) -> Dict[str, str]:
         return {"role": role, "content": content}
 
@@ -44,13 +339,79 @@ class BaseLLM:
         return f"Model: {self.model.value}"
 
 
-class OpenAI(BaseLLM):
+class _OpenAICompatibleLLM(BaseLLM):
+    """Shared client plumbing for backends that speak the OpenAI API."""
+
+    def __init__(self, api_key: str, model: Enum, base_url: Optional[str] = None) -> None:
+        super().__init__(api_key, model)
+        self.base_url = base_url
+        self.client = openai.OpenAI(api_key=api_key, base_url=base_url, http_client=_http_client())
+        # Per loop, the pooled HTTP client and this backend's client on top of it
+        self._async_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Any]" = (
+            weakref.WeakKeyDictionary()
+        )
+
+    def _get_async_client(self) -> openai.AsyncOpenAI:
+        """Return this backend's async client for the running loop, on the shared pool."""
+        loop = asyncio.get_running_loop()
+        http_client = _shared_async_http_client()
+        pooled, client = self._async_clients.get(loop, (None, None))
+        if pooled is not http_client:  # first call, or the pool was closed since
+            client = openai.AsyncOpenAI(
+                api_key=self.api_key,
+                base_url=self.base_url,
+                http_client=http_client
+            )
+            self._async_clients[loop] = (http_client, client)
+        return client
+
+    def _completion_kwargs(self, messages: List[Dict[str, str]]) -> Dict[str, Any]:
+        return {
+            "model": self.model.value,
+            "messages": [self._format_message(m["role"], m["content"]) for m in messages]
+        }
+
+    def _call_llm(self, messages: List[Dict[str, str]]) -> str:
+        response: ChatCompletion = self.client.chat.completions.create(
+            **self._completion_kwargs(messages))
+        record_usage(response.usage)
+        return response.choices[0].message.content
+
+    async def _acall_llm(self, messages: List[Dict[str, str]]) -> str:
+        client = self._get_async_client()
+        response: ChatCompletion = await client.chat.completions.create(
+            **self._completion_kwargs(messages))
+        record_usage(response.usage)
+        return response.choices[0].message.content
+
+    def _stream_llm(self, messages: List[Dict[str, str]]) -> Iterator[str]:
+        response = self.client.chat.completions.create(
+            **self._completion_kwargs(messages), stream=True,
+            stream_options={"include_usage": True})
+        for chunk in response:
+            # The final chunk carries usage for the whole stream and no choices
+            record_usage(chunk.usage)
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+
+    async def _astream_llm(self, messages: List[Dict[str, str]]) -> AsyncIterator[str]:
+        client = self._get_async_client()
+        response = await client.chat.completions.create(
+            **self._completion_kwargs(messages), stream=True,
+            stream_options={"include_usage": True})
+        async for chunk in response:
+            record_usage(chunk.usage)
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+
+
+class OpenAI(_OpenAICompatibleLLM):
     def __init__(self, 
                 api_key: str, 
                 model: OpenAIModel = OpenAIModel.GPT_3_5_TURBO,
-                reasoning_effort: ReasoningEffort = ReasoningEffort.NONE) -> None:
-        super().__init__(api_key, model)
-        self.client = openai.OpenAI(api_key=api_key)
+                reasoning_effort: ReasoningEffort = ReasoningEffort.NONE,
+                base_url: Optional[str] = None) -> None:
+        super().__init__(api_key, model, base_url)
         self.reasoning_effort = reasoning_effort
         
     def _is_reasoning_model(self) -> bool:
@@ -61,20 +422,14 @@ class OpenAI(BaseLLM):
         ]
         return self.model.value in reasoning_models
 
-    def _call_llm(self, messages: List[Dict[str, str]]) -> str:
-        kwargs = {
-            "model": self.model.value,
-            "messages": [self._format_message(m["role"], m["content"]) for m in messages]
-        }
+    def _completion_kwargs(self, messages: List[Dict[str, str]]) -> Dict[str, Any]:
+        kwargs = super()._completion_kwargs(messages)
         
         # Add reasoning_effort parameter for reasoning models if specified
         if self._is_reasoning_model() and self.reasoning_effort != ReasoningEffort.NONE:
             kwargs["reasoning_effort"] = self.reasoning_effort.value
 
-        print(kwargs)
-            
-        response: ChatCompletion = self.client.chat.completions.create(**kwargs)
-        return response.choices[0].message.content
+        return kwargs
 
     def to_string(self) -> str:
         """Convert the object to a string representation."""
@@ -84,19 +439,12 @@ class OpenAI(BaseLLM):
         return base_str
 
 
-class DeepSeek(BaseLLM):
-    def __init__(self, api_key: str, model: DeepSeekModel = DeepSeekModel.DEEPSEEK_CHAT) -> None:
-        super().__init__(api_key, model)
-        self.client = openai.OpenAI(
-            api_key=api_key, base_url="https://api.deepseek.com")
-
-    def _call_llm(self, messages: List[Dict[str, str]]) -> str:
-        response: ChatCompletion = self.client.chat.completions.create(
-            model=self.model.value,
-            messages=[self._format_message(
-                m["role"], m["content"]) for m in messages]
-        )
-        return response.choices[0].message.content
+class DeepSeek(_OpenAICompatibleLLM):
+    def __init__(self,
+                 api_key: str,
+                 model: DeepSeekModel = DeepSeekModel.DEEPSEEK_CHAT,
+                 base_url: str = DEEPSEEK_BASE_URL) -> None:
+        super().__init__(api_key, model, base_url)
 
     def to_string(self) -> str:
         """Convert the object to a string representation."""
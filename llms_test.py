@@ -0,0 +1,210 @@
+import asyncio
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Tuple
+
+import llm_metrics
+import llms
+from llms import DeepSeek, OpenAI, OpenAIModel
+
+RESPONSE_DELAY = 0.2
+USAGE = {"prompt_tokens": 120, "completion_tokens": 30, "total_tokens": 150,
+         "prompt_tokens_details": {"cached_tokens": 100},
+         "completion_tokens_details": {"reasoning_tokens": 10}}
+
+
+class FakeChatHandler(BaseHTTPRequestHandler):
+    """Minimal stand-in for the /chat/completions endpoint."""
+
+    requests: List[Dict] = []
+
+    def do_POST(self) -> None:
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        FakeChatHandler.requests.append(body)
+        time.sleep(RESPONSE_DELAY)
+        if body.get("stream"):
+            self._stream(body)
+            return
+        payload = json.dumps({
+            "id": "chatcmpl-test",
+            "object": "chat.completion",
+            "created": 0,
+            "model": body["model"],
+            "choices": [{
+                "index": 0,
+                "finish_reason": "stop",
+                "message": {"role": "assistant", "content": f"echo: {body['messages'][-1]['content']}"}
+            }],
+            "usage": USAGE
+        }).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _stream(self, body: Dict) -> None:
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.end_headers()
+        for word in f"echo: {body['messages'][-1]['content']}".split(" "):
+            chunk = {
+                "id": "chatcmpl-test",
+                "object": "chat.completion.chunk",
+                "created": 0,
+                "model": body["model"],
+                "choices": [{"index": 0, "finish_reason": None,
+                             "delta": {"role": "assistant", "content": word + " "}}]
+            }
+            self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode())
+            self.wfile.flush()
+            time.sleep(RESPONSE_DELAY / 4)
+        if body.get("stream_options", {}).get("include_usage"):
+            chunk = {"id": "chatcmpl-test", "object": "chat.completion.chunk", "created": 0,
+                     "model": body["model"], "choices": [], "usage": USAGE}
+            self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode())
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.wfile.flush()
+        self.close_connection = True
+
+    def log_message(self, *args) -> None:
+        pass
+
+
+class FakeServer(ThreadingHTTPServer):
+    # The default backlog of 5 stalls bursts of concurrent connections
+    request_queue_size = 64
+
+
+def start_fake_server() -> Tuple[ThreadingHTTPServer, str]:
+    server = FakeServer(("127.0.0.1", 0), FakeChatHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}/v1"
+
+
+def test_acall_llm_runs_completions_concurrently():
+    server, base_url = start_fake_server()
+    try:
+        llm = OpenAI("fake_key", OpenAIModel.GPT_4_O_MINI, base_url=base_url)
+
+        async def run() -> Tuple[List[str], float]:
+            # Warm up the client so only the completions themselves are timed
+            await llm._acall_llm([{"role": "user", "content": "warm up"}])
+            start = time.monotonic()
+            responses = await asyncio.gather(*[
+                llm._acall_llm([{"role": "user", "content": f"question {i}"}])
+                for i in range(10)
+            ])
+            return list(responses), time.monotonic() - start
+
+        responses, elapsed = asyncio.run(run())
+
+        assert responses == [f"echo: question {i}" for i in range(10)]
+        # Ten serial round-trips would take 10 * RESPONSE_DELAY
+        assert elapsed < 5 * RESPONSE_DELAY
+    finally:
+        server.shutdown()
+
+
+def test_deepseek_acall_llm():
+    server, base_url = start_fake_server()
+    try:
+        llm = DeepSeek("fake_key", base_url=base_url)
+        response = asyncio.run(llm._acall_llm([{"role": "user", "content": "hello"}]))
+        assert response == "echo: hello"
+        assert FakeChatHandler.requests[-1]["model"] == "deepseek-chat"
+    finally:
+        server.shutdown()
+
+
+def test_stream_yields_deltas_before_completion():
+    server, base_url = start_fake_server()
+    try:
+        llm = OpenAI("fake_key", OpenAIModel.GPT_4_O_MINI, base_url=base_url)
+        stream = llm.stream([{"role": "user", "content": "one two three"}])
+        deltas = list(stream)
+
+        assert deltas == ["echo: ", "one ", "two ", "three "]
+        assert stream.text == "echo: one two three "
+        assert stream.time_to_first_token is not None
+
+        async def consume() -> str:
+            astream = llm.astream([{"role": "user", "content": "four"}])
+            return "".join([delta async for delta in astream])
+
+        assert asyncio.run(consume()) == "echo: four "
+    finally:
+        server.shutdown()
+
+
+def test_usage_is_recorded_for_calls_and_streams():
+    server, base_url = start_fake_server()
+    try:
+        llm = OpenAI("fake_key", OpenAIModel.GPT_4_O_MINI, base_url=base_url)
+        with llm_metrics.collect("test") as usage:
+            llm.complete([{"role": "user", "content": "hello"}])
+            list(llm.stream([{"role": "user", "content": "hello"}]))
+
+            async def run() -> str:
+                return await llm.acomplete([{"role": "user", "content": "hello"}])
+
+            asyncio.run(run())
+
+        assert [call.operation for call in usage.calls] == ["complete", "stream", "complete"]
+        for call in usage.calls:
+            assert (call.prompt_tokens, call.completion_tokens) == (120, 30)
+            assert (call.cached_tokens, call.reasoning_tokens) == (100, 10)
+            assert not call.estimated
+            # 20 uncached + 100 cached prompt tokens, 30 output tokens
+            assert abs(call.cost - (20 * 0.15 + 100 * 0.075 + 30 * 0.60) / 1_000_000) < 1e-12
+        assert usage.calls[1].time_to_first_token is not None
+        assert usage.totals()["prompt_tokens"] == 360
+    finally:
+        server.shutdown()
+
+
+def test_run_async_closes_the_pooled_client_and_backends_reopen_it():
+    server, base_url = start_fake_server()
+    try:
+        llm = OpenAI("fake_key", OpenAIModel.GPT_4_O_MINI, base_url=base_url)
+        pooled = []
+
+        async def run() -> List[str]:
+            first = await llm._acall_llm([{"role": "user", "content": "one"}])
+            pooled.append(llms._ASYNC_HTTP_CLIENTS[asyncio.get_running_loop()])
+            await llms.aclose_http_clients()
+            # A closed pool is replaced on the next call
+            second = await llm._acall_llm([{"role": "user", "content": "two"}])
+            pooled.append(llms._ASYNC_HTTP_CLIENTS[asyncio.get_running_loop()])
+            return [first, second]
+
+        assert llms.run_async(run()) == ["echo: one", "echo: two"]
+        assert pooled[0] is not pooled[1]
+        assert all(client.is_closed for client in pooled)
+        assert len(llms._ASYNC_HTTP_CLIENTS) == 0
+    finally:
+        server.shutdown()
+
+
+def test_resetting_transports_closes_the_pooled_clients():
+    async def pooled() -> object:
+        return llms._shared_async_http_client()
+
+    idle_loop = asyncio.new_event_loop()
+    try:
+        idle = idle_loop.run_until_complete(pooled())
+
+        async def run() -> Tuple[object, bool]:
+            running = llms._shared_async_http_client()
+            llms.set_http_transports()
+            for _ in range(5):
+                await asyncio.sleep(0)
+            return running, running.is_closed
+
+        running, closed_while_running = asyncio.run(run())
+        assert idle.is_closed and closed_while_running
+        assert len(llms._ASYNC_HTTP_CLIENTS) == 0
+    finally:
+        idle_loop.close()
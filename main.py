@@ -1,53 +1,94 @@
 import os
+from cassette import Cassette, REPLAY
 from coordinator import AgentCoordinator
+from subreddit_discovery import SubredditCache
+
+def print_delta(delta: str) -> None:
+    print(delta, end="", flush=True)
+
+def print_usage(usage: dict) -> None:
+    totals = usage["totals"]
+    print(f"\n(LLM calls: {totals.get('calls', 0)}, "
+          f"tokens: {totals.get('prompt_tokens', 0)} in / {totals.get('completion_tokens', 0)} out, "
+          f"cached: {usage['prompt_cache']['cached_tokens']}, "
+          f"estimated cost: ${totals.get('cost', 0.0):.4f})")
 
 def main():
+    # REDDITBOT_CASSETTE=<path> with REDDITBOT_CASSETTE_MODE=record captures the
+    # run; the default replay mode re-runs it offline without credentials
+    cassette_path = os.getenv("REDDITBOT_CASSETTE")
+    if cassette_path:
+        cassette = Cassette(cassette_path, os.getenv("REDDITBOT_CASSETTE_MODE", REPLAY))
+        with cassette:
+            run(cassette)
+    else:
+        run()
+
+def run(cassette=None):
     # Get API keys from environment variables
     openai_api_key = os.getenv("OPENAI_API_KEY")
     reddit_client_id = os.getenv("REDDIT_CLIENT_ID")
     reddit_client_secret = os.getenv("REDDIT_CLIENT_SECRET")
     
+    if cassette is not None and not cassette.recording:
+        openai_api_key, reddit_client_id, reddit_client_secret = "replay", "replay", "replay"
     if not all([openai_api_key, reddit_client_id, reddit_client_secret]):
         raise ValueError("Please set all required environment variables")
 
-    coordinator = AgentCoordinator(
-        api_key=openai_api_key,
-        reddit_client_id=reddit_client_id,
-        reddit_client_secret=reddit_client_secret
-    )
+    # Discovery results persist across runs (REDDITBOT_SUBREDDIT_CACHE), except
+    # under a cassette, where a warm cache would skip recorded requests
+    subreddit_cache = None
+    if cassette is None:
+        cache_path = os.getenv("REDDITBOT_SUBREDDIT_CACHE", "subreddit_cache.db")
+        subreddit_cache = SubredditCache(cache_path)
+
+    with AgentCoordinator(
+            api_key=openai_api_key,
+            reddit_client_id=reddit_client_id,
+            reddit_client_secret=reddit_client_secret,
+            cassette=cassette,
+            subreddit_cache=subreddit_cache
+    ) as coordinator:
     
-    # Example: Analyze complaints in a specific subreddit
-    results = coordinator.analyze_reddit_complaints(
-        subreddit="techsupport",
-        search_query="problem",
-        limit=50
-    )
+        # Example: Analyze complaints in a specific subreddit
+        print("=== Reddit Analysis Final Report ===")
+        results = coordinator.analyze_reddit_complaints(
+            subreddit="techsupport",
+            search_query="problem",
+            limit=50,
+            on_report_delta=print_delta
+        )
+        print(f"\n(time to first token: {results['report_time_to_first_token'] or 0.0:.2f}s)")
     
-    print("=== Reddit Analysis Results ===")
-    print("\nSummary of Issues:")
-    print(results["summary"])
-    print("\nDetailed Analysis:")
-    print(results["detailed_analysis"])
-    print("\nAdditional Insights:")
-    print(results["insights"])
-    print("\nFinal Report:")
-    print(results["final_report"])
-
-    # Example: Find deal-hunting related subreddits
-    results = coordinator.discover_subreddits(
-        topic="deal finding and bargain hunting",
-        limit=25
-    )
+        print("\n=== Reddit Analysis Results ===")
+        print("\nSummary of Issues:")
+        print(results["summary"])
+        print("\nDetailed Analysis:")
+        print(results["detailed_analysis"])
+        print("\nAdditional Insights:")
+        print(results["insights"])
+        print_usage(results["llm_usage"])
+
+        # Example: Find deal-hunting related subreddits
+        print("\n=== Subreddit Discovery Final Report ===")
+        results = coordinator.discover_subreddits(
+            topic="deal finding and bargain hunting",
+            limit=25,
+            on_report_delta=print_delta
+        )
+        print(f"\n(time to first token: {results['report_time_to_first_token'] or 0.0:.2f}s)")
     
-    print("=== Subreddit Discovery Results ===")
-    print("\nSearch Terms Used:")
-    print("\n".join(results["search_terms_used"]))
-    print("\nAnalysis:")
-    print(results["analysis"])
-    print("\nAdditional Insights:")
-    print(results["insights"])
-    print("\nFinal Report:")
-    print(results["final_report"])
+        print("\n=== Subreddit Discovery Results ===")
+        print("\nSearch Terms Used:")
+        print("\n".join(results["search_terms_used"]))
+        print("\nAnalysis:")
+        print(results["analysis"])
+        print("\nAdditional Insights:")
+        print(results["insights"])
+        print_usage(results["llm_usage"])
+
+    if subreddit_cache is not None:
+        subreddit_cache.close()
 
 if __name__ == "__main__":
     main() 
\ No newline at end of file
@@ -0,0 +1,238 @@
+"""
+Long-running monitor: re-analyzes a watchlist of subreddits on a schedule.
+
+    python monitor.py watchlist.json --store monitor.db --concurrency 4
+
+The watchlist is a JSON list of jobs:
+
+    [{"subreddit": "techsupport", "search_query": "problem", "interval": 1800},
+     {"subreddit": "python", "interval": 3600, "limit": 200}]
+
+One AgentCoordinator serves every run, so the PRAW session, the OpenAI
+clients and their connection pools, and the preprocessing worker processes
+stay warm for the life of the process. Scrapes are incremental against the
+comment store, and a run that finds no new comments makes no LLM calls.
+"""
+import argparse
+import asyncio
+import heapq
+import json
+import os
+import random
+import signal
+import time
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional, Set, Tuple
+
+from comment_store import CommentStore
+from coordinator import AgentCoordinator
+from corpus import Corpus
+from llms import run_async
+
+
+@dataclass
+class WatchJob:
+    """One subreddit (optionally narrowed by a search) to re-analyze every interval seconds."""
+    subreddit: str
+    search_query: Optional[str] = None
+    interval: float = 3600.0
+    limit: int = 100
+
+    @property
+    def name(self) -> str:
+        return f"r/{self.subreddit}" + (f" ({self.search_query})" if self.search_query else "")
+
+
+@dataclass
+class JobStats:
+    runs: int = 0
+    skipped: int = 0
+    failures: int = 0
+    last_started: Optional[float] = None
+    last_duration: Optional[float] = None
+    last_error: Optional[str] = None
+
+
+def load_watchlist(path: str) -> List[WatchJob]:
+    with open(path, encoding="utf-8") as f:
+        return [WatchJob(**entry) for entry in json.load(f)]
+
+
+class Monitor:
+    """
+    Async scheduler for WatchJobs. Each job is rescheduled interval seconds
+    after its last run started, scaled by a random factor within +/- jitter so
+    jobs sharing an interval drift apart, and first runs are spread over the
+    first jitter fraction of the interval. At most max_concurrency analyses
+    run at once, and a job never overlaps itself.
+
+    run() drives the schedule in real time; start() and launch_due() step it
+    by hand, e.g. against a fake clock.
+    """
+
+    def __init__(self,
+                 coordinator: AgentCoordinator,
+                 jobs: List[WatchJob],
+                 max_concurrency: int = 4,
+                 jitter: float = 0.1,
+                 on_result: Optional[Callable[[WatchJob, Dict], None]] = None,
+                 seed: Optional[int] = None,
+                 clock: Callable[[], float] = time.monotonic):
+        if coordinator.comment_store is None:
+            raise ValueError("Monitoring scrapes incrementally and requires a comment_store")
+        self.coordinator = coordinator
+        self.jobs = list(jobs)
+        self.max_concurrency = max_concurrency
+        self.jitter = jitter
+        self.on_result = on_result or print_result
+        self.stats: Dict[str, JobStats] = {job.name: JobStats() for job in self.jobs}
+        self._random = random.Random(seed)
+        self._clock = clock
+        self._queue: List[Tuple[float, int]] = []
+        self._wakeup: Optional[asyncio.Event] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._running: Set["asyncio.Task[None]"] = set()
+
+    def _schedule(self, index: int, delay: float) -> None:
+        heapq.heappush(self._queue, (self._clock() + delay, index))
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    def _next_delay(self, job: WatchJob) -> float:
+        return job.interval * (1.0 + self._random.uniform(-self.jitter, self.jitter))
+
+    async def run_job(self, job: WatchJob) -> Dict:
+        """Analyze whatever is new for job, skipping the LLM when nothing is."""
+        return await self.coordinator.aanalyze_reddit_complaints(
+            job.subreddit, job.search_query, job.limit, incremental=True, skip_empty=True)
+
+    async def _run(self, index: int, semaphore: asyncio.Semaphore) -> None:
+        job = self.jobs[index]
+        stats = self.stats[job.name]
+        async with semaphore:
+            started = self._clock()
+            stats.last_started = started
+            try:
+                result = await self.run_job(job)
+            except Exception as e:
+                print(f"Monitoring {job.name} failed: {e}")
+                stats.failures += 1
+                stats.last_error = str(e)
+            else:
+                stats.runs += 1
+                stats.skipped += bool(result.get("skipped"))
+                # The analysis succeeded, but archiving it may not have
+                stats.last_error = result.get("corpus_error")
+                self.on_result(job, result)
+            finally:
+                stats.last_duration = self._clock() - started
+        self._schedule(index, max(0.0, started + self._next_delay(job) - self._clock()))
+
+    async def _wait(self, timeout: Optional[float], stop: asyncio.Event) -> None:
+        assert self._wakeup is not None
+        self._wakeup.clear()
+        waiters = [asyncio.ensure_future(stop.wait()), asyncio.ensure_future(self._wakeup.wait())]
+        try:
+            await asyncio.wait(waiters, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            for waiter in waiters:
+                waiter.cancel()
+
+    def start(self) -> None:
+        """Schedule every job's first run. Call from the event loop that runs them."""
+        self._wakeup = asyncio.Event()
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        self._queue = []
+        for index, job in enumerate(self.jobs):
+            self._schedule(index, self._random.uniform(0.0, self.jitter * job.interval))
+
+    def launch_due(self) -> Optional[float]:
+        """
+        Start every job that is due, as tasks. Returns the seconds until the
+        next one is due, or None while none is scheduled (jobs still running
+        reschedule themselves when they finish).
+        """
+        assert self._semaphore is not None, "call start() first"
+        while self._queue:
+            due, index = self._queue[0]
+            delay = due - self._clock()
+            if delay > 0:
+                return delay
+            heapq.heappop(self._queue)
+            task = asyncio.ensure_future(self._run(index, self._semaphore))
+            self._running.add(task)
+            task.add_done_callback(self._running.discard)
+        return None
+
+    async def drain(self) -> None:
+        """Wait for the analyses in flight."""
+        if self._running:
+            await asyncio.gather(*self._running, return_exceptions=True)
+
+    async def run(self, stop: Optional[asyncio.Event] = None) -> None:
+        """Run until stop is set, then wait for the analyses in flight."""
+        stop = stop or asyncio.Event()
+        self.start()
+        while not stop.is_set():
+            await self._wait(self.launch_due(), stop)
+        await self.drain()
+
+
+def print_result(job: WatchJob, result: Dict) -> None:
+    usage = result["llm_usage"]["totals"]
+    if result.get("skipped"):
+        print(f"[{time.strftime('%H:%M:%S')}] {job.name}: no new comments")
+        return
+    print(f"[{time.strftime('%H:%M:%S')}] {job.name}: {len(result['raw_comments'])} new comments, "
+          f"{usage.get('calls', 0)} LLM calls, ${usage.get('cost', 0.0):.4f}")
+    print(result["summary"])
+
+
+def _install_signal_handlers(stop: asyncio.Event) -> None:
+    loop = asyncio.get_running_loop()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(signum, stop.set)
+        except (NotImplementedError, RuntimeError):  # e.g. Windows
+            pass
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Re-analyze a watchlist of subreddits on a schedule")
+    parser.add_argument("watchlist", help="JSON list of {subreddit, search_query, interval, limit}")
+    parser.add_argument("--store", default="monitor.db", help="comment store for incremental scrapes")
+    parser.add_argument("--corpus", help="archive comments and analyses under this directory")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--jitter", type=float, default=0.1)
+    args = parser.parse_args(argv)
+
+    openai_api_key = os.getenv("OPENAI_API_KEY")
+    reddit_client_id = os.getenv("REDDIT_CLIENT_ID")
+    reddit_client_secret = os.getenv("REDDIT_CLIENT_SECRET")
+    if not all([openai_api_key, reddit_client_id, reddit_client_secret]):
+        raise ValueError("Please set all required environment variables")
+
+    coordinator = AgentCoordinator(
+        api_key=openai_api_key,
+        reddit_client_id=reddit_client_id,
+        reddit_client_secret=reddit_client_secret,
+        comment_store=CommentStore(args.store),
+        corpus=Corpus(args.corpus) if args.corpus else None
+    )
+    monitor = Monitor(coordinator, load_watchlist(args.watchlist),
+                      max_concurrency=args.concurrency, jitter=args.jitter)
+
+    async def run() -> None:
+        stop = asyncio.Event()
+        _install_signal_handlers(stop)
+        await monitor.run(stop)
+
+    try:
+        run_async(run())
+    finally:
+        coordinator.close()
+        coordinator.comment_store.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+import asyncio
+from typing import Dict, List, Optional
+
+from comment_store import CommentStore
+from coordinator import AgentCoordinator
+from llms import BaseLLM, OpenAIModel
+from monitor import Monitor, WatchJob
+from reddit_utils import NewComments
+
+
+class FakeClock:
+    def __init__(self) -> None:
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+class FakeCoordinator:
+    """Records calls, each held until gate opens; reports no new comments on every other run."""
+
+    def __init__(self) -> None:
+        self.comment_store = object()
+        self.calls: List[str] = []
+        self.active = 0
+        self.max_active = 0
+        self.gate = asyncio.Event()
+
+    async def aanalyze_reddit_complaints(self, subreddit: str, search_query: Optional[str],
+                                         limit: int, incremental: bool, skip_empty: bool) -> Dict:
+        assert incremental and skip_empty
+        self.calls.append(subreddit)
+        self.active += 1
+        self.max_active = max(self.max_active, self.active)
+        try:
+            await self.gate.wait()
+        finally:
+            self.active -= 1
+        if subreddit == "broken":
+            raise RuntimeError("scrape failed")
+        return {"skipped": len(self.calls) % 2 == 0, "raw_comments": [], "summary": "",
+                "llm_usage": {"totals": {}}}
+
+
+async def settle() -> None:
+    for _ in range(10):
+        await asyncio.sleep(0)
+
+
+def test_monitor_runs_jobs_on_their_intervals_with_a_concurrency_cap():
+    clock = FakeClock()
+    coordinator = FakeCoordinator()
+    jobs = [WatchJob("fast", interval=10), WatchJob("slow", interval=100),
+            WatchJob("other", interval=10), WatchJob("broken", interval=10)]
+    results = []
+    monitor = Monitor(coordinator, jobs, max_concurrency=2, jitter=0.0,
+                      on_result=lambda job, result: results.append(job.subreddit), clock=clock)
+
+    async def run() -> None:
+        monitor.start()
+        # Every job is due at once, but only two run
+        assert monitor.launch_due() is None
+        await settle()
+        assert coordinator.calls == ["fast", "slow"] and coordinator.active == 2
+        coordinator.gate.set()
+        await monitor.drain()
+        for now in range(5, 101, 5):
+            clock.now = float(now)
+            # Jobs started now are only rescheduled once they finish
+            expected = 5.0 if now % 10 else (100.0 - now if now < 100 else None)
+            assert monitor.launch_due() == expected
+            await monitor.drain()
+
+    asyncio.run(run())
+
+    assert coordinator.max_active == 2
+    assert coordinator.calls.count("fast") == 11
+    assert coordinator.calls.count("slow") == 2
+    stats = monitor.stats
+    assert stats["r/broken"].failures == 11 and stats["r/broken"].runs == 0
+    assert "scrape failed" in stats["r/broken"].last_error
+    assert stats["r/fast"].runs == results.count("fast") == 11
+    assert stats["r/fast"].last_started == 100.0
+    assert sum(s.skipped for s in stats.values()) > 0
+
+
+def test_jitter_spreads_first_runs_and_intervals():
+    clock = FakeClock()
+    jobs = [WatchJob(f"sub{i}", interval=100) for i in range(5)]
+    monitor = Monitor(FakeCoordinator(), jobs, jitter=0.1, seed=1, clock=clock)
+
+    async def run() -> None:
+        monitor.start()
+        firsts = sorted(due for due, _ in monitor._queue)
+        assert all(0.0 <= due <= 10.0 for due in firsts) and len(set(firsts)) == 5
+
+    asyncio.run(run())
+    assert all(90.0 <= monitor._next_delay(job) <= 110.0 for job in jobs)
+
+
+def test_run_stops_and_waits_for_the_analyses_in_flight():
+    coordinator = FakeCoordinator()
+    coordinator.gate.set()
+    jobs = [WatchJob("fast", interval=3600), WatchJob("other", interval=3600)]
+    stop_after_first = []
+
+    async def run() -> None:
+        stop = asyncio.Event()
+
+        def on_result(job: WatchJob, result: Dict) -> None:
+            stop_after_first.append(job.subreddit)
+            stop.set()
+
+        monitor = Monitor(coordinator, jobs, jitter=0.0, on_result=on_result)
+        await monitor.run(stop)
+
+    asyncio.run(run())
+    # Both were started before the stop and both were waited for
+    assert sorted(stop_after_first) == ["fast", "other"]
+
+
+class NoLLM(BaseLLM):
+    def __init__(self) -> None:
+        super().__init__("fake_key", OpenAIModel.GPT_4_O_MINI)
+
+    def _call_llm(self, messages):
+        raise AssertionError("LLM called for an empty incremental run")
+
+    async def _acall_llm(self, messages):
+        raise AssertionError("LLM called for an empty incremental run")
+
+
+class NoNewComments:
+    def fetch_new_comments(self, store, subreddit_name, search_query=None, time_filter="week"):
+        return NewComments(subreddit_name, search_query, [], {})
+
+
+def test_empty_incremental_run_skips_llm_stages(tmp_path):
+    store = CommentStore(str(tmp_path / "comments.db"))
+    coordinator = AgentCoordinator("fake_key", "fake_id", "fake_secret", llm=NoLLM(),
+                                   comment_store=store)
+    coordinator.reddit_scraper = NoNewComments()
+    try:
+        result = asyncio.run(coordinator.aanalyze_reddit_complaints(
+            "python", incremental=True, skip_empty=True))
+        assert result["skipped"] is True
+        assert coordinator.analyze_reddit_complaints(
+            "python", incremental=True, skip_empty=True)["skipped"] is True
+        assert result["llm_usage"]["totals"].get("calls", 0) == 0
+    finally:
+        coordinator.close()
+        store.close()
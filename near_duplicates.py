@@ -0,0 +1,109 @@
+import re
+import zlib
+from collections import defaultdict
+from dataclasses import dataclass, field
+from typing import Dict, List, Sequence
+
+import numpy as np
+
+_MERSENNE_PRIME = np.uint64((1 << 61) - 1)
+_MAX_HASH = np.uint64((1 << 32) - 1)
+_NON_WORD = re.compile(r"[^a-z0-9 ]+")
+_SPACES = re.compile(r"\s+")
+
+
+@dataclass
+class CommentCluster:
+    """A group of near-identical comments, represented by its first member."""
+    representative: str
+    members: List[int] = field(default_factory=list)
+
+    @property
+    def count(self) -> int:
+        return len(self.members)
+
+
+class NearDuplicateCollapser:
+    """
+    Collapses near-duplicate comments ("same here", copy-pasted error logs,
+    reposted complaints) with character shingling, MinHash signatures and LSH
+    banding. Candidate pairs from shared LSH buckets are confirmed against the
+    estimated Jaccard similarity before being merged.
+    """
+
+    def __init__(self,
+                 threshold: float = 0.7,
+                 num_perm: int = 128,
+                 bands: int = 16,
+                 shingle_size: int = 5,
+                 seed: int = 1):
+        if num_perm % bands:
+            raise ValueError("num_perm must be divisible by bands")
+        self.threshold = threshold
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.shingle_size = shingle_size
+        rng = np.random.default_rng(seed)
+        self._a = rng.integers(1, _MERSENNE_PRIME, size=num_perm, dtype=np.uint64)
+        self._b = rng.integers(0, _MERSENNE_PRIME, size=num_perm, dtype=np.uint64)
+
+    def _shingles(self, text: str) -> np.ndarray:
+        normalized = _SPACES.sub(" ", _NON_WORD.sub(" ", text.lower())).strip()
+        size = self.shingle_size
+        if len(normalized) <= size:
+            grams = {normalized}
+        else:
+            grams = {normalized[i:i + size] for i in range(len(normalized) - size + 1)}
+        return np.fromiter((zlib.crc32(g.encode("utf-8")) for g in grams),
+                           dtype=np.uint64, count=len(grams))
+
+    def signatures(self, texts: Sequence[str]) -> np.ndarray:
+        """MinHash signature matrix of shape (len(texts), num_perm)."""
+        signatures = np.empty((len(texts), self.num_perm), dtype=np.uint64)
+        with np.errstate(over="ignore"):
+            for i, text in enumerate(texts):
+                hashes = self._shingles(text)
+                # (num_perm, n_shingles) universal hashes; uint64 wrap-around is intended
+                permuted = (np.outer(self._a, hashes) + self._b[:, None]) % _MERSENNE_PRIME
+                signatures[i] = np.bitwise_and(permuted, _MAX_HASH).min(axis=1)
+        return signatures
+
+    def collapse(self, texts: Sequence[str]) -> List[CommentCluster]:
+        """Group texts into clusters, ordered by each cluster's first appearance."""
+        if not texts:
+            return []
+        signatures = self.signatures(texts)
+
+        parent = list(range(len(texts)))
+
+        def find(i: int) -> int:
+            while parent[i] != i:
+                parent[i] = parent[parent[i]]
+                i = parent[i]
+            return i
+
+        for band in range(self.bands):
+            rows = signatures[:, band * self.rows:(band + 1) * self.rows]
+            buckets: Dict[bytes, List[int]] = defaultdict(list)
+            for i, row in enumerate(rows):
+                buckets[row.tobytes()].append(i)
+            for members in buckets.values():
+                if len(members) < 2:
+                    continue
+                first = members[0]
+                # Estimated Jaccard of the bucket's first member against the rest, at once
+                similarity = (signatures[members[1:]] == signatures[first]).mean(axis=1)
+                for other, score in zip(members[1:], similarity):
+                    if score >= self.threshold:
+                        root_first, root_other = find(first), find(other)
+                        if root_first != root_other:
+                            parent[max(root_first, root_other)] = min(root_first, root_other)
+
+        clusters: Dict[int, CommentCluster] = {}
+        for i, text in enumerate(texts):
+            root = find(i)
+            if root not in clusters:
+                clusters[root] = CommentCluster(texts[root])
+            clusters[root].members.append(i)
+        return sorted(clusters.values(), key=lambda cluster: cluster.members[0])
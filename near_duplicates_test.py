@@ -0,0 +1,32 @@
+from near_duplicates import NearDuplicateCollapser
+
+LOG = ("Traceback (most recent call last): File \"app.py\", line 12, in <module> "
+       "ImportError: DLL load failed while importing _ssl: The specified module could not be found.")
+
+
+def test_near_duplicates_collapse_to_first_occurrence():
+    texts = [
+        "My game crashes every time I alt-tab out of fullscreen mode on Windows 11",
+        "Same here, happens to me too!",
+        LOG,
+        "The battery drains twice as fast since the last firmware update, really annoying",
+        "my game crashes every time I alt tab out of fullscreen mode on windows 11!!",
+        "Same here, happens to me too",
+        LOG.replace("line 12", "line 14"),
+    ]
+    clusters = NearDuplicateCollapser().collapse(texts)
+
+    assert [cluster.members for cluster in clusters] == [[0, 4], [1, 5], [2, 6], [3]]
+    assert clusters[0].representative == texts[0]
+    assert [cluster.count for cluster in clusters] == [2, 2, 2, 1]
+
+
+def test_distinct_comments_stay_separate():
+    texts = [
+        "The app logs me out every few minutes and I have to enter my password again",
+        "Customer support never answered my refund request after three weeks of waiting",
+        "Dark mode makes the text unreadable on the settings page",
+    ]
+    clusters = NearDuplicateCollapser().collapse(texts)
+    assert [cluster.count for cluster in clusters] == [1, 1, 1]
+    assert NearDuplicateCollapser().collapse([]) == []
@@ -0,0 +1,148 @@
+import asyncio
+import contextvars
+import inspect
+import time
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+from llms import run_async
+
+
+@dataclass
+class StepTiming:
+    """Wall-clock timing of one pipeline step, relative to the pipeline start."""
+    name: str
+    started: float
+    finished: float
+
+    @property
+    def duration(self) -> float:
+        return self.finished - self.started
+
+    def to_dict(self) -> Dict[str, float]:
+        return {"started": self.started, "finished": self.finished, "duration": self.duration}
+
+
+@dataclass
+class Step:
+    name: str
+    func: Callable[..., Any]
+    deps: List[str] = field(default_factory=list)
+    # Name of a dependency whose output is a sequence; func runs once per item
+    map_over: Optional[str] = None
+
+
+@dataclass
+class PipelineResult:
+    outputs: Dict[str, Any]
+    timings: Dict[str, StepTiming]
+
+    def timings_dict(self) -> Dict[str, Dict[str, float]]:
+        return {name: timing.to_dict() for name, timing in self.timings.items()}
+
+
+class Pipeline:
+    """
+    Small dependency-graph executor.
+
+    Every step starts as soon as the steps it depends on have finished. Step
+    functions receive their dependencies' outputs as keyword arguments named
+    after those steps. Coroutine functions run on the event loop; plain
+    functions (e.g. blocking Reddit scraping) run in the loop's executor, so
+    scraping and LLM work overlap whenever the graph allows it.
+    """
+
+    def __init__(self, name: str = "pipeline"):
+        self.name = name
+        self.steps: Dict[str, Step] = {}
+
+    def add_step(self,
+                 name: str,
+                 func: Callable[..., Any],
+                 deps: Sequence[str] = (),
+                 map_over: Optional[str] = None) -> "Pipeline":
+        """
+        Register a step. With map_over set, func is called concurrently for each
+        item of that dependency's output (as the first positional argument) and
+        the step's output is the list of results, in item order.
+        """
+        if name in self.steps:
+            raise ValueError(f"Duplicate pipeline step: {name}")
+        if map_over is not None and map_over not in deps:
+            raise ValueError(f"Step {name} maps over {map_over}, which is not a dependency")
+        self.steps[name] = Step(name, func, list(deps), map_over)
+        return self
+
+    def _ordered_steps(self) -> List[Step]:
+        ordered: List[Step] = []
+        state: Dict[str, int] = {}  # 1 = visiting, 2 = done
+
+        def visit(name: str) -> None:
+            if state.get(name) == 2:
+                return
+            if state.get(name) == 1:
+                raise ValueError(f"Pipeline {self.name} has a cycle through step {name}")
+            if name not in self.steps:
+                raise ValueError(f"Unknown pipeline step: {name}")
+            state[name] = 1
+            for dep in self.steps[name].deps:
+                visit(dep)
+            state[name] = 2
+            ordered.append(self.steps[name])
+
+        for name in self.steps:
+            visit(name)
+        return ordered
+
+    async def _invoke(self, func: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+        if inspect.iscoroutinefunction(func):
+            return await func(*args, **kwargs)
+        loop = asyncio.get_running_loop()
+        # Run in a copy of the caller's context so context variables carry over
+        context = contextvars.copy_context()
+        result = await loop.run_in_executor(None, lambda: context.run(func, *args, **kwargs))
+        if inspect.isawaitable(result):
+            result = await result
+        return result
+
+    async def _run_step(self,
+                        step: Step,
+                        tasks: Dict[str, "asyncio.Task[Any]"],
+                        timings: Dict[str, StepTiming],
+                        origin: float) -> Any:
+        inputs: Dict[str, Any] = {}
+        for dep in step.deps:
+            inputs[dep] = await tasks[dep]
+
+        started = time.perf_counter() - origin
+        if step.map_over is None:
+            output = await self._invoke(step.func, **inputs)
+        else:
+            items = inputs.pop(step.map_over)
+            output = list(await asyncio.gather(*[
+                self._invoke(step.func, item, **inputs) for item in items
+            ]))
+        timings[step.name] = StepTiming(step.name, started, time.perf_counter() - origin)
+        return output
+
+    async def arun(self) -> PipelineResult:
+        """Run the pipeline on the current event loop."""
+        timings: Dict[str, StepTiming] = {}
+        tasks: Dict[str, "asyncio.Task[Any]"] = {}
+        origin = time.perf_counter()
+
+        for step in self._ordered_steps():
+            tasks[step.name] = asyncio.ensure_future(
+                self._run_step(step, tasks, timings, origin))
+        try:
+            await asyncio.gather(*tasks.values())
+        finally:
+            for task in tasks.values():
+                task.cancel()
+
+        outputs = {name: task.result() for name, task in tasks.items()}
+        return PipelineResult(outputs, timings)
+
+    def run(self) -> PipelineResult:
+        """Run the pipeline to completion from synchronous code."""
+        return run_async(self.arun())
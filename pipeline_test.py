@@ -0,0 +1,49 @@
+import asyncio
+import time
+
+import pytest
+
+from pipeline import Pipeline
+
+
+def test_independent_steps_overlap():
+    def slow(value: int) -> int:
+        time.sleep(0.2)
+        return value
+
+    async def combine(left: int, right: int) -> int:
+        return left + right
+
+    pipeline = Pipeline("overlap")
+    pipeline.add_step("left", lambda: slow(1))
+    pipeline.add_step("right", lambda: slow(2))
+    pipeline.add_step("total", combine, deps=["left", "right"])
+
+    start = time.monotonic()
+    result = pipeline.run()
+
+    assert result.outputs["total"] == 3
+    assert time.monotonic() - start < 0.35
+    assert result.timings["total"].started >= result.timings["left"].finished
+    assert set(result.timings_dict()) == {"left", "right", "total"}
+
+
+def test_map_step_keeps_item_order():
+    async def square(item: int) -> int:
+        await asyncio.sleep(0.01 * (5 - item))
+        return item * item
+
+    pipeline = Pipeline("map")
+    pipeline.add_step("items", lambda: [1, 2, 3, 4])
+    pipeline.add_step("squares", square, deps=["items"], map_over="items")
+
+    assert pipeline.run().outputs["squares"] == [1, 4, 9, 16]
+
+
+def test_cycle_is_rejected():
+    pipeline = Pipeline("cycle")
+    pipeline.add_step("a", lambda b: b, deps=["b"])
+    pipeline.add_step("b", lambda a: a, deps=["a"])
+
+    with pytest.raises(ValueError):
+        pipeline.run()
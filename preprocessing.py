@@ -0,0 +1,236 @@
+import hashlib
+import multiprocessing
+import re
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field, replace
+from typing import Dict, FrozenSet, List, Optional, Sequence, Tuple
+
+from records import Comment
+
+try:
+    import langdetect
+except ImportError:  # langdetect is optional; fall back to a stopword heuristic
+    langdetect = None
+
+BOT_AUTHORS = frozenset({"AutoModerator", "RemindMeBot", "sneakpeekbot", "WikiSummarizerBot"})
+BOT_SIGNATURES = ("i am a bot", "i'm a bot", "this action was performed automatically")
+
+_MARKDOWN_LINK = re.compile(r"\[([^\]]*)\]\([^)]*\)")
+_URL = re.compile(r"(?:https?://|www\.)\S+")
+_QUOTE_LINE = re.compile(r"^\s*(?:>|&gt;).*$", re.MULTILINE)
+_MARKDOWN_MARKS = re.compile(r"(\*\*|__|~~|`{1,3}|^#{1,6}\s*|\^|^\s*[-*+]\s+)", re.MULTILINE)
+_WHITESPACE = re.compile(r"\s+")
+_WORD = re.compile(r"[^\W\d_]+(?:'[^\W\d_]+)?")
+
+ENGLISH_STOPWORDS = frozenset(
+    "the a an and or but is are was were be been to of in on for with it this that "
+    "i you he she we they my your not have has had do does did so if at as just can "
+    "what when me no all there from about would get".split()
+)
+# Other common Reddit languages written in Latin script; the heuristic only
+# labels a comment when one list clearly dominates
+STOPWORDS = {
+    "en": ENGLISH_STOPWORDS,
+    "es": frozenset("el la los las de que y en un una es por con para no se lo "
+                    "como pero mi su al del muy porque esta está tengo".split()),
+    "fr": frozenset("le la les de des du et est un une que qui pas pour dans je "
+                    "il elle ne ce sur avec mais mon très ça".split()),
+    "de": frozenset("der die das und ist nicht ich ein eine zu mit auf den dem "
+                    "es sie wir aber auch mein habe hat sich".split()),
+    "pt": frozenset("o a os as de que e em um uma é não para com do da por mas "
+                    "eu meu isso muito está tenho".split()),
+    "it": frozenset("il lo la gli le di che e è un una per non con del della ma "
+                    "io mio sono questo molto ho".split()),
+    "nl": frozenset("de het een en is van niet ik dat die op te met voor maar "
+                    "mijn heb zijn ook nog".split()),
+}
+# Scripts that settle the question on their own (first matching range wins)
+_SCRIPTS = (
+    ("ru", re.compile(r"[\u0400-\u04ff]")),
+    ("el", re.compile(r"[\u0370-\u03ff]")),
+    ("he", re.compile(r"[\u0590-\u05ff]")),
+    ("ar", re.compile(r"[\u0600-\u06ff]")),
+    ("hi", re.compile(r"[\u0900-\u097f]")),
+    ("ja", re.compile(r"[\u3040-\u30ff]")),
+    ("ko", re.compile(r"[\uac00-\ud7af]")),
+    ("zh", re.compile(r"[\u4e00-\u9fff]")),
+)
+
+
+def remove_quotes(text: str) -> str:
+    """Drop quoted lines ("> ...") from replies."""
+    return _QUOTE_LINE.sub("", text)
+
+
+def strip_markdown(text: str) -> str:
+    text = _MARKDOWN_LINK.sub(r"\1", text)
+    return _MARKDOWN_MARKS.sub("", text)
+
+
+def strip_urls(text: str) -> str:
+    return _URL.sub("", text)
+
+
+def normalize_whitespace(text: str) -> str:
+    return _WHITESPACE.sub(" ", text).strip()
+
+
+def is_bot(comment: Comment) -> bool:
+    # Known bot accounts and self-declared bots only: plenty of people are called Talbot
+    if comment.author in BOT_AUTHORS:
+        return True
+    body = comment.body.lower()
+    return any(signature in body for signature in BOT_SIGNATURES)
+
+
+def detect_language(text: str) -> str:
+    """Best-effort language code; "unknown" when it cannot tell."""
+    if langdetect is not None:
+        try:
+            return langdetect.detect(text)
+        except Exception:
+            return "unknown"
+    words = [word.lower() for word in _WORD.findall(text)]
+    if not words:
+        return "unknown"
+    # Mostly non-Latin letters: the script is enough, and no stopword list applies
+    latin = sum(ord(max(word)) < 0x250 for word in words)
+    if latin < len(words) / 2:
+        for code, script in _SCRIPTS:
+            if script.search(text):
+                return code
+        return "unknown"
+    shares = {code: sum(word in stopwords for word in words) / len(words)
+              for code, stopwords in STOPWORDS.items()}
+    best = max(shares, key=shares.__getitem__)
+    # Code, logs and terse posts match no list well enough to be labeled
+    return best if shares[best] >= 0.15 else "unknown"
+
+
+def dedup_key(text: str) -> str:
+    return hashlib.sha1(text.lower().encode("utf-8")).hexdigest()
+
+
+@dataclass
+class PreprocessConfig:
+    min_words: int = 5
+    # Comments confidently detected as another language are dropped, e.g.
+    # frozenset({"en"}); "unknown" (code, logs, terse posts) is always kept.
+    # None skips language detection
+    languages: Optional[FrozenSet[str]] = None
+
+
+@dataclass
+class PreprocessReport:
+    """Per-transform CPU seconds (summed over workers) and comments dropped."""
+    timings: Dict[str, float] = field(default_factory=dict)
+    dropped: Dict[str, int] = field(default_factory=dict)
+    input_count: int = 0
+    output_count: int = 0
+
+    def merge(self, timings: Dict[str, float], dropped: Dict[str, int]) -> None:
+        for name, seconds in timings.items():
+            self.timings[name] = self.timings.get(name, 0.0) + seconds
+        for name, count in dropped.items():
+            self.dropped[name] = self.dropped.get(name, 0) + count
+
+    def to_dict(self) -> Dict:
+        return {"timings": dict(self.timings), "dropped": dict(self.dropped),
+                "input_count": self.input_count, "output_count": self.output_count}
+
+
+def _process_batch(batch: List[Comment],
+                   config: PreprocessConfig) -> Tuple[List[Comment], Dict[str, float], Dict[str, int]]:
+    """Worker entry point: run every per-comment transform over one batch."""
+    timings: Dict[str, float] = {}
+    dropped: Dict[str, int] = {}
+
+    def timed(name: str, comments: List[Comment], keep) -> List[Comment]:
+        start = time.perf_counter()
+        kept = [c for c in comments if keep(c)]
+        timings[name] = time.perf_counter() - start
+        dropped[name] = len(comments) - len(kept)
+        return kept
+
+    def mapped(name: str, comments: List[Comment], transform) -> List[Comment]:
+        start = time.perf_counter()
+        result = [replace(c, body=transform(c.body)) for c in comments]
+        timings[name] = time.perf_counter() - start
+        return result
+
+    comments = timed("bot_filter", batch, lambda c: not is_bot(c))
+    comments = mapped("remove_quotes", comments, remove_quotes)
+    comments = mapped("strip_markdown", comments, strip_markdown)
+    comments = mapped("strip_urls", comments, strip_urls)
+    comments = mapped("normalize_whitespace", comments, normalize_whitespace)
+    comments = timed("min_words", comments, lambda c: len(c.body.split()) > config.min_words)
+    if config.languages is not None:
+        languages = config.languages | {"unknown"}
+        comments = timed("language", comments, lambda c: detect_language(c.body) in languages)
+    return comments, timings, dropped
+
+
+class CommentPreprocessor:
+    """
+    CPU stage that cleans comments before they reach the LLM: bot/AutoModerator
+    filtering, quote removal, markdown and URL stripping, length and (optional)
+    language filtering, then exact de-duplication of the cleaned text.
+
+    Batches are spread over a process pool (kept warm between calls); inputs
+    smaller than one batch are processed inline to skip the IPC round-trip.
+    """
+
+    def __init__(self,
+                 config: Optional[PreprocessConfig] = None,
+                 max_workers: Optional[int] = None,
+                 batch_size: int = 250):
+        self.config = config or PreprocessConfig()
+        self.max_workers = max_workers
+        self.batch_size = batch_size
+        self._executor: Optional[ProcessPoolExecutor] = None
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            # spawn: forking a process that already runs scraper/LLM threads is unsafe
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.max_workers,
+                mp_context=multiprocessing.get_context("spawn")
+            )
+        return self._executor
+
+    def process(self, comments: Sequence[Comment]) -> Tuple[List[Comment], PreprocessReport]:
+        """Return the cleaned comments, in input order, and a timing report."""
+        report = PreprocessReport(input_count=len(comments))
+        batches = [list(comments[i:i + self.batch_size])
+                   for i in range(0, len(comments), self.batch_size)]
+
+        if len(batches) <= 1:
+            results = [_process_batch(batch, self.config) for batch in batches]
+        else:
+            executor = self._get_executor()
+            results = list(executor.map(_process_batch, batches, [self.config] * len(batches)))
+
+        cleaned: List[Comment] = []
+        for kept, timings, dropped in results:
+            report.merge(timings, dropped)
+            cleaned.extend(kept)
+
+        # De-duplicate across batches, keeping the first occurrence
+        start = time.perf_counter()
+        seen = set()
+        unique = []
+        for comment in cleaned:
+            key = dedup_key(comment.body)
+            if key not in seen:
+                seen.add(key)
+                unique.append(comment)
+        report.merge({"dedup": time.perf_counter() - start}, {"dedup": len(cleaned) - len(unique)})
+
+        report.output_count = len(unique)
+        return unique, report
+
+    def close(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
@@ -0,0 +1,96 @@
+import preprocessing
+from preprocessing import (
+    CommentPreprocessor,
+    PreprocessConfig,
+    detect_language,
+    is_bot,
+    remove_quotes,
+    strip_markdown,
+    strip_urls,
+)
+from records import Comment
+
+
+def make_comment(comment_id: str, body: str, author: str = "someone") -> Comment:
+    return Comment(comment_id, "s1", "techsupport", body, author, 1, 0.0)
+
+
+def test_text_transforms():
+    assert remove_quotes("> you said this\nand I disagree") == "\nand I disagree"
+    assert strip_markdown("**Bold** and [a link](https://example.com)") == "Bold and a link"
+    assert strip_urls("see https://example.com/x?y=1 for details") == "see  for details"
+
+
+def test_detect_language_heuristic():
+    assert detect_language("I have been having issues with my drivers and it is not fixed") == "en"
+    assert detect_language("") == "unknown"
+    assert detect_language("Tengo el mismo problema con la actualización y no funciona") == "es"
+    assert detect_language("Ich habe das gleiche Problem und es ist nicht behoben") == "de"
+    assert detect_language("У меня та же проблема после обновления") == "ru"
+
+
+def test_preprocessor_filters_bots_short_and_duplicate_comments():
+    comments = [
+        make_comment("1", "My laptop keeps crashing when I open the browser, any ideas?"),
+        make_comment("2", "Your post was removed because it breaks rule 3 of the sub.", "AutoModerator"),
+        make_comment("3", "> quoted text\nsame"),
+        make_comment("4", "My laptop  keeps crashing when I open the **browser**, any ideas?"),
+        make_comment("5", "The update broke my wifi driver and now https://support.example.com is useless"),
+    ]
+    cleaned, report = CommentPreprocessor().process(comments)
+
+    assert [c.id for c in cleaned] == ["1", "5"]
+    assert "https" not in cleaned[1].body
+    assert report.dropped["bot_filter"] == 1
+    assert report.dropped["min_words"] == 1
+    assert report.dropped["dedup"] == 1
+    assert report.input_count == 5 and report.output_count == 2
+    assert set(report.timings) >= {"bot_filter", "strip_markdown", "strip_urls", "dedup"}
+    # Language detection is opt-in
+    assert "language" not in report.timings
+
+
+def test_bot_filter_spares_people_whose_names_end_in_bot():
+    assert is_bot(make_comment("1", "Your post was removed.", "AutoModerator"))
+    assert is_bot(make_comment("2", "I am a bot, and this action was performed automatically."))
+    assert not is_bot(make_comment("3", "Same crash here after the update.", "Talbot"))
+    assert not is_bot(make_comment("4", "Same crash here after the update.", "abbot"))
+
+
+def test_language_filter_keeps_comments_it_cannot_classify():
+    comments = [
+        make_comment("1", "I have the same problem and it is not fixed by the update"),
+        make_comment("2", "Traceback: KeyError raised in parse_config, config.yaml line 42 column 7 (strict mode)"),
+        make_comment("3", "segfault core dumped nvidia-smi 535.54 driver kernel 6.5 rtx4090"),
+    ]
+    cleaned, report = CommentPreprocessor(PreprocessConfig(languages=frozenset({"en"}))).process(comments)
+
+    assert [c.id for c in cleaned] == ["1", "2", "3"]
+    assert report.dropped["language"] == 0
+
+
+def test_language_filter_drops_other_languages_without_langdetect(monkeypatch):
+    monkeypatch.setattr(preprocessing, "langdetect", None)
+    comments = [
+        make_comment("1", "I have the same problem and it is not fixed by the update"),
+        make_comment("2", "J'ai le même problème avec la mise à jour et ça ne marche pas"),
+        make_comment("3", "Eu tenho o mesmo problema e não funciona depois da atualização"),
+        make_comment("4", "segfault core dumped nvidia-smi 535.54 driver kernel 6.5 rtx4090"),
+    ]
+    cleaned, report = CommentPreprocessor(PreprocessConfig(languages=frozenset({"en"}))).process(comments)
+
+    assert [c.id for c in cleaned] == ["1", "4"]
+    assert report.dropped["language"] == 2
+
+
+def test_process_pool_keeps_input_order():
+    comments = [make_comment(str(i), f"Comment number {i} says the app is not working for me")
+                for i in range(40)]
+    preprocessor = CommentPreprocessor(PreprocessConfig(languages=None), max_workers=2, batch_size=10)
+    try:
+        cleaned, report = preprocessor.process(comments)
+    finally:
+        preprocessor.close()
+
+    assert [c.id for c in cleaned] == [str(i) for i in range(40)]
+    assert report.output_count == 40
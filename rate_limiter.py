@@ -0,0 +1,156 @@
+import heapq
+import itertools
+import threading
+import time
+from enum import IntEnum
+from typing import Callable, Dict, List, Mapping, Optional, Tuple
+
+
+class Priority(IntEnum):
+    """Lower values are served first."""
+    INTERACTIVE = 0
+    BULK = 1
+
+
+class RequestScheduler:
+    """
+    Token-bucket scheduler shared by every RedditScraper in the process.
+
+    Tokens refill at a rate derived from Reddit's x-ratelimit-* response
+    headers (remaining requests spread evenly over the seconds left in the
+    window), so concurrent scrapers share one quota instead of each assuming
+    they own it. Waiting requests are served by priority, then arrival order.
+    """
+
+    def __init__(self,
+                 rate: float = 1.0,
+                 burst: int = 10,
+                 clock: Callable[[], float] = time.monotonic):
+        self.rate = rate  # tokens per second
+        self.burst = burst
+        self._clock = clock
+        self._tokens = float(burst)
+        self._updated = clock()
+        self._blocked_until = 0.0
+        self._remaining: Optional[float] = None
+        self._reset: Optional[float] = None
+
+        self._cond = threading.Condition()
+        self._waiters: List[Tuple[int, int]] = []
+        self._sequence = itertools.count()
+
+        self._granted: Dict[Priority, int] = {priority: 0 for priority in Priority}
+        self._total_wait: Dict[Priority, float] = {priority: 0.0 for priority in Priority}
+        self._max_wait: Dict[Priority, float] = {priority: 0.0 for priority in Priority}
+
+    def _refill(self, now: float) -> None:
+        elapsed = now - self._updated
+        if elapsed > 0:
+            self._tokens = min(float(self.burst), self._tokens + elapsed * self.rate)
+            self._updated = now
+
+    def _seconds_until_token(self, now: float) -> float:
+        if now < self._blocked_until:
+            return self._blocked_until - now
+        if self._tokens >= 1:
+            return 0.0
+        return (1 - self._tokens) / self.rate if self.rate > 0 else 1.0
+
+    def acquire(self, priority: Priority = Priority.INTERACTIVE, timeout: Optional[float] = None) -> float:
+        """
+        Block until the caller may send one request. Returns the seconds waited.
+        Raises TimeoutError if timeout elapses first.
+        """
+        with self._cond:
+            ticket = (int(priority), next(self._sequence))
+            heapq.heappush(self._waiters, ticket)
+            start = self._clock()
+            try:
+                while True:
+                    now = self._clock()
+                    self._refill(now)
+                    delay = self._seconds_until_token(now)
+                    if self._waiters[0] == ticket and delay <= 0:
+                        heapq.heappop(self._waiters)
+                        self._tokens -= 1
+                        break
+                    if timeout is not None and now - start >= timeout:
+                        raise TimeoutError("Timed out waiting for a Reddit request slot")
+                    wait = delay if self._waiters[0] == ticket else None
+                    if timeout is not None:
+                        remaining = timeout - (now - start)
+                        wait = remaining if wait is None else min(wait, remaining)
+                    self._cond.wait(wait)
+            except BaseException:
+                if ticket in self._waiters:
+                    self._waiters.remove(ticket)
+                    heapq.heapify(self._waiters)
+                raise
+            finally:
+                self._cond.notify_all()
+
+            waited = self._clock() - start
+            self._granted[priority] += 1
+            self._total_wait[priority] += waited
+            self._max_wait[priority] = max(self._max_wait[priority], waited)
+            return waited
+
+    def update_from_headers(self, headers: Mapping[str, str]) -> None:
+        """Re-derive the refill rate from Reddit's rate-limit response headers."""
+        if "x-ratelimit-remaining" not in headers or "x-ratelimit-reset" not in headers:
+            return
+        remaining = float(headers["x-ratelimit-remaining"])
+        reset = max(float(headers["x-ratelimit-reset"]), 1.0)
+        with self._cond:
+            now = self._clock()
+            self._refill(now)
+            self._remaining, self._reset = remaining, reset
+            if remaining < 1:
+                # Quota exhausted: nobody goes until the window resets
+                self._blocked_until = now + reset
+                self._tokens = 0.0
+            else:
+                self._blocked_until = 0.0
+                self.rate = remaining / reset
+                self._tokens = min(self._tokens, remaining)
+            self._cond.notify_all()
+
+    def queue_depth(self, priority: Optional[Priority] = None) -> int:
+        with self._cond:
+            if priority is None:
+                return len(self._waiters)
+            return sum(1 for waiter_priority, _ in self._waiters if waiter_priority == priority)
+
+    def metrics(self) -> Dict:
+        """Snapshot of queue depth, wait times and the current quota estimate."""
+        with self._cond:
+            per_priority = {}
+            for priority in Priority:
+                granted = self._granted[priority]
+                per_priority[priority.name.lower()] = {
+                    "queue_depth": sum(1 for p, _ in self._waiters if p == priority),
+                    "requests": granted,
+                    "mean_wait": self._total_wait[priority] / granted if granted else 0.0,
+                    "max_wait": self._max_wait[priority]
+                }
+            return {
+                "queue_depth": len(self._waiters),
+                "rate": self.rate,
+                "tokens": self._tokens,
+                "ratelimit_remaining": self._remaining,
+                "ratelimit_reset": self._reset,
+                "priorities": per_priority
+            }
+
+
+_default_scheduler: Optional[RequestScheduler] = None
+_default_scheduler_lock = threading.Lock()
+
+
+def get_default_scheduler() -> RequestScheduler:
+    """The process-wide scheduler used by scrapers that are not given one."""
+    global _default_scheduler
+    with _default_scheduler_lock:
+        if _default_scheduler is None:
+            _default_scheduler = RequestScheduler()
+        return _default_scheduler
@@ -0,0 +1,94 @@
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import List
+
+import pytest
+
+from rate_limiter import Priority, RequestScheduler
+from reddit_utils import ScheduledRequestor
+
+
+def test_interactive_requests_jump_the_bulk_queue():
+    scheduler = RequestScheduler(rate=20.0, burst=1)
+    scheduler.acquire()  # drain the bucket so the next callers queue up
+    order: List[str] = []
+
+    def worker(name: str, priority: Priority) -> None:
+        scheduler.acquire(priority)
+        order.append(name)
+
+    threads = [threading.Thread(target=worker, args=(f"bulk{i}", Priority.BULK)) for i in range(3)]
+    for thread in threads:
+        thread.start()
+    time.sleep(0.01)
+    assert scheduler.queue_depth(Priority.BULK) == 3
+
+    interactive = threading.Thread(target=worker, args=("interactive", Priority.INTERACTIVE))
+    interactive.start()
+    for thread in threads + [interactive]:
+        thread.join()
+
+    assert order.index("interactive") <= 1
+    metrics = scheduler.metrics()
+    assert metrics["queue_depth"] == 0
+    assert metrics["priorities"]["bulk"]["requests"] == 3
+    assert metrics["priorities"]["bulk"]["max_wait"] > 0
+
+
+def test_headers_spread_remaining_quota_over_the_window():
+    scheduler = RequestScheduler(rate=1.0, burst=1)
+    scheduler.update_from_headers({"x-ratelimit-remaining": "50", "x-ratelimit-used": "550",
+                                   "x-ratelimit-reset": "5"})
+    assert scheduler.rate == pytest.approx(10.0)
+
+    scheduler.acquire()
+    start = time.monotonic()
+    scheduler.acquire()
+    assert time.monotonic() - start == pytest.approx(0.1, abs=0.05)
+
+
+def test_exhausted_quota_blocks_until_reset():
+    scheduler = RequestScheduler(rate=100.0, burst=5)
+    scheduler.update_from_headers({"x-ratelimit-remaining": "0", "x-ratelimit-used": "600",
+                                   "x-ratelimit-reset": "1"})
+    with pytest.raises(TimeoutError):
+        scheduler.acquire(timeout=0.2)
+    assert scheduler.queue_depth() == 0
+
+
+class StubRedditHandler(BaseHTTPRequestHandler):
+    """Answers every request with Reddit-style rate-limit headers."""
+
+    def do_GET(self) -> None:
+        payload = b"{}"
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.send_header("x-ratelimit-remaining", "20")
+        self.send_header("x-ratelimit-used", "580")
+        self.send_header("x-ratelimit-reset", "2")
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, *args) -> None:
+        pass
+
+
+def test_scheduled_requestor_feeds_response_headers_back():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubRedditHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        scheduler = RequestScheduler(rate=1.0, burst=2)
+        requestor = ScheduledRequestor(user_agent="RedditAnalyzerBot/1.0 tests",
+                                       scheduler=scheduler, priority=Priority.BULK)
+        url = f"http://127.0.0.1:{server.server_address[1]}/r/python/top"
+        for _ in range(3):
+            assert requestor.request("GET", url).status_code == 200
+
+        metrics = scheduler.metrics()
+        assert metrics["ratelimit_remaining"] == 20
+        assert scheduler.rate == pytest.approx(10.0)
+        assert metrics["priorities"]["bulk"]["requests"] == 3
+    finally:
+        server.shutdown()
@@ -0,0 +1,182 @@
+from dataclasses import dataclass
+from typing import Any, Dict, Iterable, Iterator, List, Sequence, Tuple, Union, overload
+
+import numpy as np
+
+
+# Records declare __slots__ by hand (dataclass(slots=True) needs Python 3.10):
+# no per-instance __dict__, which matters with hundreds of thousands of them.
+
+@dataclass
+class Comment:
+    """A scraped Reddit comment with the metadata needed to store and re-query it."""
+    __slots__ = ("id", "submission_id", "subreddit", "body", "author", "score", "created_utc")
+    id: str
+    submission_id: str
+    subreddit: str
+    body: str
+    author: str
+    score: int
+    created_utc: float
+
+
+@dataclass
+class Post:
+    """
+    A scraped submission. Supports post['title'] and post.get('title') so
+    code written against the old per-post dicts keeps working.
+    """
+    __slots__ = ("id", "subreddit", "title", "author", "score", "num_comments",
+                 "url", "content", "created_utc")
+    id: str
+    subreddit: str
+    title: str
+    author: str
+    score: int
+    num_comments: int
+    url: str
+    content: str
+    created_utc: float
+
+    def __getitem__(self, key: str) -> Any:
+        if key not in self.__slots__:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def get(self, key: str, default: Any = None) -> Any:
+        return getattr(self, key) if key in self.__slots__ else default
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {name: getattr(self, name) for name in self.__slots__}
+
+
+class StringColumn:
+    """
+    Strings packed into one UTF-8 buffer, with offsets[i]:offsets[i + 1]
+    spanning string i. The buffer may be a memoryview, e.g. over a
+    memory-mapped Arrow column, in which case nothing is copied until read.
+    """
+
+    __slots__ = ("buffer", "offsets")
+
+    def __init__(self, buffer: Union[bytes, memoryview], offsets: np.ndarray) -> None:
+        self.buffer = buffer
+        self.offsets = offsets
+
+    def __getstate__(self) -> Tuple[bytes, np.ndarray]:
+        # Views cannot be pickled; ship just the referenced bytes
+        first, last = int(self.offsets[0]), int(self.offsets[-1])
+        return bytes(self.buffer[first:last]), self.offsets - first
+
+    def __setstate__(self, state: Tuple[bytes, np.ndarray]) -> None:
+        self.buffer, self.offsets = state
+
+    @classmethod
+    def from_strings(cls, strings: Sequence[str]) -> "StringColumn":
+        encoded = [s.encode("utf-8") for s in strings]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(b) for b in encoded], out=offsets[1:])
+        return cls(b"".join(encoded), offsets)
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def __getitem__(self, index: int) -> str:
+        return str(self.buffer[self.offsets[index]:self.offsets[index + 1]], "utf-8")
+
+    def take(self, start: int, stop: int) -> "StringColumn":
+        first, last = self.offsets[start], self.offsets[stop]
+        return StringColumn(self.buffer[first:last], self.offsets[start:stop + 1] - first)
+
+    def to_list(self) -> List[str]:
+        # One decode of the whole buffer would split on character, not byte, offsets
+        offsets = self.offsets.tolist()
+        buffer = self.buffer
+        if isinstance(buffer, bytes):
+            return [buffer[a:b].decode("utf-8") for a, b in zip(offsets, offsets[1:])]
+        return [str(buffer[a:b], "utf-8") for a, b in zip(offsets, offsets[1:])]
+
+    @property
+    def nbytes(self) -> int:
+        return int(self.offsets[-1] - self.offsets[0]) + self.offsets.nbytes
+
+
+class CommentBatch:
+    """
+    Columnar, read-only form of a list of Comments: numpy arrays for score and
+    created_utc and packed string columns for the rest, so a large comment set
+    costs a few bytes of overhead per comment instead of a Python object each.
+
+    Indexing gives a Comment, slicing gives a CommentBatch and iterating gives
+    Comments, so it can stand in for List[Comment]. Slices stay compact when
+    shipped to worker processes.
+    """
+
+    _STRINGS = ("id", "submission_id", "subreddit", "body", "author")
+
+    def __init__(self,
+                 columns: Dict[str, StringColumn],
+                 score: np.ndarray,
+                 created_utc: np.ndarray) -> None:
+        self.columns = columns
+        self.score = score
+        self.created_utc = created_utc
+
+    @classmethod
+    def from_comments(cls, comments: Iterable[Comment]) -> "CommentBatch":
+        comments = comments if isinstance(comments, list) else list(comments)
+        columns = {name: StringColumn.from_strings([getattr(c, name) for c in comments])
+                   for name in cls._STRINGS}
+        return cls(columns,
+                   np.fromiter((c.score for c in comments), dtype=np.int64, count=len(comments)),
+                   np.fromiter((c.created_utc for c in comments), dtype=np.float64,
+                               count=len(comments)))
+
+    @classmethod
+    def from_rows(cls, rows: Sequence[Sequence[Any]]) -> "CommentBatch":
+        """From (id, submission_id, subreddit, body, author, score, created_utc) tuples."""
+        rows = list(rows)
+        columns = {name: StringColumn.from_strings([row[i] for row in rows])
+                   for i, name in enumerate(cls._STRINGS)}
+        return cls(columns,
+                   np.array([row[5] for row in rows], dtype=np.int64),
+                   np.array([row[6] for row in rows], dtype=np.float64))
+
+    def __len__(self) -> int:
+        return len(self.score)
+
+    @overload
+    def __getitem__(self, index: int) -> Comment: ...
+
+    @overload
+    def __getitem__(self, index: slice) -> "CommentBatch": ...
+
+    def __getitem__(self, index: Union[int, slice]) -> Union[Comment, "CommentBatch"]:
+        if isinstance(index, slice):
+            start, stop, step = index.indices(len(self))
+            if step != 1:
+                raise ValueError("CommentBatch slices must be contiguous")
+            stop = max(start, stop)
+            return CommentBatch({name: column.take(start, stop) for name, column in self.columns.items()},
+                                self.score[start:stop], self.created_utc[start:stop])
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("CommentBatch index out of range")
+        return Comment(*(self.columns[name][index] for name in self._STRINGS),
+                       int(self.score[index]), float(self.created_utc[index]))
+
+    def __iter__(self) -> Iterator[Comment]:
+        strings = [self.columns[name].to_list() for name in self._STRINGS]
+        for *fields, score, created_utc in zip(*strings, self.score.tolist(),
+                                               self.created_utc.tolist()):
+            yield Comment(*fields, score, created_utc)
+
+    def column(self, name: str) -> List[str]:
+        """All values of one string field, e.g. batch.column('body')."""
+        return self.columns[name].to_list()
+
+    @property
+    def nbytes(self) -> int:
+        return (sum(column.nbytes for column in self.columns.values())
+                + self.score.nbytes + self.created_utc.nbytes)
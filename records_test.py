@@ -0,0 +1,67 @@
+import pickle
+import sys
+from dataclasses import replace
+
+import pytest
+
+from comment_store import CommentStore
+from records import Comment, CommentBatch, Post
+
+
+def make_comments(n: int) -> list:
+    return [Comment(f"c{i}", f"s{i // 10}", "test", f"comment {i} — naïve café", f"user{i % 7}",
+                    i - 5, 1_700_000_000.0 + i)
+            for i in range(n)]
+
+
+def test_records_have_no_instance_dict():
+    comment = make_comments(1)[0]
+    assert not hasattr(comment, "__dict__")
+    assert replace(comment, body="edited").body == "edited"
+    assert pickle.loads(pickle.dumps(comment)) == comment
+
+
+def test_post_supports_dict_style_access():
+    post = Post("p1", "python", "Title", "author", 10, 3, "https://example.com", "text", 0.0)
+    assert post["title"] == "Title"
+    assert post.get("num_comments") == 3
+    assert post.get("missing", "default") == "default"
+    with pytest.raises(KeyError):
+        post["missing"]
+    assert post.to_dict()["url"] == "https://example.com"
+
+
+def test_comment_batch_round_trips_and_slices():
+    comments = make_comments(25)
+    batch = CommentBatch.from_comments(comments)
+
+    assert len(batch) == 25
+    assert list(batch) == comments
+    assert batch[3] == comments[3]
+    assert batch[-1] == comments[-1]
+    assert list(batch[10:20]) == comments[10:20]
+    assert list(batch[20:40]) == comments[20:]
+    assert batch.column("body")[7] == comments[7].body
+    assert batch.score.tolist() == [c.score for c in comments]
+    assert list(pickle.loads(pickle.dumps(batch[5:8]))) == comments[5:8]
+    with pytest.raises(IndexError):
+        batch[25]
+
+
+def test_comment_batch_is_smaller_than_comment_objects():
+    comments = make_comments(2000)
+    batch = CommentBatch.from_comments(comments)
+    per_objects = sum(sys.getsizeof(c) + sum(sys.getsizeof(getattr(c, f)) for f in c.__slots__)
+                      for c in comments)
+    assert batch.nbytes * 3 < per_objects
+
+
+def test_store_returns_comment_batches(tmp_path):
+    store = CommentStore(str(tmp_path / "comments.db"))
+    comments = make_comments(12)
+    store.add_comments(comments)
+
+    batch = store.get_comment_batch("test", since=comments[3].created_utc, limit=5)
+
+    assert list(batch) == comments[4:9]
+    store.close()
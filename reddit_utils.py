@@ -1,16 +1,203 @@
 import praw
-from typing import List, Dict
+import prawcore
+import queue
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Any, Deque, Iterable, Iterator, List, Dict, Optional
 from datetime import datetime, timedelta
 import re
 
+from comment_store import CommentStore
+from rate_limiter import Priority, RequestScheduler, get_default_scheduler
+from records import Comment, CommentBatch, Post
+
+
+class ScheduledRequestor(prawcore.Requestor):
+    """prawcore requestor that takes a slot from a RequestScheduler before each request."""
+
+    def __init__(self,
+                 *args,
+                 scheduler: Optional[RequestScheduler] = None,
+                 priority: Priority = Priority.INTERACTIVE,
+                 **kwargs):
+        super().__init__(*args, **kwargs)
+        self.scheduler = scheduler or get_default_scheduler()
+        self.priority = priority
+
+    def request(self, *args, **kwargs):
+        self.scheduler.acquire(self.priority)
+        response = super().request(*args, **kwargs)
+        self.scheduler.update_from_headers(response.headers)
+        return response
+
+
+@dataclass
+class NewComments:
+    """
+    Comments found by RedditScraper.fetch_new_comments, oldest first, and the
+    comment count of each submission scraped for them.
+    """
+    subreddit: str
+    search_query: Optional[str]
+    comments: List[Comment]
+    submission_counts: Dict[str, int]
+
+    def mark_seen(self, store: CommentStore, count: Optional[int] = None) -> None:
+        """
+        Record the oldest count comments (default: all) as analyzed, once their
+        analysis succeeded. The rest are still new on the next fetch: their
+        submissions stay due for a re-scrape and they are not older than the watermark.
+        """
+        count = len(self.comments) if count is None else count
+        pending = {comment.submission_id for comment in self.comments[count:]}
+        store.mark_seen(self.subreddit, self.search_query, self.comments[:count],
+                        {submission_id: num_comments
+                         for submission_id, num_comments in self.submission_counts.items()
+                         if submission_id not in pending})
+
+
 class RedditScraper:
-    def __init__(self, client_id: str, client_secret: str, user_agent: str):
-        self.reddit = praw.Reddit(
+    def __init__(self,
+                 client_id: str,
+                 client_secret: str,
+                 user_agent: str,
+                 max_workers: int = 1,
+                 scheduler: Optional[RequestScheduler] = None,
+                 priority: Priority = Priority.INTERACTIVE,
+                 requestor_class: type = ScheduledRequestor,
+                 requestor_kwargs: Optional[Dict[str, Any]] = None):
+        # Requests go through a scheduler shared process-wide by default, so
+        # several scrapers (and coordinators) split one Reddit quota.
+        # requestor_class must accept the scheduler and priority keywords,
+        # e.g. a ScheduledRequestor subclass such as cassette.CassetteRequestor
+        self.scheduler = scheduler or get_default_scheduler()
+        self._reddit_options = dict(
             client_id=client_id,
             client_secret=client_secret,
-            user_agent=user_agent
+            user_agent=user_agent,
+            requestor_class=requestor_class,
+            requestor_kwargs={'scheduler': self.scheduler, 'priority': priority,
+                              **(requestor_kwargs or {})}
+        )
+        # PRAW instances are not thread-safe, so each concurrent caller checks
+        # one out of this pool; self.reddit is only safe from a single thread
+        self._idle: "queue.Queue[praw.Reddit]" = queue.Queue()
+        self.reddit = self._make_reddit()
+        self._idle.put(self.reddit)
+        # Number of submission comment trees fetched concurrently (1 = serial)
+        self.max_workers = max_workers
+
+    def _make_reddit(self) -> praw.Reddit:
+        return praw.Reddit(**self._reddit_options)
+
+    @contextmanager
+    def _checkout(self) -> Iterator[praw.Reddit]:
+        """
+        A Reddit instance for the caller's exclusive use, created if none is idle.
+        All of them share the scheduler, and so one rate limit.
+        """
+        try:
+            reddit = self._idle.get_nowait()
+        except queue.Empty:
+            reddit = self._make_reddit()
+        try:
+            yield reddit
+        finally:
+            self._idle.put(reddit)
+
+    def _load_comment_tree(self, submission) -> List:
+        submission.comments.replace_more(limit=0)
+        return submission.comments.list()
+
+    def _fetch_comment_tree(self, submission_id: str) -> List:
+        # Listings hand out unfetched submissions, so rebinding one to this
+        # worker's own instance costs no extra request
+        with self._checkout() as reddit:
+            return self._load_comment_tree(reddit.submission(id=submission_id))
+
+    def _iter_comment_trees(self, submissions: Iterable) -> Iterator[List]:
+        """
+        Yield the flattened comment list of each submission, in submission order.
+
+        With max_workers > 1 up to max_workers trees are fetched ahead of the
+        consumer, each worker on its own Reddit instance; trees that are no
+        longer needed are cancelled on early exit.
+        """
+        if self.max_workers <= 1:
+            for submission in submissions:
+                yield self._load_comment_tree(submission)
+            return
+
+        pending: Deque[Future] = deque()
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            try:
+                for submission in submissions:
+                    pending.append(executor.submit(self._fetch_comment_tree, submission.id))
+                    if len(pending) >= self.max_workers:
+                        yield pending.popleft().result()
+                while pending:
+                    yield pending.popleft().result()
+            finally:
+                for future in pending:
+                    future.cancel()
+
+    def _is_substantive(self, comment) -> bool:
+        return bool(comment.body) and len(comment.body.split()) > 5  # Filter out very short comments
+
+    def _to_record(self, comment, subreddit_name: str) -> Comment:
+        return Comment(
+            id=comment.id,
+            submission_id=comment.link_id.split('_', 1)[-1],
+            subreddit=subreddit_name,
+            body=comment.body,
+            author=comment.author.name if comment.author else '[deleted]',
+            score=comment.score,
+            created_utc=comment.created_utc
         )
 
+    def _iter_comments(self,
+                       submissions: Iterable,
+                       subreddit_name: str,
+                       limit: int) -> Iterator[Comment]:
+        count = 0
+        if limit <= 0:
+            return
+        for tree in self._iter_comment_trees(submissions):
+            for comment in tree[:limit]:
+                if self._is_substantive(comment):
+                    yield self._to_record(comment, subreddit_name)
+                    count += 1
+                    if count >= limit:
+                        return
+
+    def iter_subreddit_comments(self,
+                                subreddit_name: str,
+                                time_filter: str = 'week',
+                                limit: int = 100) -> Iterator[Comment]:
+        """
+        Stream comments from a subreddit's top submissions as they are fetched.
+
+        Comment trees are only fetched ahead of the consumer by max_workers
+        submissions, so a slow consumer holds back scraping and memory stays flat.
+        """
+        with self._checkout() as reddit:
+            submissions = reddit.subreddit(subreddit_name).top(time_filter=time_filter, limit=25)
+            yield from self._iter_comments(submissions, subreddit_name, limit)
+
+    def iter_search_subreddit_comments(self,
+                                       subreddit_name: str,
+                                       search_query: str,
+                                       limit: int = 100) -> Iterator[Comment]:
+        """
+        Stream comments from submissions matching a search, as they are fetched
+        """
+        with self._checkout() as reddit:
+            submissions = reddit.subreddit(subreddit_name).search(
+                search_query, time_filter='month', limit=25)
+            yield from self._iter_comments(submissions, subreddit_name, limit)
+
     def get_subreddit_comments(self, 
                              subreddit_name: str, 
                              time_filter: str = 'week',
@@ -18,20 +205,8 @@ class RedditScraper:
         """
         Fetch comments from a subreddit
         """
-        subreddit = self.reddit.subreddit(subreddit_name)
-        comments = []
-        
-        for submission in subreddit.top(time_filter=time_filter, limit=25):
-            submission.comments.replace_more(limit=0)
-            for comment in submission.comments.list()[:limit]:
-                if comment.body and len(comment.body.split()) > 5:  # Filter out very short comments
-                    comments.append(comment.body)
-                if len(comments) >= limit:
-                    break
-            if len(comments) >= limit:
-                break
-                
-        return comments
+        return [comment.body for comment in
+                self.iter_subreddit_comments(subreddit_name, time_filter, limit)]
 
     def search_subreddit_comments(self, 
                                 subreddit_name: str, 
@@ -40,84 +215,171 @@ class RedditScraper:
         """
         Search for specific topics in subreddit comments
         """
-        subreddit = self.reddit.subreddit(subreddit_name)
-        comments = []
-        
-        for submission in subreddit.search(search_query, time_filter='month', limit=25):
-            submission.comments.replace_more(limit=0)
-            for comment in submission.comments.list()[:limit]:
-                if comment.body and len(comment.body.split()) > 5:
-                    comments.append(comment.body)
-                if len(comments) >= limit:
-                    break
-            if len(comments) >= limit:
-                break
-                
-        return comments 
+        return [comment.body for comment in
+                self.iter_search_subreddit_comments(subreddit_name, search_query, limit)]
     
+    def fetch_new_comments(self,
+                           store: CommentStore,
+                           subreddit_name: str,
+                           search_query: Optional[str] = None,
+                           time_filter: str = 'week') -> "NewComments":
+        """
+        Incrementally scrape a subreddit (or a search within it): the comments
+        not yet in store, oldest first.
+
+        Submissions whose comment count is unchanged since they were last marked
+        seen are skipped, and in previously seen submissions only comments from
+        the subreddit/query watermark on are considered. Nothing is written to
+        store until the result's mark_seen, so a failed analysis loses nothing.
+        """
+        with self._checkout() as reddit:
+            subreddit = reddit.subreddit(subreddit_name)
+            if search_query:
+                submissions = subreddit.search(search_query, time_filter='month', limit=25)
+            else:
+                submissions = subreddit.top(time_filter=time_filter, limit=25)
+
+            watermark = store.get_watermark(subreddit_name, search_query)
+            changed = []
+            for submission in submissions:
+                seen_count = store.get_submission_comment_count(submission.id, search_query)
+                if seen_count != submission.num_comments:
+                    # Submissions seen before only contribute comments from the watermark on
+                    changed.append((submission, watermark if seen_count is not None else float('-inf')))
+
+            candidates = []
+            trees = self._iter_comment_trees(submission for submission, _ in changed)
+            for (submission, since), tree in zip(changed, trees):
+                for comment in tree:
+                    if comment.created_utc >= since and self._is_substantive(comment):
+                        candidates.append(self._to_record(comment, subreddit_name))
+
+        # The watermark bound is inclusive, so ties with it are settled by id
+        known = store.known_ids(c.id for c in candidates)
+        new_comments = sorted((c for c in candidates if c.id not in known),
+                              key=lambda c: c.created_utc)
+        return NewComments(subreddit_name, search_query, new_comments,
+                           {submission.id: submission.num_comments for submission, _ in changed})
+
+    def _to_post(self, submission, subreddit_name: str) -> Post:
+        return Post(
+            id=submission.id,
+            subreddit=subreddit_name,
+            title=submission.title,
+            author=submission.author.name if submission.author else '[deleted]',
+            score=submission.score,
+            num_comments=submission.num_comments,
+            url=submission.url,
+            content=submission.selftext[:200] + '...' if len(submission.selftext) > 200 else submission.selftext,
+            created_utc=submission.created_utc
+        )
+
+    def iter_subreddit_posts(self,
+                             subreddit_name: str,
+                             time_filter: str = 'week',
+                             limit: int = 100) -> Iterator[Post]:
+        """
+        Stream posts from a subreddit as the listing is paged in, at most its
+        top 25 like the comment scrapers
+        """
+        with self._checkout() as reddit:
+            for submission in reddit.subreddit(subreddit_name).top(time_filter=time_filter,
+                                                                   limit=min(limit, 25)):
+                yield self._to_post(submission, subreddit_name)
+
     def get_subreddit_posts(self, 
                            subreddit_name: str, 
                            time_filter: str = 'week', 
-                           limit: int = 100) -> List[Dict]:
+                           limit: int = 100) -> List[Post]:
         """
         Fetch posts from a subreddit
         """
-        subreddit = self.reddit.subreddit(subreddit_name)
-        posts = []
-        
-        for submission in subreddit.top(time_filter=time_filter, limit=25):
-            posts.append({
-                'title': submission.title,
-                'author': submission.author.name,
-                'score': submission.score,
-                'num_comments': submission.num_comments,
-                'url': submission.url,
-                'content': submission.selftext[:200] + '...' if len(submission.selftext) > 200 else submission.selftext
-            })
-            if len(posts) >= limit:
-                break
-                
-        return posts
+        return list(self.iter_subreddit_posts(subreddit_name, time_filter, limit))
+
+    def get_posts(self, subreddit_name: str, submission_ids: Iterable[str]) -> List[Post]:
+        """
+        Posts of the given submissions, e.g. those scraped comments came from,
+        fetched a hundred per request. Submissions Reddit no longer returns are left out.
+        """
+        fullnames = [f"t3_{submission_id}" for submission_id in dict.fromkeys(submission_ids)]
+        if not fullnames:
+            return []
+        with self._checkout() as reddit:
+            return [self._to_post(submission, subreddit_name)
+                    for submission in reddit.info(fullnames=fullnames)]
+
+    def get_comment_batch(self,
+                          subreddit_name: str,
+                          search_query: Optional[str] = None,
+                          time_filter: str = 'week',
+                          limit: int = 100) -> CommentBatch:
+        """
+        Scrape comments straight into columnar form, for large comment sets
+        """
+        if search_query:
+            comments = self.iter_search_subreddit_comments(subreddit_name, search_query, limit)
+        else:
+            comments = self.iter_subreddit_comments(subreddit_name, time_filter, limit)
+        return CommentBatch.from_comments(comments)
+
+    def _subreddit_record(self, subreddit) -> Dict:
+        return {
+            'name': subreddit.display_name,
+            'title': subreddit.title,
+            'description': subreddit.public_description,
+            'subscribers': subreddit.subscribers,
+            'created_utc': subreddit.created_utc,
+            'over18': subreddit.over18,
+            'url': f"https://reddit.com{subreddit.url}"
+        }
 
     def search_subreddits(self, query: str, limit: int = 25) -> List[Dict]:
         """
         Search for subreddits matching the query
         """
-        subreddits = []
-        for subreddit in self.reddit.subreddits.search(query, limit=limit):
-            subreddits.append({
-                'name': subreddit.display_name,
-                'title': subreddit.title,
-                'description': subreddit.public_description,
-                'subscribers': subreddit.subscribers,
-                'created_utc': subreddit.created_utc,
-                'over18': subreddit.over18,
-                'url': f"https://reddit.com{subreddit.url}"
-            })
-        return subreddits
+        with self._checkout() as reddit:
+            return [self._subreddit_record(subreddit)
+                    for subreddit in reddit.subreddits.search(query, limit=limit)]
+
+    def _related_from(self, subreddit) -> List[str]:
+        related = []
+
+        # Check sidebar
+        if hasattr(subreddit, 'description'):
+            sidebar = subreddit.description or ''
+            # Find subreddit mentions in sidebar (r/subreddit format)
+            related.extend(re.findall(r'/r/([a-zA-Z0-9_]+)', sidebar))
+
+        # Check wiki pages if available
+        try:
+            wiki = subreddit.wiki['related']
+            related.extend(re.findall(r'/r/([a-zA-Z0-9_]+)', wiki.content_md))
+        except:
+            pass
+
+        return list(dict.fromkeys(related))  # Remove duplicates, keep sidebar order
 
     def get_related_subreddits(self, subreddit_name: str) -> List[str]:
         """
         Get related subreddits from sidebar and wiki
         """
         try:
-            subreddit = self.reddit.subreddit(subreddit_name)
-            # Get sidebar text
-            related = []
-            
-            # Check sidebar
-            if hasattr(subreddit, 'description'):
-                sidebar = subreddit.description
-                # Find subreddit mentions in sidebar (r/subreddit format)
-                related.extend(re.findall(r'/r/([a-zA-Z0-9_]+)', sidebar))
-                
-            # Check wiki pages if available
-            try:
-                wiki = subreddit.wiki['related']
-                related.extend(re.findall(r'/r/([a-zA-Z0-9_]+)', wiki.content_md))
-            except:
-                pass
-                
-            return list(set(related))  # Remove duplicates
+            with self._checkout() as reddit:
+                return self._related_from(reddit.subreddit(subreddit_name))
         except:
-            return []
\ No newline at end of file
+            return []
+
+    def get_subreddit_info(self, subreddit_name: str) -> Optional[Dict]:
+        """
+        Subreddit metadata (as in search_subreddits) plus its 'related' subreddits,
+        from one fetch of the subreddit. None if it is banned, private or missing.
+        """
+        with self._checkout() as reddit:
+            try:
+                subreddit = reddit.subreddit(subreddit_name)
+                record = self._subreddit_record(subreddit)
+            except Exception as e:
+                print(f"Could not load r/{subreddit_name}: {e}")
+                return None
+            record['related'] = self._related_from(subreddit)
+            return record
@@ -1,7 +1,12 @@
 from reddit_utils import RedditScraper
 import os
+import threading
+import time
 from dotenv import load_dotenv
-from typing import List
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from comment_store import CommentStore
+from rate_limiter import RequestScheduler
 
 def print_separator():
     print("\n" + "="*50 + "\n")
@@ -122,4 +127,294 @@ def main():
         print(f"Fatal error during testing: {str(e)}")
 
 if __name__ == "__main__":
-    main() 
\ No newline at end of file
+    main() 
+
+
+# Offline fakes standing in for PRAW: a "site" of submissions shared by every
+# Reddit instance the scraper creates, recording what was fetched and by whom
+
+class FakeComment:
+    def __init__(self, comment_id: str, submission_id: str, created_utc: float) -> None:
+        self.id = comment_id
+        self.link_id = f"t3_{submission_id}"
+        self.body = f"comment {comment_id} has more than five words in it"
+        self.author = None
+        self.score = 1
+        self.created_utc = created_utc
+
+
+class FakeForest:
+    def __init__(self, comments: List[FakeComment]) -> None:
+        self._comments = comments
+
+    def replace_more(self, limit: int = 0) -> None:
+        pass
+
+    def list(self) -> List[FakeComment]:
+        return list(self._comments)
+
+
+class FakeSite:
+    def __init__(self, trees: Dict[str, List[float]], fetch_delay: float = 0.0,
+                 page_size: int = 100, delays: Optional[Dict[str, float]] = None) -> None:
+        # submission id -> created_utc of each of its comments, in listing order
+        self.trees = trees
+        self.fetch_delay = fetch_delay
+        self.delays = delays or {}
+        self.page_size = page_size
+        self.fetched: List[str] = []
+        self.info_requests: List[List[str]] = []
+        self.pages = 0
+        self.overlaps = 0
+        self._busy: set = set()
+        self._lock = threading.Lock()
+
+    def listing(self, limit: Optional[int]) -> Iterator["FakeSubmission"]:
+        ids = list(self.trees)[:limit]
+        for i, submission_id in enumerate(ids):
+            if i % self.page_size == 0:
+                self.pages += 1
+            yield FakeSubmission(self, submission_id)
+
+    def fetch(self, owner: object, submission_id: str) -> List[FakeComment]:
+        with self._lock:
+            # PRAW instances must not be used from two threads at once
+            self.overlaps += owner in self._busy
+            self._busy.add(owner)
+        time.sleep(self.delays.get(submission_id, self.fetch_delay))
+        with self._lock:
+            self._busy.discard(owner)
+            self.fetched.append(submission_id)
+        return [FakeComment(f"{submission_id}-{i}", submission_id, created)
+                for i, created in enumerate(self.trees[submission_id])]
+
+
+class FakeSubmission:
+    def __init__(self, site: FakeSite, submission_id: str, owner: object = None) -> None:
+        self._site = site
+        self._owner = owner if owner is not None else site
+        self.id = submission_id
+        self.title = f"Submission {submission_id}"
+        self.author = None
+        self.score = 1
+        self.num_comments = len(site.trees[submission_id])
+        self.url = f"https://reddit.com/{submission_id}"
+        self.selftext = ""
+        self.created_utc = 0.0
+        self._forest: Optional[FakeForest] = None
+
+    @property
+    def comments(self) -> FakeForest:
+        # Fetched on first access, like PRAW's lazy submissions
+        if self._forest is None:
+            self._forest = FakeForest(self._site.fetch(self._owner, self.id))
+        return self._forest
+
+
+class FakeSubreddit:
+    def __init__(self, site: FakeSite) -> None:
+        self._site = site
+
+    def top(self, time_filter: str = "week", limit: Optional[int] = None) -> Iterator[FakeSubmission]:
+        return self._site.listing(limit)
+
+    def search(self, query: str, time_filter: str = "month",
+               limit: Optional[int] = None) -> Iterator[FakeSubmission]:
+        return self._site.listing(limit)
+
+
+class FakeReddit:
+    def __init__(self, site: FakeSite) -> None:
+        self._site = site
+
+    def subreddit(self, name: str) -> FakeSubreddit:
+        return FakeSubreddit(self._site)
+
+    def submission(self, id: str) -> FakeSubmission:
+        return FakeSubmission(self._site, id, owner=self)
+
+    def info(self, fullnames: List[str]) -> Iterator[FakeSubmission]:
+        self._site.info_requests.append(list(fullnames))
+        for fullname in fullnames:
+            submission_id = fullname.split("_", 1)[1]
+            if submission_id in self._site.trees:
+                yield FakeSubmission(self._site, submission_id, owner=self)
+
+
+class OfflineScraper(RedditScraper):
+    def __init__(self, site: FakeSite, max_workers: int = 1) -> None:
+        self.site = site
+        self.instances = 0
+        super().__init__("id", "secret", "test", max_workers=max_workers,
+                         scheduler=RequestScheduler())
+
+    def _make_reddit(self) -> FakeReddit:
+        self.instances += 1
+        return FakeReddit(self.site)
+
+
+def make_site(submissions: int, comments: int = 3, **kwargs) -> FakeSite:
+    return FakeSite({f"s{i}": [float(i * 10 + j) for j in range(comments)]
+                     for i in range(submissions)}, **kwargs)
+
+
+def test_get_posts_looks_up_each_submission_once():
+    site = make_site(3)
+    posts = OfflineScraper(site).get_posts("python", ["s1", "s0", "s1", "gone"])
+
+    assert [(post.id, post.subreddit, post.num_comments) for post in posts] == [
+        ("s1", "python", 3), ("s0", "python", 3)]
+    assert site.info_requests == [["t3_s1", "t3_s0", "t3_gone"]]
+    assert OfflineScraper(site).get_posts("python", []) == []
+
+
+def test_concurrent_trees_keep_submission_order_on_separate_instances():
+    # Later submissions finish first, yet comments arrive in submission order
+    site = make_site(12, delays={f"s{i}": 0.002 * (12 - i) for i in range(12)})
+    scraper = OfflineScraper(site, max_workers=4)
+    comments = list(scraper.iter_subreddit_comments("python", limit=1000))
+
+    assert [c.submission_id for c in comments] == [f"s{i}" for i in range(12) for _ in range(3)]
+    assert site.overlaps == 0
+    # The caller's instance plus at most one per worker
+    assert 1 < scraper.instances <= 5
+
+
+def test_limit_caps_comments_and_stops_fetching_trees():
+    site = make_site(25, fetch_delay=0.005)
+    scraper = OfflineScraper(site, max_workers=2)
+
+    comments = list(scraper.iter_subreddit_comments("python", limit=4))
+
+    assert [c.id for c in comments] == ["s0-0", "s0-1", "s0-2", "s1-0"]
+    # Only the trees the consumer reached plus the workers' lookahead
+    assert len(site.fetched) <= 2 + 2
+
+
+def test_early_exit_cancels_trees_not_yet_started():
+    site = make_site(25, fetch_delay=0.02)
+    scraper = OfflineScraper(site, max_workers=3)
+
+    stream = scraper.iter_search_subreddit_comments("python", "bug", limit=1000)
+    first = next(stream)
+    stream.close()
+
+    assert first.id == "s0-0"
+    assert len(site.fetched) <= 1 + 3
+    assert site.overlaps == 0
+
+
+def test_serial_scraping_reuses_one_instance():
+    site = make_site(5)
+    scraper = OfflineScraper(site, max_workers=1)
+
+    assert len(scraper.get_subreddit_comments("python", limit=100)) == 15
+    assert len(scraper.get_subreddit_comments("python", limit=100)) == 15
+    assert scraper.instances == 1
+
+
+def test_fetch_new_comments_records_nothing_until_marked_seen(tmp_path):
+    # s1's comments are older than s0's, and come back oldest first
+    site = FakeSite({"s0": [30.0, 40.0], "s1": [10.0, 20.0]})
+    scraper = OfflineScraper(site)
+    store = CommentStore(str(tmp_path / "comments.db"))
+
+    new = scraper.fetch_new_comments(store, "python")
+    assert [c.id for c in new.comments] == ["s1-0", "s1-1", "s0-0", "s0-1"]
+    assert new.submission_counts == {"s0": 2, "s1": 2}
+    assert store.get_comments("python") == []
+
+    # An analysis that failed never marked them seen, so they are all still new
+    assert [c.id for c in scraper.fetch_new_comments(store, "python").comments] == \
+        ["s1-0", "s1-1", "s0-0", "s0-1"]
+    store.close()
+
+
+def test_fetch_new_comments_skips_unchanged_and_respects_the_watermark(tmp_path):
+    site = FakeSite({"s0": [10.0, 20.0], "s1": [15.0]})
+    scraper = OfflineScraper(site)
+    store = CommentStore(str(tmp_path / "comments.db"))
+    scraper.fetch_new_comments(store, "python").mark_seen(store)
+    assert store.get_watermark("python") == 20.0
+
+    # Unchanged comment counts: no comment tree is fetched at all
+    site.fetched.clear()
+    assert scraper.fetch_new_comments(store, "python").comments == []
+    assert site.fetched == []
+
+    # A reply in s0 and a first-seen submission whose comments predate the watermark
+    site.trees["s0"].append(25.0)
+    site.trees["s2"] = [5.0]
+    new = scraper.fetch_new_comments(store, "python")
+    assert sorted(site.fetched) == ["s0", "s2"]
+    assert [c.id for c in new.comments] == ["s2-0", "s0-2"]
+    store.close()
+
+
+def test_comments_past_the_analyzed_prefix_stay_new(tmp_path):
+    site = FakeSite({"s0": [10.0, 30.0, 30.0], "s1": [20.0]})
+    scraper = OfflineScraper(site)
+    store = CommentStore(str(tmp_path / "comments.db"))
+
+    new = scraper.fetch_new_comments(store, "python")
+    assert [c.id for c in new.comments] == ["s0-0", "s1-0", "s0-1", "s0-2"]
+    # Only the three oldest were analyzed; the last ties with the newest of them
+    new.mark_seen(store, 3)
+    assert store.get_submission_comment_count("s1") == 1
+    assert store.get_submission_comment_count("s0") is None
+
+    assert [c.id for c in scraper.fetch_new_comments(store, "python").comments] == ["s0-2"]
+    store.close()
+
+
+def test_streams_are_lazy_until_consumed():
+    site = make_site(50, page_size=10)
+    scraper = OfflineScraper(site)
+
+    stream = scraper.iter_subreddit_comments("python", limit=1000)
+    posts = scraper.iter_subreddit_posts("python", limit=50)
+    assert (site.pages, site.fetched) == (0, [])
+
+    next(stream)
+    assert (site.pages, site.fetched) == (1, ["s0"])
+    stream.close()
+    posts.close()
+    assert (site.pages, site.fetched) == (1, ["s0"])
+
+
+def test_comment_stream_stops_pulling_pages_once_limit_is_reached():
+    site = make_site(50, page_size=2)
+    scraper = OfflineScraper(site)
+
+    comments = list(scraper.iter_subreddit_comments("python", limit=4))
+
+    assert len(comments) == 4
+    assert site.fetched == ["s0", "s1"]
+    assert site.pages == 1
+
+
+def test_post_stream_pages_in_only_what_the_consumer_takes():
+    site = make_site(50, page_size=10)
+    scraper = OfflineScraper(site)
+
+    taken = []
+    for post in scraper.iter_subreddit_posts("python", limit=50):
+        taken.append(post.id)
+        if len(taken) == 12:
+            break
+    assert taken == [f"s{i}" for i in range(12)]
+    assert site.pages == 2
+
+    site.pages = 0
+    posts = scraper.get_subreddit_posts("python", limit=25)
+    assert len(posts) == 25 and posts[0]["title"] == "Submission s0"
+    assert site.pages == 3
+
+
+def test_post_listing_is_capped_at_the_top_25():
+    site = make_site(150, page_size=25)
+    scraper = OfflineScraper(site)
+
+    assert len(scraper.get_subreddit_posts("python", limit=100)) == 25
+    assert site.pages == 1
+    assert len(scraper.get_subreddit_posts("python", limit=5)) == 5
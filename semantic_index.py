@@ -0,0 +1,311 @@
+import os
+import re
+import threading
+import zlib
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from preprocessing import ENGLISH_STOPWORDS
+from records import Comment
+
+try:
+    import sentence_transformers
+except ImportError:  # sentence-transformers is optional; fall back to hashed TF-IDF-style vectors
+    sentence_transformers = None
+
+_TOKEN = re.compile(r"[a-z0-9']{2,}")
+
+
+def tokenize(text: str) -> List[str]:
+    """Lower-cased words of text, English stopwords removed."""
+    return [token for token in _TOKEN.findall(text.lower()) if token not in ENGLISH_STOPWORDS]
+
+
+class HashingEmbedder:
+    """
+    Dependency-free embedder: word unigrams and bigrams hashed into a fixed
+    number of signed buckets, sublinear term frequency, L2-normalized. Needs
+    no fitting, so vectors stay comparable across runs and can be persisted.
+    """
+
+    def __init__(self, dim: int = 1024):
+        self.dim = dim
+
+    def embed(self, texts: Sequence[str]) -> np.ndarray:
+        vectors = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            words = tokenize(text)
+            terms = Counter(words + [f"{a} {b}" for a, b in zip(words, words[1:])])
+            for term, count in terms.items():
+                bucket = zlib.crc32(term.encode("utf-8"))
+                sign = 1.0 if bucket & 0x80000000 else -1.0
+                vectors[row, bucket % self.dim] += sign * (1.0 + np.log(count))
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.maximum(norms, 1e-12)
+
+
+class SentenceTransformerEmbedder:
+    """Local CPU sentence-embedding model (requires sentence-transformers)."""
+
+    def __init__(self, model_name: str = "all-MiniLM-L6-v2", batch_size: int = 64):
+        if sentence_transformers is None:
+            raise ImportError("sentence-transformers is not installed")
+        self.model = sentence_transformers.SentenceTransformer(model_name, device="cpu")
+        self.dim = self.model.get_sentence_embedding_dimension()
+        self.batch_size = batch_size
+
+    def embed(self, texts: Sequence[str]) -> np.ndarray:
+        vectors = self.model.encode(list(texts), batch_size=self.batch_size,
+                                    normalize_embeddings=True, show_progress_bar=False)
+        return np.asarray(vectors, dtype=np.float32)
+
+
+def default_embedder():
+    """The local model if sentence-transformers is installed, else hashing."""
+    if sentence_transformers is not None:
+        try:
+            return SentenceTransformerEmbedder()
+        except Exception as e:
+            print(f"Falling back to hashing embedder: {e}")
+    return HashingEmbedder()
+
+
+class VectorIndex:
+    """
+    Append-only store of L2-normalized vectors keyed by comment id.
+
+    With a path, vectors live in a raw float32 file that is memory-mapped on
+    read (ids in a "<path>.ids" sidecar), so comments are embedded once and the
+    index can grow past available RAM. Without a path it is an in-memory cache
+    of at most max_memory vectors: when full, the oldest half is dropped, so a
+    long-running process does not grow without bound.
+    """
+
+    def __init__(self, dim: int, path: Optional[str] = None, max_memory: Optional[int] = 100_000):
+        self.dim = dim
+        self.path = path
+        self.max_memory = max_memory
+        self._lock = threading.Lock()
+        self._ids: List[str] = []
+        # Rows past len(self._ids) are spare capacity, so appends are amortized O(1)
+        self._memory = np.empty((0, dim), dtype=np.float32)
+        if path is not None and os.path.exists(path):
+            with open(f"{path}.ids", encoding="utf-8") as f:
+                self._ids = f.read().split("\n")[:-1]
+            if os.path.getsize(path) != len(self._ids) * dim * 4:
+                raise ValueError(f"{path} does not hold {len(self._ids)} vectors of dim {dim}")
+        self._positions: Dict[str, int] = {id_: i for i, id_ in enumerate(self._ids)}
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def __contains__(self, id_: str) -> bool:
+        return id_ in self._positions
+
+    def add(self, ids: Sequence[str], vectors: np.ndarray) -> int:
+        """Append vectors for ids not already indexed. Returns how many were added."""
+        with self._lock:
+            keep = [i for i, id_ in enumerate(ids) if id_ not in self._positions]
+            if not keep:
+                return 0
+            new_ids = [ids[i] for i in keep]
+            new_vectors = np.ascontiguousarray(vectors[keep], dtype=np.float32)
+            if self.path is None:
+                self._append_memory(new_ids, new_vectors)
+                return len(new_ids)
+            with open(self.path, "ab") as f:
+                f.write(new_vectors.tobytes())
+            with open(f"{self.path}.ids", "a", encoding="utf-8") as f:
+                f.write("".join(f"{id_}\n" for id_ in new_ids))
+            for id_ in new_ids:
+                self._positions[id_] = len(self._ids)
+                self._ids.append(id_)
+            return len(new_ids)
+
+    def _append_memory(self, ids: List[str], vectors: np.ndarray) -> None:
+        size = len(self._ids)
+        drop = 0
+        if self.max_memory is not None and size + len(ids) > self.max_memory:
+            drop = min(size, size + len(ids) - self.max_memory // 2)
+        needed = size - drop + len(ids)
+        if drop or needed > len(self._memory):
+            # A fresh buffer, so views handed out by vectors() stay valid
+            memory = np.empty((max(needed, 2 * len(self._memory)), self.dim), dtype=np.float32)
+            memory[:size - drop] = self._memory[drop:size]
+            self._memory = memory
+        if drop:
+            self._ids = self._ids[drop:]
+            self._positions = {id_: i for i, id_ in enumerate(self._ids)}
+        self._memory[len(self._ids):needed] = vectors
+        for id_ in ids:
+            self._positions[id_] = len(self._ids)
+            self._ids.append(id_)
+
+    def vectors(self) -> np.ndarray:
+        """All vectors, in insertion order (a read-only memmap when file-backed)."""
+        if self.path is None:
+            return self._memory[:len(self._ids)]
+        if not self._ids:
+            return np.empty((0, self.dim), dtype=np.float32)
+        return np.memmap(self.path, dtype=np.float32, mode="r", shape=(len(self._ids), self.dim))
+
+    def get(self, ids: Sequence[str]) -> np.ndarray:
+        with self._lock:
+            positions = [self._positions[id_] for id_ in ids]
+            return np.asarray(self.vectors()[positions])
+
+    def lookup(self, ids: Sequence[str]) -> Dict[str, np.ndarray]:
+        """Vectors of those ids that are indexed, read in one go (an eviction cannot split it)."""
+        with self._lock:
+            found = [id_ for id_ in ids if id_ in self._positions]
+            rows = np.asarray(self.vectors()[[self._positions[id_] for id_ in found]])
+        return dict(zip(found, rows))
+
+    def search(self, query: np.ndarray, k: int = 10,
+               block_size: int = 65536) -> List[Tuple[str, float]]:
+        """The k most similar ids by cosine similarity, best first."""
+        with self._lock:
+            vectors, ids = self.vectors(), self._ids
+        scores = np.concatenate([vectors[i:i + block_size] @ query
+                                 for i in range(0, len(vectors), block_size)] or [np.empty(0)])
+        top = np.argsort(-scores)[:k]
+        return [(ids[i], float(scores[i])) for i in top]
+
+
+def _assign(vectors: np.ndarray, centroids: np.ndarray,
+            block_size: int) -> Tuple[np.ndarray, np.ndarray]:
+    labels = np.empty(len(vectors), dtype=np.int64)
+    similarity = np.empty(len(vectors), dtype=np.float32)
+    for start in range(0, len(vectors), block_size):
+        scores = vectors[start:start + block_size] @ centroids.T
+        labels[start:start + block_size] = scores.argmax(axis=1)
+        similarity[start:start + block_size] = scores.max(axis=1)
+    return labels, similarity
+
+
+def kmeans(vectors: np.ndarray,
+           k: int,
+           iterations: int = 25,
+           seed: int = 0,
+           weights: Optional[np.ndarray] = None,
+           block_size: int = 8192) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Spherical k-means (cosine similarity) over normalized vectors with
+    k-means++ seeding. Assignment is done in blocks so memory stays bounded
+    for memory-mapped inputs. Returns (centroids, labels).
+    """
+    n = len(vectors)
+    k = max(1, min(k, n))
+    rng = np.random.default_rng(seed)
+    weights = np.ones(n, dtype=np.float32) if weights is None else weights.astype(np.float32)
+
+    centroids = np.empty((k, vectors.shape[1]), dtype=np.float32)
+    centroids[0] = vectors[rng.choice(n, p=weights / weights.sum())]
+    closest = np.full(n, np.inf, dtype=np.float32)
+    for c in range(1, k):
+        _, similarity = _assign(vectors, centroids[c - 1:c], block_size)
+        closest = np.minimum(closest, np.maximum(1.0 - similarity, 0.0))
+        spread = closest * weights
+        total = spread.sum()
+        index = rng.choice(n, p=spread / total) if total > 0 else rng.integers(n)
+        centroids[c] = vectors[index]
+
+    labels = np.full(n, -1, dtype=np.int64)
+    for _ in range(iterations):
+        new_labels, _ = _assign(vectors, centroids, block_size)
+        if np.array_equal(new_labels, labels):
+            break
+        labels = new_labels
+        for c in range(k):
+            members = labels == c
+            if members.any():
+                centroid = (np.asarray(vectors[members]) * weights[members, None]).sum(axis=0)
+                centroids[c] = centroid / max(float(np.linalg.norm(centroid)), 1e-12)
+    return centroids, labels
+
+
+@dataclass
+class SemanticCluster:
+    """One topic: how many comments it covers, its top terms and exemplars."""
+    size: int
+    keywords: List[str] = field(default_factory=list)
+    exemplars: List[str] = field(default_factory=list)
+    members: List[int] = field(default_factory=list)
+
+
+class SemanticClusterer:
+    """
+    Groups comments by meaning so the analyzer sees cluster summaries and a few
+    exemplars instead of every comment: the prompt size depends on max_clusters
+    and exemplars, not on how many comments were scraped.
+
+    Vectors are cached in the index by comment id, so comments already seen in
+    earlier runs are not embedded again.
+    """
+
+    def __init__(self,
+                 embedder=None,
+                 index: Optional[VectorIndex] = None,
+                 max_clusters: int = 40,
+                 exemplars: int = 3,
+                 keywords: int = 5,
+                 exemplar_chars: int = 500,
+                 seed: int = 0):
+        self.embedder = embedder or default_embedder()
+        self.index = index or VectorIndex(self.embedder.dim)
+        if self.index.dim != self.embedder.dim:
+            raise ValueError("index and embedder dimensions differ")
+        self.max_clusters = max_clusters
+        self.exemplars = exemplars
+        self.keywords = keywords
+        self.exemplar_chars = exemplar_chars
+        self.seed = seed
+
+    def embed(self, comments: Sequence[Comment]) -> np.ndarray:
+        if not comments:
+            return np.empty((0, self.index.dim), dtype=np.float32)
+        vectors = self.index.lookup([comment.id for comment in comments])
+        missing = {comment.id: comment.body for comment in comments if comment.id not in vectors}
+        if missing:
+            embedded = self.embedder.embed(list(missing.values()))
+            vectors.update(zip(missing, embedded))
+            self.index.add(list(missing), embedded)
+        return np.stack([vectors[comment.id] for comment in comments])
+
+    def _keywords(self, texts: Sequence[str], members: np.ndarray, overall: Counter) -> List[str]:
+        inside = Counter(token for i in members for token in set(tokenize(texts[i])))
+        total = len(texts)
+        # Terms frequent in the cluster relative to the whole input
+        scored = sorted(inside, key=lambda t: (-inside[t] * np.log(1 + total / overall[t]), t))
+        return scored[:self.keywords]
+
+    def cluster(self,
+                comments: Sequence[Comment],
+                counts: Optional[Sequence[int]] = None) -> List[SemanticCluster]:
+        """Clusters ordered by size; counts weights each comment (e.g. near-duplicates)."""
+        if not comments:
+            return []
+        weights = np.asarray(counts if counts else [1] * len(comments), dtype=np.float32)
+        vectors = self.embed(comments)
+        k = min(self.max_clusters, max(1, int(round(np.sqrt(len(comments) / 2)))))
+        centroids, labels = kmeans(vectors, k, seed=self.seed, weights=weights)
+
+        texts = [comment.body for comment in comments]
+        overall = Counter(token for text in texts for token in set(tokenize(text)))
+        similarity = np.einsum("ij,ij->i", vectors, centroids[labels])
+        clusters = []
+        for c in range(len(centroids)):
+            members = np.flatnonzero(labels == c)
+            if not len(members):
+                continue
+            closest = members[np.argsort(-similarity[members])][:self.exemplars]
+            clusters.append(SemanticCluster(
+                size=int(weights[members].sum()),
+                keywords=self._keywords(texts, members, overall),
+                exemplars=[texts[i][:self.exemplar_chars] for i in closest],
+                members=members.tolist()
+            ))
+        return sorted(clusters, key=lambda cluster: (-cluster.size, cluster.members[0]))
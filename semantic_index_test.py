@@ -0,0 +1,74 @@
+import numpy as np
+
+from records import Comment
+from semantic_index import HashingEmbedder, SemanticClusterer, VectorIndex, kmeans
+
+TOPICS = [
+    "battery drains overnight after the firmware update, battery life is terrible",
+    "app crashes on launch with a login error, crashes every single launch",
+    "refund request ignored by customer support, support never replies about refund",
+]
+
+
+def make_comments(n: int) -> list:
+    return [Comment(f"c{i}", "s1", "test", f"{TOPICS[i % 3]} variant {i}", "user", 1, 0.0)
+            for i in range(n)]
+
+
+def test_vector_index_persists_through_memmap(tmp_path):
+    path = str(tmp_path / "comments.vec")
+    embedder = HashingEmbedder(dim=64)
+    index = VectorIndex(64, path)
+    assert index.add(["a", "b"], embedder.embed(["battery drains", "app crashes"])) == 2
+    assert index.add(["a", "c"], embedder.embed(["ignored", "refund ignored"])) == 1
+
+    reopened = VectorIndex(64, path)
+    assert len(reopened) == 3
+    assert isinstance(reopened.vectors(), np.memmap)
+    np.testing.assert_allclose(reopened.get(["c"]), index.get(["c"]))
+    assert reopened.search(embedder.embed(["app crashes"])[0], k=1)[0][0] == "b"
+
+
+def test_in_memory_index_drops_its_oldest_half_when_full():
+    embedder = HashingEmbedder(dim=16)
+    index = VectorIndex(16, max_memory=10)
+    for i in range(25):
+        index.add([f"c{i}"], embedder.embed([f"comment {i}"]))
+        assert len(index) <= 10
+
+    assert "c0" not in index and "c24" in index
+    np.testing.assert_allclose(index.get(["c24"]), embedder.embed(["comment 24"]))
+    assert index.search(embedder.embed(["comment 20"])[0], k=1)[0][0] == "c20"
+
+
+def test_clusterer_embeds_batches_larger_than_its_index():
+    comments = make_comments(30)
+    clusterer = SemanticClusterer(index=VectorIndex(HashingEmbedder().dim, max_memory=8))
+
+    vectors = clusterer.embed(comments)
+
+    assert vectors.shape == (30, HashingEmbedder().dim)
+    np.testing.assert_allclose(vectors, HashingEmbedder().embed([c.body for c in comments]))
+    np.testing.assert_allclose(clusterer.embed(comments), vectors)
+
+
+def test_kmeans_separates_topics():
+    vectors = HashingEmbedder().embed([comment.body for comment in make_comments(30)])
+    _, labels = kmeans(vectors, 3)
+    assert [len(set(labels[i::3])) for i in range(3)] == [1, 1, 1]
+    assert len(set(labels)) == 3
+
+
+def test_clusterer_reports_sizes_keywords_and_exemplars():
+    comments = make_comments(60)
+    counts = [4 if i % 3 == 0 else 1 for i in range(60)]
+    clusterer = SemanticClusterer(HashingEmbedder(), max_clusters=3, exemplars=2)
+
+    clusters = clusterer.cluster(comments, counts)
+
+    assert [cluster.size for cluster in clusters] == [80, 20, 20]
+    assert "battery" in clusters[0].keywords
+    assert len(clusters[0].exemplars) == 2
+    assert all("battery" in exemplar for exemplar in clusters[0].exemplars)
+    # Vectors are cached by comment id
+    assert len(clusterer.index) == 60
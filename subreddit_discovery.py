@@ -0,0 +1,221 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+
+class SubredditCache:
+    """
+    SQLite cache of subreddit search results, metadata and related-subreddit
+    edges. Entries older than ttl seconds count as misses; missing or private
+    subreddits are cached too, so they are not looked up on every run.
+    """
+
+    def __init__(self,
+                 path: str = ":memory:",
+                 ttl: float = 24 * 3600,
+                 clock: Callable[[], float] = time.time):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.ttl = ttl
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        if path != ":memory:":
+            self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS searches (
+                query TEXT NOT NULL,
+                result_limit INTEGER NOT NULL,
+                names TEXT NOT NULL,
+                fetched_utc REAL NOT NULL,
+                PRIMARY KEY (query, result_limit)
+            );
+            CREATE TABLE IF NOT EXISTS subreddits (
+                name TEXT PRIMARY KEY,
+                record TEXT,
+                fetched_utc REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS edges (
+                source TEXT PRIMARY KEY,
+                targets TEXT NOT NULL,
+                fetched_utc REAL NOT NULL
+            );
+            """
+        )
+        self._conn.commit()
+
+    def _cutoff(self) -> float:
+        return self._clock() - self.ttl
+
+    def get_search(self, query: str, limit: int) -> Optional[List[str]]:
+        """Subreddit names a fresh search for query returned, or None."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT names FROM searches WHERE query = ? AND result_limit = ? AND fetched_utc > ?",
+                (query.lower(), limit, self._cutoff())
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def set_search(self, query: str, limit: int, names: Sequence[str]) -> None:
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO searches (query, result_limit, names, fetched_utc) "
+                "VALUES (?, ?, ?, ?)",
+                (query.lower(), limit, json.dumps(list(names)), self._clock())
+            )
+            self._conn.commit()
+
+    def get_subreddits(self, names: Iterable[str]) -> Dict[str, Optional[Dict]]:
+        """Fresh metadata by lowercased name; None marks a subreddit known to be unavailable."""
+        keys = list({name.lower() for name in names})
+        found: Dict[str, Optional[Dict]] = {}
+        with self._lock:
+            # Stay under SQLite's bound-parameter limit
+            for start in range(0, len(keys), 500):
+                chunk = keys[start:start + 500]
+                rows = self._conn.execute(
+                    f"SELECT name, record FROM subreddits WHERE fetched_utc > ? "
+                    f"AND name IN ({', '.join('?' * len(chunk))})",
+                    [self._cutoff(), *chunk]
+                ).fetchall()
+                found.update((name, json.loads(record) if record else None) for name, record in rows)
+        return found
+
+    def set_subreddits(self, records: Dict[str, Optional[Dict]]) -> None:
+        now = self._clock()
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO subreddits (name, record, fetched_utc) VALUES (?, ?, ?)",
+                [(name.lower(), json.dumps(record) if record else None, now)
+                 for name, record in records.items()]
+            )
+            self._conn.commit()
+
+    def get_related(self, name: str) -> Optional[List[str]]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT targets FROM edges WHERE source = ? AND fetched_utc > ?",
+                (name.lower(), self._cutoff())
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def set_related(self, name: str, targets: Sequence[str]) -> None:
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO edges (source, targets, fetched_utc) VALUES (?, ?, ?)",
+                (name.lower(), json.dumps(list(targets)), self._clock())
+            )
+            self._conn.commit()
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+class SubredditDiscovery:
+    """
+    Finds subreddits for a set of search terms, then expands breadth-first
+    through related-subreddit links (sidebar and wiki /r/ mentions).
+
+    Expansion stops after max_depth hops or once budget subreddits have been
+    looked up. Search results carry no related links, so expanding them counts
+    too: at most half the budget goes to the best-ranked results, the rest to
+    the subreddits they lead to. Lookups within a level run concurrently on
+    max_workers threads (requests still go through the scraper's scheduler),
+    and everything is cached, so warm runs make no Reddit requests at all.
+    """
+
+    def __init__(self,
+                 scraper,
+                 cache: Optional[SubredditCache] = None,
+                 max_depth: int = 1,
+                 budget: int = 25,
+                 max_workers: int = 8):
+        self.scraper = scraper
+        self.cache = cache or SubredditCache()
+        self.max_depth = max_depth
+        self.budget = budget
+        self.max_workers = max_workers
+
+    def _map(self, func: Callable, items: Sequence) -> List:
+        if len(items) <= 1 or self.max_workers <= 1:
+            return [func(item) for item in items]
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(items))) as executor:
+            return list(executor.map(func, items))
+
+    def search(self, term: str, limit: int = 25) -> List[Dict]:
+        """search_subreddits for one term, served from the cache when fresh."""
+        names = self.cache.get_search(term, limit)
+        if names is not None:
+            cached = self.cache.get_subreddits(names)
+            if all(name.lower() in cached for name in names):
+                return [cached[name.lower()] for name in names if cached[name.lower()] is not None]
+        try:
+            results = self.scraper.search_subreddits(term, limit=limit)
+        except Exception as e:
+            print(f"Error searching subreddits for '{term}': {e}")
+            return []
+        self.cache.set_subreddits({record['name']: record for record in results})
+        self.cache.set_search(term, limit, [record['name'] for record in results])
+        return results
+
+    def _info(self, name: str) -> Tuple[Optional[Dict], List[str]]:
+        """Metadata and related names for one subreddit, cached."""
+        cached = self.cache.get_subreddits([name]).get(name.lower(), False)
+        related = self.cache.get_related(name)
+        if cached is not False and related is not None:
+            return cached, related
+        info = self.scraper.get_subreddit_info(name)
+        related = info.pop('related', []) if info else []
+        self.cache.set_subreddits({name: info})
+        self.cache.set_related(name, related)
+        return info, related
+
+    def expand(self, seeds: List[Dict]) -> List[Dict]:
+        """
+        seeds followed by subreddits reached through related links, in
+        breadth-first order. Expanded records note the 'depth' and the
+        subreddit they were found 'via'.
+        """
+        found = list(seeds)
+        seen = {seed['name'].lower() for seed in seeds}
+        # Seeds are in search rank order; each costs a lookup (about + wiki)
+        frontier = [seed['name'] for seed in seeds[:max(self.budget // 2, 1)]]
+        looked_up = len(frontier)
+        for depth in range(1, self.max_depth + 1):
+            if not frontier or looked_up >= self.budget:
+                break
+            # Fetching a subreddit yields its related links as well
+            edges = [related for _, related in self._map(self._info, frontier)]
+            candidates: List[Tuple[str, str]] = []
+            for source, targets in zip(frontier, edges):
+                for target in targets:
+                    if target.lower() not in seen:
+                        seen.add(target.lower())
+                        candidates.append((target, source))
+            candidates = candidates[:self.budget - looked_up]
+            looked_up += len(candidates)
+            infos = self._map(self._info, [name for name, _ in candidates])
+            frontier = []
+            for (name, source), (record, _) in zip(candidates, infos):
+                if record is not None:
+                    found.append({**record, 'depth': depth, 'via': source})
+                    frontier.append(record['name'])
+        return found
+
+    def discover(self, terms: Sequence[str], limit: int = 25) -> List[Dict]:
+        """Search all terms concurrently, merge the results, then expand them."""
+        seeds: List[Dict] = []
+        seen = set()
+        for results in self._map(lambda term: self.search(term, limit), list(terms)):
+            for record in results:
+                if record['name'].lower() not in seen:
+                    seen.add(record['name'].lower())
+                    seeds.append(record)
+        return self.expand(seeds)
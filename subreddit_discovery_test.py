@@ -0,0 +1,87 @@
+from typing import Dict, List, Optional
+
+from subreddit_discovery import SubredditCache, SubredditDiscovery
+
+GRAPH = {
+    "deals": ["frugal", "coupons"],
+    "bargains": ["deals", "frugal"],
+    "frugal": ["personalfinance", "zerowaste"],
+    "coupons": ["frugal"],
+    "personalfinance": ["investing"],
+    "zerowaste": [],
+    "investing": [],
+}
+
+
+def record(name: str) -> Dict:
+    return {"name": name, "title": name.title(), "description": f"All about {name}",
+            "subscribers": 1000, "created_utc": 0.0, "over18": False,
+            "url": f"https://reddit.com/r/{name}/"}
+
+
+class FakeScraper:
+    def __init__(self) -> None:
+        self.calls: List[str] = []
+
+    def search_subreddits(self, query: str, limit: int = 25) -> List[Dict]:
+        self.calls.append(f"search:{query}")
+        return [record(name) for name in ("deals", "bargains") if query in ("deal", "bargain")][:limit]
+
+    def get_subreddit_info(self, name: str) -> Optional[Dict]:
+        self.calls.append(f"info:{name}")
+        if name not in GRAPH:
+            return None
+        return {**record(name), "related": GRAPH[name] + ["private_sub"]}
+
+
+def test_discovery_expands_breadth_first_within_depth():
+    scraper = FakeScraper()
+    discovery = SubredditDiscovery(scraper, max_depth=2, budget=10)
+
+    found = discovery.discover(["deal", "bargain"])
+
+    assert [sub["name"] for sub in found] == [
+        "deals", "bargains", "frugal", "coupons", "personalfinance", "zerowaste"]
+    assert found[2]["depth"] == 1 and found[2]["via"] == "deals"
+    assert found[4]["depth"] == 2 and found[4]["via"] == "frugal"
+    # investing is three hops away; private_sub could not be loaded
+    assert all(sub["name"] not in ("investing", "private_sub") for sub in found)
+
+
+def test_discovery_budget_bounds_lookups():
+    scraper = FakeScraper()
+    found = SubredditDiscovery(scraper, max_depth=3, budget=4, max_workers=1).discover(["deal"])
+
+    assert [sub["name"] for sub in found] == ["deals", "bargains", "frugal", "coupons"]
+    # Expanding the search results counts against the budget too
+    assert scraper.calls == ["search:deal", "info:deals", "info:bargains", "info:frugal", "info:coupons"]
+
+
+def test_only_the_best_ranked_search_results_are_expanded():
+    scraper = FakeScraper()
+    seeds = [record(name) for name in ("deals", "bargains", "coupons", "frugal", "zerowaste")]
+    found = SubredditDiscovery(scraper, max_depth=2, budget=4, max_workers=1).expand(seeds)
+
+    # Half the budget expands the top two seeds, the rest looks up what they link to
+    assert scraper.calls == ["info:deals", "info:bargains", "info:private_sub"]
+    assert [sub["name"] for sub in found] == [
+        "deals", "bargains", "coupons", "frugal", "zerowaste"]
+
+
+def test_warm_runs_are_served_from_cache_until_ttl(tmp_path):
+    now = [1000.0]
+    cache = SubredditCache(str(tmp_path / "subreddits.db"), ttl=60, clock=lambda: now[0])
+    scraper = FakeScraper()
+    discovery = SubredditDiscovery(scraper, cache, max_depth=2, budget=10)
+    cold = discovery.discover(["deal", "bargain"])
+    cold_calls = len(scraper.calls)
+
+    # A new cache on the same file, as in a later process
+    reopened = SubredditCache(str(tmp_path / "subreddits.db"), ttl=60, clock=lambda: now[0])
+    assert SubredditDiscovery(scraper, reopened, max_depth=2, budget=10).discover(
+        ["deal", "bargain"]) == cold
+    assert len(scraper.calls) == cold_calls
+
+    now[0] += 61
+    discovery.discover(["deal", "bargain"])
+    assert len(scraper.calls) == 2 * cold_calls
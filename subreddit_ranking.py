@@ -0,0 +1,97 @@
+from collections import Counter
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+from semantic_index import HashingEmbedder, tokenize
+
+# Words ending like these are rarely plurals ("class", "bus", "analysis"), and
+# these are not plurals of their stems
+_NOT_PLURAL_ENDINGS = ("ss", "us", "is")
+_INVARIANT = frozenset({"news", "series", "species", "means"})
+
+
+def _fold_plurals(documents: Sequence[List[str]]) -> List[List[str]]:
+    """Fold plurals onto their singular ("deals" -> "deal") where the singular occurs too."""
+    vocabulary = {word for words in documents for word in words}
+
+    def fold(word: str) -> str:
+        if (word.endswith("s") and not word.endswith(_NOT_PLURAL_ENDINGS)
+                and word not in _INVARIANT and word[:-1] in vocabulary):
+            return word[:-1]
+        return word
+
+    return [[fold(word) for word in words] for words in documents]
+
+
+def _document(subreddit: Dict) -> str:
+    return f"{subreddit['name']} {subreddit.get('title') or ''} {subreddit.get('description') or ''}"
+
+
+class SubredditRanker:
+    """
+    Scores candidate subreddits against a topic locally, so only the top_k
+    best reach the LLM. The score is BM25 over name, title and description,
+    plus hashed-embedding cosine similarity (which also rewards matching word
+    pairs), a log-scaled subscriber bonus and a penalty for NSFW communities.
+    Each feature is scaled to [0, 1] before weighting.
+    """
+
+    def __init__(self,
+                 top_k: Optional[int] = 30,
+                 k1: float = 1.2,
+                 b: float = 0.75,
+                 embedding_weight: float = 0.5,
+                 subscriber_weight: float = 0.2,
+                 over18_penalty: float = 0.5,
+                 embedder: Optional[HashingEmbedder] = None):
+        self.top_k = top_k
+        self.k1 = k1
+        self.b = b
+        self.embedding_weight = embedding_weight
+        self.subscriber_weight = subscriber_weight
+        self.over18_penalty = over18_penalty
+        self.embedder = embedder or HashingEmbedder()
+
+    def _bm25(self, topic: str, documents: Sequence[str]) -> np.ndarray:
+        # So "deal" matches "deals"
+        terms = _fold_plurals([tokenize(topic)] + [tokenize(document) for document in documents])
+        query = sorted(set(terms[0]))
+        counts = [Counter(words) for words in terms[1:]]
+        if not query:
+            return np.zeros(len(documents))
+        # Only the query's terms matter: a documents x query-terms frequency matrix
+        tf = np.array([[count[term] for term in query] for count in counts], dtype=np.float64)
+        lengths = np.array([sum(count.values()) for count in counts], dtype=np.float64)
+        df = (tf > 0).sum(axis=0)
+        idf = np.log(1.0 + (len(documents) - df + 0.5) / (df + 0.5))
+        norm = self.k1 * (1.0 - self.b + self.b * lengths / max(lengths.mean(), 1.0))
+        return (idf * tf * (self.k1 + 1.0) / (tf + norm[:, None])).sum(axis=1)
+
+    def scores(self, topic: str, subreddits: Sequence[Dict]) -> np.ndarray:
+        """Relevance of each subreddit to topic, higher is better."""
+        if not subreddits:
+            return np.zeros(0)
+        documents = [_document(subreddit) for subreddit in subreddits]
+        bm25 = self._bm25(topic, documents)
+        bm25 /= max(bm25.max(), 1e-12)
+        vectors = self.embedder.embed(documents)
+        similarity = np.clip(vectors @ self.embedder.embed([topic])[0], 0.0, None)
+        subscribers = np.log1p(np.array([max(s.get('subscribers') or 0, 0) for s in subreddits],
+                                        dtype=np.float64))
+        subscribers /= max(subscribers.max(), 1e-12)
+        over18 = np.array([bool(s.get('over18')) for s in subreddits], dtype=np.float64)
+        return (bm25 + self.embedding_weight * similarity
+                + self.subscriber_weight * subscribers - self.over18_penalty * over18)
+
+    def rank(self, topic: str, subreddits: Sequence[Dict]) -> List[Dict]:
+        """
+        The top_k subreddits (all of them if top_k is None), best first, each
+        with its 'relevance' score.
+        """
+        scores = self.scores(topic, subreddits)
+        order = np.argsort(-scores, kind="stable")
+        if self.top_k is not None:
+            order = order[:self.top_k]
+        return [{**subreddits[i], 'relevance': round(float(scores[i]), 4)} for i in order]
+
@@ -0,0 +1,54 @@
+from subreddit_ranking import SubredditRanker, _fold_plurals
+
+
+def sub(name: str, title: str, description: str, subscribers: int = 1000, over18: bool = False):
+    return {"name": name, "title": title, "description": description,
+            "subscribers": subscribers, "over18": over18}
+
+
+CANDIDATES = [
+    sub("gaming", "Gaming", "Video games and gaming news", 30_000_000),
+    sub("deals", "Deals", "The best deals and discounts online", 500_000),
+    sub("frugal", "Frugal", "Living well on less, finding bargain deals", 2_000_000),
+    sub("dealsnsfw", "Deals NSFW", "Adult deals and discounts", 50_000, over18=True),
+    sub("knitting", "Knitting", "Yarn, patterns and needles", 800_000),
+    sub("gamedeals", "Game Deals", "Deals on video games and discounts", 1_000_000),
+]
+
+
+def test_rank_puts_topic_matches_first_and_cuts_to_top_k():
+    ranked = SubredditRanker(top_k=3).rank("bargain deals and discounts", CANDIDATES)
+
+    assert len(ranked) == 3
+    assert {s["name"] for s in ranked} == {"deals", "frugal", "gamedeals"}
+    assert ranked[0]["relevance"] >= ranked[1]["relevance"] >= ranked[2]["relevance"]
+    # Ranking returns copies
+    assert "relevance" not in CANDIDATES[1]
+
+
+def test_over18_penalty_and_subscriber_bonus():
+    ranker = SubredditRanker(top_k=None)
+    names = [s["name"] for s in ranker.rank("deals and discounts", CANDIDATES)]
+    assert names.index("dealsnsfw") > names.index("deals")
+    assert names[-1] == "knitting"
+
+    twins = [sub("small", "Deals", "Deals"), sub("big", "Deals", "Deals", subscribers=10**6)]
+    assert [s["name"] for s in ranker.rank("deals", twins)] == ["big", "small"]
+
+
+def test_rank_handles_empty_inputs():
+    ranker = SubredditRanker(top_k=2)
+    assert ranker.rank("deals", []) == []
+    assert len(ranker.rank("", CANDIDATES)) == 2
+
+
+def test_plurals_fold_only_onto_singulars_that_occur():
+    folded = _fold_plurals([["deals", "news", "bus", "buses", "glass"],
+                            ["deal", "new", "bu", "glas"]])
+    assert folded[0] == ["deal", "news", "bus", "buses", "glass"]
+
+    ranked = SubredditRanker(top_k=1).rank("local news", [
+        sub("newproducts", "New Products", "Brand new gadgets, new every day"),
+        sub("localnews", "Local News", "News from your city"),
+    ])
+    assert ranked[0]["name"] == "localnews"